@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+@file fake_jlink.py
+
+@brief Stand-in for J-Link Commander ('JLinkExe'/'JLink.exe') - for testing the programming tools without hardware.
+Accepts the same command-line options as JLinkExe, and runs commands either from a command file
+(given as last argument, or via '-CommanderScript') or interactively from STDIN (w. 'J-Link>' prompt).
+Flash is modelled by 'progemu.ProgMem' - in memory only (lost when process exits), or persistent if backed by file.
+Other addresses (e.g. SRAM) are kept in a dictionary.
+
+Use e.g. 'fwprog.JLINK_EXE_FILE = "FW_prog/fake_jlink.py"' (POSIX) to run the tools against it.
+
+Timing and target behaviour is set by environment variables (inherited from the tool that starts J-Link):
+  FAKE_JLINK_CONNECT_DELAY          - seconds for USB + target connect (default: 0)
+  FAKE_JLINK_ERASE_DELAY            - seconds for mass erase (default: 0)
+  FAKE_JLINK_PROG_DELAY_PER_KB      - seconds per KB for 'loadfile'/'loadbin' (default: 0)
+  FAKE_JLINK_VERIFY_DELAY_PER_KB    - seconds per KB for 'verifybin' (default: 0)
+  FAKE_JLINK_FLASH_SIZE_KB          - Flash size in KB (default: 256)
+  FAKE_JLINK_FLASH_FILE             - Flash image file - '{probe}' is replaced by probe serial number (default: none)
+  FAKE_JLINK_FRAM_DONE_PC           - address of FRAM-erase app's final idle loop (hex, default: none)
+  FAKE_JLINK_FRAM_ERASE_TIME        - seconds after 'g' until FRAM-erase app is finished (default: -1 = never):
+                                      then 'h' shows PC in idle loop, and R0-R12 point to its PASS flag
+"""
+
+import os
+import sys
+import time
+
+# Flash model from 'srec_utils' (script-style imports there):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'srec_utils'))
+from progemu import ProgMem
+from srecutils import iter_srec_file
+
+
+JLINK_PROMPT = "J-Link>"
+FRAM_ERASE_FLAG_ADDR = 0x20000000      # Finished FRAM-erase app: all registers point here - flag bytes read as PASS
+
+# Simulated target - options that can be given on command line (e.g. '-device MKL27Z256XXX4'):
+target_options = {'-device': 'Unspecified', '-if': 'SWD', '-speed': '4000', '-autoconnect': '0',
+                  '-selectemubysn': None, '-commanderscript': None}
+
+# Simulated timing/behaviour - see module doc:
+fake_options = {'connect_delay': float(os.environ.get('FAKE_JLINK_CONNECT_DELAY', 0)),
+                'erase_delay': float(os.environ.get('FAKE_JLINK_ERASE_DELAY', 0)),
+                'prog_delay_per_kb': float(os.environ.get('FAKE_JLINK_PROG_DELAY_PER_KB', 0)),
+                'verify_delay_per_kb': float(os.environ.get('FAKE_JLINK_VERIFY_DELAY_PER_KB', 0)),
+                'flash_size_kb': int(os.environ.get('FAKE_JLINK_FLASH_SIZE_KB', 256)),
+                'flash_file': os.environ.get('FAKE_JLINK_FLASH_FILE'),
+                'fram_done_pc': int(os.environ.get('FAKE_JLINK_FRAM_DONE_PC', '-1'), 16),
+                'fram_erase_time': float(os.environ.get('FAKE_JLINK_FRAM_ERASE_TIME', -1))}
+
+target_flash = None     # ProgMem - Flash from address 0. Erased Flash reads as 0xFF.
+target_ram = {}         # Address --> byte, for all addresses outside Flash.
+target_pc = 0
+target_run_start = None     # Time of 1st 'g' after reset (target running since)
+
+
+def print_out(text):
+    print(text, flush=True)
+
+
+def mem_write(addr: int, data):
+    flash_len = max(0, min(len(data), target_flash.psize - addr))
+    if flash_len:
+        target_flash.progmem_write(addr, data[:flash_len])
+    for ofs in range(flash_len, len(data)):
+        target_ram[addr + ofs] = data[ofs]
+
+
+def mem_read(addr: int, length: int) -> bytes:
+    flash_len = max(0, min(length, target_flash.psize - addr))
+    data = bytes(target_flash.progmem_view(addr, flash_len)) if flash_len else b''
+    return data + bytes(target_ram.get(addr + ofs, 0xFF) for ofs in range(flash_len, length))
+
+
+def mem_read32(addr: int) -> int:
+    return int.from_bytes(mem_read(addr & ~0x3, 4), 'little')
+
+
+def print_halt():
+    """ 'h' output - a FRAM-erase app is finished once it has run for FAKE_JLINK_FRAM_ERASE_TIME. """
+    global target_pc
+    reg_value = 0
+    if fake_options['fram_done_pc'] >= 0 and target_run_start is not None and \
+            0 <= fake_options['fram_erase_time'] <= time.monotonic() - target_run_start:
+        target_pc = fake_options['fram_done_pc']
+        reg_value = FRAM_ERASE_FLAG_ADDR
+        mem_write(FRAM_ERASE_FLAG_ADDR, bytes([1]) * 8)
+    print_out(f"PC = {target_pc:08X}, CycleCnt = 00000000")
+    for first_reg in range(0, 12, 4):
+        print_out(", ".join(f"R{reg} = {reg_value:08X}" for reg in range(first_reg, first_reg + 4)))
+    print_out(f"R12= {reg_value:08X}")
+
+
+def delay_per_kb(num_bytes: int, delay: float):
+    if delay > 0:
+        time.sleep(delay * num_bytes / 1024)
+
+
+def run_cmd(cmd_line: str) -> bool:
+    """ Run one J-Link command - returns False when session shall end ('q'/'qc'/'exit'). """
+    global target_pc, target_run_start
+    #
+    args = cmd_line.replace(',', ' ').split()
+    if not args:
+        return True
+    cmd = args[0].lower()
+    if cmd in ('q', 'qc', 'exit'):
+        return False
+    elif cmd == 'r':
+        target_run_start = None
+        print_out("Reset delay: 0 ms")
+        print_out("Reset type NORMAL: Resets core & peripherals via SYSRESETREQ & VECTRESET bit.")
+    elif cmd in ('h', 'halt'):
+        print_halt()
+    elif cmd in ('g', 'go', 'rnh'):
+        if target_run_start is None or cmd == 'rnh':
+            target_run_start = time.monotonic()
+    elif cmd == 'unlock':
+        print_out("Unlocking device...O.K.")
+    elif cmd == 'erase':
+        print_out("Erasing device...")
+        target_flash.progmem_erase()
+        if fake_options['erase_delay'] > 0:
+            time.sleep(fake_options['erase_delay'])
+        print_out("Erasing done.")
+    elif cmd == 'loadfile':
+        print_out(f"Downloading file [{args[1]}]...")
+        num_bytes = 0
+        try:
+            for addr, data in iter_srec_file(args[1]):
+                mem_write(addr, data)
+                num_bytes += len(data)
+        except (OSError, ValueError):
+            print_out(f"ERROR: Could not open file {args[1]}")
+            return True
+        delay_per_kb(num_bytes, fake_options['prog_delay_per_kb'])
+        print_out("O.K.")
+    elif cmd == 'loadbin':
+        print_out(f"Downloading file [{args[1]}]...")
+        try:
+            with open(args[1], 'rb') as fp:
+                bin_data = fp.read()
+        except OSError:
+            print_out(f"ERROR: Could not open file {args[1]}")
+            return True
+        mem_write(int(args[2], 16), bin_data)
+        delay_per_kb(len(bin_data), fake_options['prog_delay_per_kb'])
+        print_out("O.K.")
+    elif cmd == 'verifybin':
+        print_out(f"Loading binary file {args[1]}")
+        try:
+            with open(args[1], 'rb') as fp:
+                bin_data = fp.read()
+        except OSError:
+            print_out(f"ERROR: Could not open file {args[1]}")
+            return True
+        addr = int(args[2], 16)
+        print_out(f"Reading {len(bin_data)} bytes data from target memory @ 0x{addr:08X}.")
+        delay_per_kb(len(bin_data), fake_options['verify_delay_per_kb'])
+        target_data = mem_read(addr, len(bin_data))
+        if target_data == bin_data:
+            print_out("Verify successful.")
+        else:
+            mismatch = next(ofs for ofs in range(len(bin_data)) if target_data[ofs] != bin_data[ofs])
+            print_out(f"Verify failed @ address 0x{addr + mismatch:08X}.")
+    elif cmd == 'w4':
+        addr, val = int(args[1], 16), int(args[2], 16)
+        print_out(f"Writing {val:08X} -> {addr:08X}")
+        mem_write(addr & ~0x3, val.to_bytes(4, 'little'))
+    elif cmd == 'mem32':
+        addr, num_words = int(args[1], 16), int(args[2], 16)
+        for idx in range(num_words):
+            word_addr = (addr & ~0x3) + idx * 4
+            print_out(f"{word_addr:08X} = {mem_read32(word_addr):08X} ")
+    elif cmd == 'setpc':
+        target_pc = int(args[1], 16)
+    elif cmd == 'sleep':
+        print_out(f"Sleep({args[1]})")
+        time.sleep(int(args[1]) / 1000)
+    else:
+        print_out("Unknown command. '?' for help.")
+    return True
+
+
+def open_flash():
+    global target_flash
+    flash_file = fake_options['flash_file']
+    if flash_file is not None:
+        flash_file = flash_file.replace('{probe}', str(target_options['-selectemubysn']))
+    target_flash = ProgMem(image_offset=0, pmem_size=fake_options['flash_size_kb'] * 1024, backing_file=flash_file)
+
+
+def main(argv):
+    # Options are given in pairs ('-device <name>' etc.) - a trailing single argument is the command file:
+    args = list(argv)
+    cmd_file = None
+    while args:
+        arg = args.pop(0)
+        if arg.lower() in target_options and args:
+            target_options[arg.lower()] = args.pop(0)
+        elif not arg.startswith('-'):
+            cmd_file = arg
+    if target_options['-commanderscript'] is not None:
+        cmd_file = target_options['-commanderscript']
+    #
+    print_out("SEGGER J-Link Commander (stand-in)")
+    print_out(f"Device \"{target_options['-device'].upper()}\" selected.")
+    print_out("Connecting to target via " + target_options['-if'] + " ...")
+    if fake_options['connect_delay'] > 0:
+        time.sleep(fake_options['connect_delay'])
+    print_out("Cortex-M0 identified.")
+    open_flash()
+    #
+    if cmd_file is not None:
+        try:
+            with open(cmd_file, 'r') as fp:
+                cmd_lines = fp.readlines()
+        except OSError:
+            print_out(f"Could not open J-Link Command File '{cmd_file}'")
+            return 1
+        print_out("J-Link Command File read successfully.")
+        for cmd_line in cmd_lines:
+            print_out(f"{JLINK_PROMPT}{cmd_line.strip()}")
+            if not run_cmd(cmd_line):
+                break
+    else:
+        while True:
+            sys.stdout.write(JLINK_PROMPT)
+            sys.stdout.flush()
+            cmd_line = sys.stdin.readline()
+            if not cmd_line or not run_cmd(cmd_line):
+                break
+    target_flash.progmem_close()
+    print_out("Script processing completed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
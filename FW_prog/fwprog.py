@@ -1,5 +1,14 @@
 import os
 import subprocess
+import sys
+import tempfile
+# Shared S-Record utilities (in 'srec_utils' package next to this tool's folder):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from srec_utils.image_patcher import get_word_patch, patch_srec_file
+from srec_utils.jlink_cmd_file import JLINK_CMD_FILE_DIR, get_tmp_cmd_file
+from srec_utils.jlink_session import JLINK_SESSION_TIMEOUT
+from srec_utils import jlink_session
+from srec_utils.prog_trace import tracer, traced
 
 
 # ******************** GLOBALS ***********************
@@ -35,9 +44,10 @@ POST_TASKS_CMD_FILE = "post_tasks.tmp.jlink"
 VERIFY_SERNUM_CMD_FILE = "verify_sernum.tmp.jlink"
 #
 DUMMY_TASKS_CMD_FILE = "dummy_read.tmp.jlink"
+# Firmware file types that can be patched w. serial number (per-board image):
+SREC_FILE_EXTENSIONS = ('.srec', '.s19', '.s28', '.s37', '.mot')
 
 
-# ******************* HELPERS ****************************
 def get_mcu_device_specifics(mcu_type: str=None):
     if mcu_type is None:
         return None
@@ -64,13 +74,17 @@ def run_jlink_cmd_file(cmd_file_name, verbose=False):
     cmd_with_args.append(cmd_file_name)
     #
     print("Running: " + str(cmd_with_args))
-    try:
-        p1 = subprocess.Popen(cmd_with_args, stdout=subprocess.PIPE)
-        # Run the command
-        output = p1.communicate(timeout=30)[0]
-    except subprocess.TimeoutExpired:
-        print("ERROR: timeout from running J-Link!")
-        return status
+    with tracer.stage("J-Link command file", cat='jlink', cmd_file=os.path.basename(cmd_file_name)) as stage:
+        try:
+            p1 = subprocess.Popen(cmd_with_args, stdout=subprocess.PIPE)
+            # Run the command
+            output = p1.communicate(timeout=30)[0]
+        except subprocess.TimeoutExpired:
+            print("ERROR: timeout from running J-Link!")
+            stage['status'] = False
+            return status, []
+        stage['exit_code'] = p1.returncode
+        stage['status'] = p1.returncode == SUBPROC_RETVAL_STATUS_SUCCESS
 
     lines = output.splitlines()
     lines_out = []
@@ -85,56 +99,82 @@ def run_jlink_cmd_file(cmd_file_name, verbose=False):
     return status, lines_out
 
 
-# ********************* Flash prog tasks **********************
+class JLinkSession(jlink_session.JLinkSession):
+    """
+    Persistent J-Link Commander session (see 'srec_utils.jlink_session') on the selected MCU target,
+    so USB enumeration + target connect is done once - not once for every programming step.
+    Use as context manager:
+        with JLinkSession() as session:
+            status, out_text = session.run_cmds(["r", "erase"])
+    """
 
-def fw_pre_task(erase=True, cleanup=True, debug=False):
-    status = False
+    def __init__(self, jlink_exe=None, mcu_type=None, timeout=JLINK_SESSION_TIMEOUT, verbose=False):
+        self.mcu_type = mcu_name if mcu_type is None else mcu_type
+        mcu_target, flash_size = mcu_targets[self.mcu_type]
+        super().__init__(JLINK_EXE_FILE if jlink_exe is None else jlink_exe,
+                         ['-device', mcu_target] + JLINK_FIXED_TARGET_OPTIONS, timeout, verbose)
+
+
+def run_jlink_cmds(cmds, cmd_file_name, session=None, cleanup=True, verbose=False):
+    """
+    Run J-Link commands in given session - or (if no session) via command file and a new JLinkExe process.
+    """
+    if session is not None:
+        return session.run_cmds(cmds, echo=verbose)
     #
-    with open(PRE_TASKS_CMD_FILE, 'w') as fp:
-        fp.write("r\n")
-        if erase:
-            fp.write("unlock Kinetis\n")      # Needed if device is programmed 1st time!
-            fp.write("erase\n")
+    cmd_file = get_tmp_cmd_file(cmd_file_name)
+    with open(cmd_file, 'w') as fp:
+        for cmd in cmds:
+            fp.write(cmd + "\n")
         fp.write("q\n")
     # Run JLink w. file input:
-    if not debug:
-        status, out_text = run_jlink_cmd_file(PRE_TASKS_CMD_FILE)
+    status, out_text = run_jlink_cmd_file(cmd_file, verbose=verbose)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(PRE_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
+    return status, out_text
+
+
+# ********************* Flash prog tasks **********************
+
+@traced()
+def fw_pre_task(erase=True, cleanup=True, debug=False, session=None):
+    status = False
+    #
+    cmds = ["r"]
+    if erase:
+        cmds.append("unlock Kinetis")      # Needed if device is programmed 1st time!
+        cmds.append("erase")
+    # Run JLink cmds:
+    if not debug:
+        status, out_text = run_jlink_cmds(cmds, PRE_TASKS_CMD_FILE, session=session, cleanup=cleanup)
+    #
     return status
 
 
-def fw_app_prog(cleanup=True, debug=False):
+@traced()
+def fw_app_prog(cleanup=True, debug=False, session=None, firmware_name=None):
     global fw_name
     # TODO: using globals affect testability - use arguments/locals instead!
     status = False
     # Add cmds:
-    firmware_name = fw_name
+    if firmware_name is None:
+        firmware_name = fw_name
     #
-    file_name = FWPROG_TASKS_CMD_FILE
-    with open(file_name, 'w') as fp:
-        fp.write("r\n")
-        fp.write("loadfile " + firmware_name + "\n")
-        fp.write("q\n")
-    # Run JLink w. file input:
+    cmds = ["r", "loadfile " + firmware_name]
+    # Run JLink cmds:
     if not debug:
-        status, out_text = run_jlink_cmd_file(file_name)
-    # Remove file if specified:
-    if cleanup:
-        try:
-            os.remove(file_name)
-        except OSError:
-            pass
+        status, out_text = run_jlink_cmds(cmds, FWPROG_TASKS_CMD_FILE, session=session, cleanup=cleanup)
     #
     return status
 
 
-def fw_post_task(serial_number=None, cleanup=True, debug=False):
+@traced()
+def fw_post_task(serial_number=None, cleanup=True, debug=False, session=None):
     global mcu_name
     #
     status = False
@@ -142,28 +182,59 @@ def fw_post_task(serial_number=None, cleanup=True, debug=False):
     if debug:
         print("Programming serial number into device '%s' at address=%s" % (mcu_jlink_name, serno_flash_offset))
     #
-    with open(POST_TASKS_CMD_FILE, 'w') as fp:
-        fp.write("r\n")
-        fp.write("w4 " + serno_flash_offset + " " + hex(serial_number) + "\n")      # Set serial number
-        fp.write("q\n")
-    # Run JLink w. file input:
+    cmds = ["r", "w4 " + serno_flash_offset + " " + hex(serial_number)]      # Set serial number
+    # Run JLink cmds:
     if not debug:
-        status, out_text = run_jlink_cmd_file(POST_TASKS_CMD_FILE)
-    # Remove file if specified:
-    if cleanup:
-        try:
-            os.remove(POST_TASKS_CMD_FILE)
-        except OSError:
-            pass
+        status, out_text = run_jlink_cmds(cmds, POST_TASKS_CMD_FILE, session=session, cleanup=cleanup)
     #
     return status
 
 
-def run_fw_programming(serial_num, erase=True, cleanup=True, debug=False):
+@traced()
+def get_patched_fw_file(serial_num):
+    """
+    Per-board copy of firmware (SREC) w. serial number merged in at Flash end minus 4 - replaces 'fw_post_task()'.
+    Returns: temporary file name - or None if firmware file cannot be patched
+    """
+    global fw_name, mcu_name
     #
-    s1 = fw_pre_task(erase=erase, cleanup=cleanup, debug=debug)
-    s2 = fw_app_prog(cleanup=cleanup, debug=debug)
-    s3 = fw_post_task(serNo=serial_num, cleanup=cleanup, debug=debug)
+    if not fw_name.lower().endswith(SREC_FILE_EXTENSIONS):
+        print("Firmware '%s' is not an SREC file - serial number is written separately." % fw_name)
+        return None
+    mcu_jlink_name, serno_flash_offset = get_mcu_device_specifics(mcu_type=mcu_name)
+    fd, patched_fw_file = tempfile.mkstemp(prefix="fw_serial%s_" % serial_num, suffix=os.path.splitext(fw_name)[1],
+                                           dir=JLINK_CMD_FILE_DIR)
+    os.close(fd)
+    return patch_srec_file(fw_name, [get_word_patch(int(serno_flash_offset, 16), serial_num)], patched_fw_file)
+
+
+@traced()
+def run_fw_programming(serial_num, erase=True, cleanup=True, debug=False, use_session=True, patch_serial=False):
+    """
+    Run all programming steps - by default in one (persistent) J-Link session.
+    With 'patch_serial', the serial number is programmed as part of a per-board firmware image (no separate write).
+    """
+    patched_fw_file = get_patched_fw_file(serial_num) if patch_serial else None
+    try:
+        if use_session and not debug:
+            with JLinkSession() as session:
+                s1 = fw_pre_task(erase=erase, cleanup=cleanup, debug=debug, session=session)
+                s2 = fw_app_prog(cleanup=cleanup, debug=debug, session=session, firmware_name=patched_fw_file)
+                if patched_fw_file is None:
+                    s3 = fw_post_task(serial_number=serial_num, cleanup=cleanup, debug=debug, session=session)
+                else:
+                    s3 = True
+        else:
+            s1 = fw_pre_task(erase=erase, cleanup=cleanup, debug=debug)
+            s2 = fw_app_prog(cleanup=cleanup, debug=debug, firmware_name=patched_fw_file)
+            if patched_fw_file is None:
+                s3 = fw_post_task(serial_number=serial_num, cleanup=cleanup, debug=debug)
+            else:
+                s3 = True
+    finally:
+        # Per-board image removed also if programming raised (e.g. J-Link not found):
+        if patched_fw_file is not None:
+            os.remove(patched_fw_file)
     #
     status = s1 and s2 and s3
     #
@@ -171,28 +242,20 @@ def run_fw_programming(serial_num, erase=True, cleanup=True, debug=False):
 
 
 # ******************** verification ***********************************
-def fw_verify_serial_number(snum, cleanup=True, verbose=False):
+@traced()
+def fw_verify_serial_number(snum, cleanup=True, verbose=False, session=None):
     global mcu_name
     #
     print("Running FW serial number verification ...", flush=True)
     status = False
     mcu_jlink_name, serno_flash_offset = get_mcu_device_specifics(mcu_type=mcu_name)
-    SER_NUM_FLASH_ADDR = serno_flash_offset.lstrip('0x').upper()
+    SER_NUM_FLASH_ADDR = "%08X" % int(serno_flash_offset, 16)     # J-Link prints 'mem32' addresses as 8 hex digits
     if verbose:
         print("Checking serial number of device '%s' at address=%s" % (mcu_jlink_name, SER_NUM_FLASH_ADDR))
     #
-    with open(VERIFY_SERNUM_CMD_FILE, 'w') as fp:
-        fp.write("r\n")
-        fp.write("mem32 " + serno_flash_offset + ",1\n")
-        fp.write("q\n")
-    # Run JLink w. file input:
-    cmd_status, out_text = run_jlink_cmd_file(VERIFY_SERNUM_CMD_FILE)
-    # Remove file if specified:
-    if cleanup:
-        try:
-            os.remove(VERIFY_SERNUM_CMD_FILE)
-        except OSError:
-            pass
+    cmds = ["r", "mem32 " + serno_flash_offset + ",1"]
+    # Run JLink cmds:
+    cmd_status, out_text = run_jlink_cmds(cmds, VERIFY_SERNUM_CMD_FILE, session=session, cleanup=cleanup)
     #
     if verbose:
         print("Cmd-output:", flush=True)
@@ -218,35 +281,37 @@ def fw_verify_serial_number(snum, cleanup=True, verbose=False):
     return status
 
 
-def fw_dummy_task(cleanup=True, debug=False, verbose=True):
+@traced()
+def fw_dummy_task(cleanup=True, debug=False, verbose=True, session=None):
     status = False
+    out_text = []
     #
-    with open(DUMMY_TASKS_CMD_FILE, 'w') as fp:
-        fp.write("r\n")
-        fp.write("mem32 0x3fffc,1\n")
-        fp.write("q\n")
-    # Run JLink w. file input:
+    cmds = ["r", "mem32 0x3fffc,1"]
+    # Run JLink cmds:
     if not debug:
-        status, out_text = run_jlink_cmd_file(DUMMY_TASKS_CMD_FILE)
+        status, out_text = run_jlink_cmds(cmds, DUMMY_TASKS_CMD_FILE, session=session, cleanup=cleanup)
     if verbose:
         for line in out_text:
             print(line)
-    # Remove file if specified:
-    if cleanup:
-        try:
-            os.remove(POST_TASKS_CMD_FILE)
-        except OSError:
-            pass
     #
     return status
 
 
-def run_fw_verification(serial_num):
+@traced()
+def run_fw_verification(serial_num, use_session=True):
     #
-    # Run dummy first:
-    fw_dummy_task()
-    print("\r\n\r\n")
-    status = fw_verify_serial_number(snum=serial_num)
+    session = JLinkSession() if use_session else None
+    if session is not None:
+        session.open()
+    try:
+        # Run dummy first:
+        fw_dummy_task(session=session)
+        print("\r\n\r\n")
+        status = fw_verify_serial_number(snum=serial_num, session=session)
+    finally:
+        # J-Link process (and probe) released also if a step raised:
+        if session is not None:
+            session.close()
     #
     if status:
         print("FW-verification: PASS")
@@ -263,4 +328,22 @@ if __name__ == "__main__":
     print("=====================")
     print("MCU name: ", mcudev)
     print("Serial number offset address: %s (%s)" % (ofs, ofs.lstrip('0x').upper()))
-
+    #
+    # Run programming + verification against J-Link stand-in (POSIX):
+    JLINK_EXE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_jlink.py")
+    fw_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "srec_utils", "FW1.srec")
+    print("Programming w. session: %s" % run_fw_programming(serial_num=1234))
+    print("Programming w/o session: %s" % run_fw_programming(serial_num=1234, use_session=False))
+    print("Programming w. patched image: %s" % run_fw_programming(serial_num=1234, patch_serial=True))
+    # Timing trace of one programming + verification run:
+    from srec_utils.prog_trace import read_trace, get_stage_summary
+    trace_file = get_tmp_cmd_file("fwprog_trace.jsonl")
+    os.environ['FAKE_JLINK_FLASH_FILE'] = get_tmp_cmd_file("fake_flash.bin")    # Flash kept between J-Link runs
+    tracer.enable(trace_file, append=False)
+    run_fw_programming(serial_num=1234)
+    run_fw_verification(serial_num=1234)
+    tracer.disable()
+    for stage_name, (calls, seconds, failed) in get_stage_summary(read_trace(trace_file)).items():
+        print("%-24s %3d call(s) %7.3f sec  %d failed" % (stage_name, calls, seconds, failed))
+    os.remove(trace_file)
+    os.remove(os.environ.pop('FAKE_JLINK_FLASH_FILE'))
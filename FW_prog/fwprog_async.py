@@ -0,0 +1,127 @@
+"""
+@file fwprog_async.py
+
+@brief asyncio-based programming pipeline - one controller process drives many J-Link probes (fixtures) at once.
+Each board gets its own J-Link Commander session (asyncio subprocess - no thread per probe),
+with a per-board timeout. Cancelling a board's task (or a timeout) terminates its J-Link process.
+
+Use e.g.:
+    results = run_gang_programming(['600111111', '600222222'], [1001, 1002], fw_file="firmware.srec")
+"""
+
+import asyncio
+
+from FW_prog import fwprog
+from FW_prog.fwprog import JLINK_FIXED_TARGET_OPTIONS, JLINK_SESSION_TIMEOUT, mcu_targets, get_mcu_device_specifics
+from srec_utils import jlink_session
+from srec_utils.jlink_session import JLINK_SELECT_PROBE_OPTION
+
+
+BOARD_PROG_TIMEOUT = 120                        # in seconds - max. time for programming one board
+
+
+class AsyncJLinkSession(jlink_session.AsyncJLinkSession):
+    """
+    Persistent J-Link Commander session on given probe (see 'srec_utils.jlink_session') - for the selected MCU target.
+    Use as async context manager:
+        async with AsyncJLinkSession(probe_sn) as session:
+            status, out_text = await session.run_cmds(["r", "erase"])
+    """
+
+    def __init__(self, probe_sn=None, jlink_exe=None, mcu_type=None, timeout=JLINK_SESSION_TIMEOUT, verbose=False):
+        self.mcu_type = fwprog.mcu_name if mcu_type is None else mcu_type
+        mcu_target, flash_size = mcu_targets[self.mcu_type]
+        jlink_options = ['-device', mcu_target] + JLINK_FIXED_TARGET_OPTIONS
+        if probe_sn is not None:
+            jlink_options.extend([JLINK_SELECT_PROBE_OPTION, str(probe_sn)])
+        super().__init__(fwprog.JLINK_EXE_FILE if jlink_exe is None else jlink_exe, jlink_options, timeout, verbose)
+
+
+def get_board_plan(fw_file, serial_num, erase=True, mcu_type=None):
+    """
+    J-Link commands for programming one board - same steps as 'fwprog.run_fw_programming()',
+    plus serial number readback.
+    """
+    if mcu_type is None:
+        mcu_type = fwprog.mcu_name
+    mcu_jlink_name, serno_flash_offset = get_mcu_device_specifics(mcu_type=mcu_type)
+    plan = ["r"]
+    if erase:
+        plan.append("unlock Kinetis")      # Needed if device is programmed 1st time!
+        plan.append("erase")
+    plan.append("loadfile " + fw_file)
+    plan.append("r")
+    plan.append("w4 " + serno_flash_offset + " " + hex(serial_num))
+    plan.append("mem32 " + serno_flash_offset + ",1")
+    return plan
+
+
+async def program_board(probe_sn, plan, serial_num=None, mcu_type=None, timeout=BOARD_PROG_TIMEOUT, verbose=False):
+    """
+    Run programming plan on board attached to given J-Link probe.
+    If 'serial_num' is given, it is verified from 'mem32' readback of the serial number address.
+    Returns: (probe_sn, status)
+    """
+    if mcu_type is None:
+        mcu_type = fwprog.mcu_name
+
+    async def run_plan():
+        async with AsyncJLinkSession(probe_sn, mcu_type=mcu_type, verbose=verbose) as session:
+            if not session.connected:
+                return False
+            status, output = await session.run_cmds_parsed(plan)
+        if status and serial_num is not None:
+            mcu_jlink_name, serno_flash_offset = get_mcu_device_specifics(mcu_type=mcu_type)
+            status = output.mem32.get(int(serno_flash_offset, 16)) == serial_num
+        return status
+
+    try:
+        status = await asyncio.wait_for(run_plan(), timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"ERROR: programming board on probe {probe_sn} timed out after {timeout} sec!", flush=True)
+        status = False
+    return probe_sn, status
+
+
+async def program_boards(jobs, max_concurrent=None, timeout=BOARD_PROG_TIMEOUT, verbose=False):
+    """
+    Program several boards concurrently. 'jobs' is a list of (probe_sn, plan, serial_num).
+    At most 'max_concurrent' J-Link processes run at the same time (None = no limit).
+    Returns: list of (probe_sn, status) - in same order as 'jobs'.
+    """
+    limit = asyncio.Semaphore(max_concurrent if max_concurrent else len(jobs) or 1)
+
+    async def limited(probe_sn, plan, serial_num):
+        async with limit:
+            return await program_board(probe_sn, plan, serial_num, timeout=timeout, verbose=verbose)
+
+    return await asyncio.gather(*(limited(probe_sn, plan, serial_num) for probe_sn, plan, serial_num in jobs))
+
+
+def run_gang_programming(probe_sns, serial_nums, fw_file=None, erase=True, max_concurrent=None,
+                         timeout=BOARD_PROG_TIMEOUT, verbose=False):
+    """ Blocking entry point - one board per probe, board serial numbers taken from 'serial_nums'. """
+    if fw_file is None:
+        fw_file = fwprog.fw_name
+    if len(serial_nums) < len(probe_sns):
+        raise Exception(f"Need one serial number per probe - got {len(serial_nums)} serial numbers for {len(probe_sns)} probes!")
+    jobs = [(probe_sn, get_board_plan(fw_file, serial_num, erase), serial_num)
+            for probe_sn, serial_num in zip(probe_sns, serial_nums)]
+    return asyncio.run(program_boards(jobs, max_concurrent, timeout, verbose))
+
+
+# ************************************ TESTING ****************************************
+if __name__ == "__main__":
+    import os
+    import time
+    # Run gang programming against J-Link stand-in (POSIX) - e.g. 'python -m FW_prog.fwprog_async':
+    fwprog.JLINK_EXE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_jlink.py")
+    test_fw_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "srec_utils", "FW1.srec")
+    for num_boards in (1, 4, 16):
+        t_start = time.perf_counter()
+        results = run_gang_programming([f"6000{idx:05d}" for idx in range(num_boards)],
+                                       [1000 + idx for idx in range(num_boards)], fw_file=test_fw_file)
+        t_elapsed = time.perf_counter() - t_start
+        print(f"{num_boards:2d} board(s): {sum(status for _, status in results)} PASS, {t_elapsed:.2f} sec")
+    # Timeout - J-Link process of cancelled board is terminated:
+    print("Timeout: %s" % run_gang_programming(["600099999"], [1], fw_file=test_fw_file, timeout=0.01))
@@ -1,7 +1,14 @@
 import argparse
+import os
 import sys
 #
+from FW_prog import fwprog
 from FW_prog.fwprog import mcu_targets, run_fw_programming, run_fw_verification
+from srec_utils.serial_allocator import SerialAllocator, DEFAULT_LEDGER_FILE, SERIAL_STATUS_PROGRAMMED, \
+    SERIAL_STATUS_FAILED
+
+
+SERIAL_LEDGER_PRODUCT = 'fwprog'
 
 
 # ******************** Generic stuff *************************************
@@ -17,6 +24,12 @@ def parse_args_and_execute():
     # Std.args NOT needing 'special handling':
     parser.add_argument('--serial', '-s', action="store", dest="ser_num", type=int,
                         help='Serial number to be programmed into upper 4 bytes of Flash')
+    parser.add_argument('--auto-serial', '-a', action="store_true", dest="auto_serial",
+                        help='Take next unused serial number from serial-number ledger (instead of -s)')
+    parser.add_argument('--force-serial', action="store_true", dest="force_serial",
+                        help='Program serial number given by -s even if ledger shows it as already used')
+    parser.add_argument('--ledger', action="store", dest="ledger", type=str, default=DEFAULT_LEDGER_FILE,
+                        help="Serial-number ledger file (default: '%s')" % DEFAULT_LEDGER_FILE)
     parser.add_argument('--fw', action="store", dest="fw_name", type=str, default="firmware.hex",
                         help="Firmware HEX/SREC file name (default: 'firmware.hex')")
     parser.add_argument('--device', '-d', action="store", dest="mcu_name", type=str, default="kl16z256",
@@ -33,12 +46,32 @@ def parse_args_and_execute():
     else:
         fw_path = cli_args.fw_dir
         print("Using %s as firmware-path ..." % fw_path)
-    # FW serial number:
-    if cli_args.ser_num is None:
-        print("Argument '-s' ('--serial') is required - a serial number MUST be specified!")
+    # Erase (via MassErase) target Flash first or not - checked before a serial number is taken from ledger:
+    erase_flash_first = cli_args.erase_first
+    if erase_flash_first not in ['yes', 'no']:
+        print("Invalid value for '--erase' option!\nLegal values: 'yes' or 'no' ")
+        sys.exit(1)
+    # FW serial number - given, or drawn from ledger:
+    allocator = SerialAllocator(cli_args.ledger, product=SERIAL_LEDGER_PRODUCT)
+    if cli_args.auto_serial:
+        serial_num = allocator.reserve(1)[0]
+        print("Using serial number %s from ledger '%s' ..." % (serial_num, cli_args.ledger))
+    elif cli_args.ser_num is None:
+        print("Argument '-s' ('--serial') is required - a serial number MUST be specified (or use '-a')!")
         sys.exit(1)
     else:
         serial_num = cli_args.ser_num
+        try:
+            used_serials = allocator.register_block([serial_num], allow_used=cli_args.force_serial)
+        except ValueError as exc:
+            print("ERROR: %s" % exc)
+            sys.exit(1)
+        if used_serials:
+            print("%s: serial number %s already used (ledger status: '%s')!" %
+                  ("WARNING" if cli_args.force_serial else "ERROR", serial_num, allocator.get_status(serial_num)))
+            if not cli_args.force_serial:
+                print("Use '--force-serial' to program it anyway.")
+                sys.exit(1)
     # FW file name:
     if cli_args.fw_name is None:
         # Should NEVER happen - maybe simplify this?
@@ -53,28 +86,27 @@ def parse_args_and_execute():
         print("Using 'kl16z256' for default MCU device-name ...")
         mcu_name = 'kl16z256'   # TODO: assess - rather have this as required field???
     else:
-        fw_name = cli_args.fw_name
-        print("Using %s as firmware-name ..." % fw_name)
-    # Erase (via MassErase) target Flash first or not:
-    erase_flash_first = cli_args.erase_first
+        mcu_name = cli_args.mcu_name
+        print("Using %s as MCU device-name ..." % mcu_name)
+    # Programming functions take FW + MCU from module settings:
+    fwprog.fw_name = fw_name if cli_args.fw_dir is None else os.path.join(fw_path, fw_name)
+    fwprog.mcu_name = mcu_name
 
     # Run:
-    if erase_flash_first not in ['yes', 'no']:
-        print("Invalid value for '--erase' option!\nLegal values: 'yes' or 'no' ")
-        sys.exit(1)
+    # Test only:
+    # ret_val = run_fw_programming(serial_num, erase=(erase_flash_first == 'yes'), cleanup=False, debug=True)
+    # Non-test environment:
+    status1 = run_fw_programming(serial_num, erase=(erase_flash_first == 'yes'))
+    status2 = run_fw_verification(serial_num)
+    #
+    allocator.set_status(serial_num, SERIAL_STATUS_PROGRAMMED if status1 and status2 else SERIAL_STATUS_FAILED)
+    allocator.close()
+    print("\r\n\r\n================================")
+    if status1 and status2:
+        print("PASS: successful programming.")
     else:
-        # Test only:
-        # ret_val = run_fw_programming(fw_name, serial_num, erase_flash_first, cleanup=False, debug=True)
-        # Non-test environment:
-        status1 = run_fw_programming(fw_name, serial_num, erase_flash_first)
-        status2 = run_fw_verification(serial_num)
-        #
-        print("\r\n\r\n================================")
-        if status1 and status2:
-            print("PASS: successful programming.")
-        else:
-            print("FAIL: programming error!!")
-        print("================================\r\n")
+        print("FAIL: programming error!!")
+    print("================================\r\n")
     #
     print("Completed FW-programming.")
 
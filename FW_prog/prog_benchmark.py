@@ -0,0 +1,218 @@
+"""
+@file prog_benchmark.py
+
+@brief Production-line throughput benchmark - no hardware needed.
+Runs the complete programming flows of the irrigation-sensor tool ('VV_GUI/irrigation_sensor_prog.py')
+and of 'fwprog.run_fw_programming()' against the J-Link stand-in ('fake_jlink.py'), w. simulated
+connect/erase/programming latencies. Reports per scenario: wall time, boards/hour, J-Link processes
+started per board - plus wall time per programming stage, and the cost of starting one J-Link process.
+
+Run from repository root (POSIX), e.g. 3 boards per scenario:
+    python -m FW_prog.prog_benchmark 3
+"""
+
+import contextlib
+import functools
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from FW_prog import fwprog
+
+
+FAKE_JLINK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_jlink.py")
+VV_GUI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "VV_GUI")
+SREC_UTILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "srec_utils")
+
+# Simulated target timing (environment for 'fake_jlink.py') - roughly a KL27Z256 on J-Link w. SWD @ 4MHz:
+BENCHMARK_LATENCIES = {'FAKE_JLINK_CONNECT_DELAY': '0.3',
+                       'FAKE_JLINK_ERASE_DELAY': '0.5',
+                       'FAKE_JLINK_PROG_DELAY_PER_KB': '0.01',
+                       'FAKE_JLINK_VERIFY_DELAY_PER_KB': '0.002',
+                       'FAKE_JLINK_FRAM_ERASE_TIME': '1.0'}
+BENCHMARK_BOARDS = 2        # Boards programmed per scenario (default)
+BENCHMARK_GANG_PROBES = 4
+SPAWN_SAMPLES = 10          # J-Link processes started for measuring spawn overhead
+
+
+class StageTimer:
+    """
+    Wall time per programming stage - wraps functions (module or class attributes) for the duration of the benchmark.
+    Stages may nest (e.g. 'run_board_plan' includes 'JLinkSession.open').
+    """
+
+    def __init__(self):
+        self.stages = {}        # Stage name --> [num_calls, total seconds]
+        self._wrapped = []      # (owner, attribute name, original function)
+
+    def wrap(self, owner, attr, stage=None):
+        func = getattr(owner, attr)
+        stage = attr if stage is None else stage
+        stages = self.stages
+
+        @functools.wraps(func)      # Same name - wrapped module function can still be pickled (process pool)
+        def timed(*args, **kwargs):
+            t_start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                entry = stages.setdefault(stage, [0, 0.0])
+                entry[0] += 1
+                entry[1] += time.perf_counter() - t_start
+
+        setattr(owner, attr, timed)
+        self._wrapped.append((owner, attr, func))
+
+    def reset(self):
+        self.stages.clear()
+
+    def restore(self):
+        for owner, attr, func in reversed(self._wrapped):
+            setattr(owner, attr, func)
+        self._wrapped = []
+
+
+class CountingPopen(subprocess.Popen):
+    """ 'subprocess.Popen' that counts started processes (i.e. J-Link invocations). """
+    count = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingPopen.count += 1
+        super().__init__(*args, **kwargs)
+
+
+def measure_spawn_overhead(num_spawns=SPAWN_SAMPLES):
+    """ Mean time (in seconds) for starting + quitting one J-Link process - w/o simulated connect delay. """
+    fd, cmd_file = tempfile.mkstemp(suffix='.jlink')
+    with os.fdopen(fd, 'w') as fp:
+        fp.write("q\n")
+    env = dict(os.environ, FAKE_JLINK_CONNECT_DELAY='0')
+    t_start = time.perf_counter()
+    for _ in range(num_spawns):
+        subprocess.run([FAKE_JLINK_FILE, '-device', 'MKL27Z256XXX4', cmd_file], env=env, stdout=subprocess.DEVNULL)
+    t_elapsed = time.perf_counter() - t_start
+    os.remove(cmd_file)
+    return t_elapsed / num_spawns
+
+
+def run_scenario(name, num_boards, prog_func, timer, quiet=True):
+    """ Run 'prog_func' (programs one run of boards, returns: no. of boards, status) until 'num_boards' are done. """
+    timer.reset()
+    CountingPopen.count = 0
+    boards_done = 0
+    all_ok = True
+    t_start = time.perf_counter()
+    while boards_done < num_boards:
+        with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+            boards, status = prog_func()
+        boards_done += boards
+        all_ok = all_ok and status
+    t_elapsed = time.perf_counter() - t_start
+    return {'name': name, 'boards': boards_done, 'status': all_ok, 'seconds': t_elapsed,
+            'spawns': CountingPopen.count, 'stages': dict(timer.stages)}
+
+
+def print_report(results, spawn_overhead):
+    print("")
+    print(f"J-Link process spawn overhead: {spawn_overhead * 1000:.1f} ms per process (w/o connect)")
+    print("")
+    print(f"{'Scenario':40s} {'boards':>6s} {'OK':>4s} {'total[s]':>9s} {'s/board':>8s} {'boards/h':>9s} "
+          f"{'spawns/board':>12s}")
+    for result in results:
+        boards = result['boards']
+        print(f"{result['name']:40s} {boards:6d} {'yes' if result['status'] else 'NO':>4s} {result['seconds']:9.2f} "
+              f"{result['seconds'] / boards:8.2f} {3600 * boards / result['seconds']:9.0f} "
+              f"{result['spawns'] / boards:12.1f}")
+        for stage, (num_calls, seconds) in sorted(result['stages'].items(), key=lambda item: -item[1][1]):
+            print(f"    {stage:36s} {num_calls:4d} call(s) {seconds:8.2f} sec")
+
+
+def run_benchmark(num_boards=BENCHMARK_BOARDS, latencies=None, quiet=True):
+    """ Run all scenarios w. given (or default) simulated latencies. Returns: list of scenario results """
+    # Import here - irrigation-sensor tool needs its GUI dependencies ('click', 'PyQt5'):
+    sys.path.insert(0, VV_GUI_DIR)
+    import irrigation_sensor_prog as isp
+    from srec_utils.jlink_session import JLinkSession
+    #
+    work_dir = tempfile.mkdtemp(prefix="prog_benchmark_")
+    srec_dir = os.path.join(work_dir, "srec")
+    os.mkdir(srec_dir)
+    shutil.copy(os.path.join(SREC_UTILS_DIR, "FW1.srec"), os.path.join(srec_dir, "IrrigationSensorAppl_FW1.srec"))
+    shutil.copy(os.path.join(SREC_UTILS_DIR, "FW2.srec"), os.path.join(srec_dir, "IrrigationSensorAppl_FW2.srec"))
+    ledger_file = os.path.join(work_dir, "ledger.sqlite")
+    #
+    saved_environ = dict(os.environ)
+    os.environ.update(BENCHMARK_LATENCIES if latencies is None else latencies)
+    # Simulated FRAM-erase app ends in the idle loop of the 'AA' app (boards below are 'AA'):
+    os.environ['FAKE_JLINK_FRAM_DONE_PC'] = "%X" % isp.FRAM_ERASE_APP_DONE[isp.IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_SREC_NAME][0]
+    # Flash kept per probe between J-Link runs - as on a real board:
+    os.environ['FAKE_JLINK_FLASH_FILE'] = os.path.join(work_dir, "flash_{probe}.bin")
+    saved_jlink_exe = isp.JLINK_EXE_FILE, fwprog.JLINK_EXE_FILE, fwprog.fw_name
+    isp.JLINK_EXE_FILE = fwprog.JLINK_EXE_FILE = FAKE_JLINK_FILE
+    fwprog.fw_name = os.path.join(SREC_UTILS_DIR, "FW1.srec")
+    saved_popen = subprocess.Popen
+    subprocess.Popen = CountingPopen
+    #
+    timer = StageTimer()
+    for attr in ('program_board', 'vv_fram_erase', 'fw_prepare_target', 'run_fw_programming',
+                 'plan_board_programming', 'run_board_plan', 'run_jlink_cmd_file'):
+        timer.wrap(isp, attr, "vv." + attr)
+    # Shared by both tools - 'fwprog.JLinkSession' is a subclass:
+    timer.wrap(JLinkSession, 'open', "JLinkSession.open")
+    for attr in ('fw_pre_task', 'fw_app_prog', 'fw_post_task', 'run_jlink_cmd_file'):
+        timer.wrap(fwprog, attr, "fwprog." + attr)
+    #
+    vv_flow = getattr(isp.run_irrigation_sensor_programming, 'callback', isp.run_irrigation_sensor_programming)
+    mcu_type = isp.IRRIGATION_SENSOR_REV_AA_MCU
+    gang_probes = ",".join(f"60000{idx:04d}" for idx in range(BENCHMARK_GANG_PROBES))
+
+    def vv_board(**kwargs):
+        _, _, status = isp.program_board(srec_dir, 1, 'all', True, True, mcu_type, **kwargs)
+        return 1, status
+
+    # NOTE: gang boards run in worker processes - their stages and J-Link processes are not counted.
+    def vv_run(probes="", **kwargs):
+        options = dict(differential=False, verify=False, patch_config=False)
+        options.update(kwargs)
+        status = vv_flow(srec_dir, 1, 'all', not options['differential'], not options['differential'], 'AA', probes,
+                         False, auto_serial=True, force_serial=False, ledger=ledger_file, trace_file="", trace_format='jsonl',
+                         **options)
+        return len(probes.split(',')) if probes else 1, status
+
+    def fw_run(**kwargs):
+        return 1, fwprog.run_fw_programming(1234, **kwargs)
+
+    scenarios = [("VV: legacy (separate J-Link runs)", lambda: vv_board(single_pass=False)),
+                 ("VV: single pass", lambda: vv_board(use_image_cache=False)),
+                 ("VV: single pass + image cache", vv_run),
+                 ("VV: single pass + verify", lambda: vv_run(verify=True)),
+                 ("VV: CONFIG patched into image", lambda: vv_run(patch_config=True)),
+                 ("VV: differential re-programming", lambda: vv_run(differential=True)),
+                 (f"VV: gang, {BENCHMARK_GANG_PROBES} probes", lambda: vv_run(probes=gang_probes)),
+                 ("fwprog: separate J-Link runs", lambda: fw_run(use_session=False)),
+                 ("fwprog: one J-Link session", fw_run),
+                 ("fwprog: serial patched into image", lambda: fw_run(patch_serial=True))]
+    results = []
+    try:
+        spawn_overhead = measure_spawn_overhead()
+        for name, prog_func in scenarios:
+            print(f"Running: {name} ...", flush=True)
+            results.append(run_scenario(name, num_boards, prog_func, timer, quiet))
+    finally:
+        timer.restore()
+        subprocess.Popen = saved_popen
+        isp.JLINK_EXE_FILE, fwprog.JLINK_EXE_FILE, fwprog.fw_name = saved_jlink_exe
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print_report(results, spawn_overhead)
+    return results
+
+
+# ******************* TESTS / BENCHMARK **********************
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else BENCHMARK_BOARDS)
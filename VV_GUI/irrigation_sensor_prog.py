@@ -3,10 +3,28 @@ import os
 import sys
 import time
 import subprocess
+import tempfile
+import queue
+import threading
+import multiprocessing
+import platform
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 # For (optional) GUI
 import click
 import quick_gui as quick
 from resource_helper import resource_path
+# Shared S-Record utilities (in 'srec_utils' package next to this tool's folder):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from srec_utils.jlink_session import JLinkSession, get_probe_sn
+from srec_utils.jlink_output import JLinkOutput, parse_jlink_output
+from srec_utils.jlink_cmd_file import JLINK_CMD_FILE_DIR, get_tmp_cmd_file
+from srec_utils.prog_trace import tracer, traced, read_trace, write_chrome_trace, get_stage_summary
+from srec_utils.address_index import AddressIndex
+from srec_utils.image_cache import get_loadbin_cmds, cache_srec_sectors
+from srec_utils.image_patcher import get_config_sector_patches, patch_srec_file
+from srec_utils.serial_allocator import SerialAllocator, DEFAULT_LEDGER_FILE, SERIAL_STATUS_PROGRAMMED, \
+    SERIAL_STATUS_FAILED
 
 
 # Version info
@@ -39,11 +57,31 @@ IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_SREC_NAME = "VV_revB_platform_FRAM_ERASE
 IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_START_ADDR = 0x1FFF8134         # Corresponding 'ResetISR' location of K32L FRAM-erase application linked to SRAM.
 # AB has some problems running from SRAM - need to run app from Flash:
 IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_FLASH_SREC_NAME = "VV_revB_platform_FRAM_ERASER_Flash.srec"
+# Flash sector sizes (smallest erasable unit) - used for differential programming:
+IRRIGATION_SENSOR_REV_AA_FLASH_SECTOR_SIZE = 0x400      # KL27Z256: 1KB sectors
+IRRIGATION_SENSOR_REV_AB_FLASH_SECTOR_SIZE = 0x800      # K32L2A41: 2KB sectors
+IRRIGATION_SENSOR_FLASH_SIZE = 0x40000                  # KL27Z256 and K32L2A41: 256KB Flash
+# FRAM-erase completion - after erase + blank check, each FRAM-erase app prints PASS/FAIL and ends in an idle loop
+# ('nop; b .-2'). Its 'FRAM is blank' flag (byte, 0 = FAIL) is a stack local, addressed by a register in that loop.
+# The target is halted periodically: PC in the idle loop = erase finished, then the flag gives the result.
+# NOTE: locations are from disassembly of the app builds in this folder - must be updated when an app is re-built!
+#   app SREC name: (address of idle loop, register w. flag base address, flag offset)
+FRAM_ERASE_APP_DONE = {IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_SREC_NAME: (0x1FFFE98A, 'R7', 3),
+                       IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_SREC_NAME: (0x1FFF875E, 'R7', 3),
+                       IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_FLASH_SREC_NAME: (0x72C, 'R4', 0)}
+FRAM_ERASE_TIMEOUT = 10.0                   # in seconds - erase normally takes 2-5sec
+FRAM_ERASE_POLL_INTERVAL = 0.25             # in seconds
 
 # TODO: rather have JSON-file (or INI-file) with settings (e.g. CONFIG-address) for each specific target! All such info should reside in one place, within a few lines apart!!
 
+# Serial number ledger - serial numbers for this product are drawn from/registered in it:
+SERIAL_LEDGER_PRODUCT = 'irrigation_sensor'
+SERIAL_NUMBER_FIRST = 1
+SERIAL_NUMBER_LAST = 65535
+
 JLINK_TARGET_MCU_OPTION_IDX = 1   # Relates to position in list below. TODO: rather use dictionary?
 JLINK_TARGET_OPTIONS = ['-device', IRRIGATION_SENSOR_REV_AA_MCU, '-if', 'SWD', '-speed', '4000', '-autoconnect', '1']     # Default: assume 'rev.AA' sensor = KL27Z256 MCU
+JLINK_SELECT_PROBE_OPTION = '-SelectEmuBySN'        # Selects J-Link probe by its serial number (gang programming)
 
 MAP_SENSOR_TYPE_TO_MCU = { 'AA': IRRIGATION_SENSOR_REV_AA_MCU,
                             'AB': IRRIGATION_SENSOR_REV_AB_MCU}
@@ -59,19 +97,58 @@ VERIFY_IMAGENUM_CMD_FILE = "VV_verify_imagenum.tmp.jlink"
 VERIFY_SERNUM_CMD_FILE = "VV_verify_sernum.tmp.jlink"
 #
 DUMMY_TASKS_CMD_FILE = "VV_dummy_read.tmp.jlink"
+# Firmware files (in folder given by 'path'):
+FW1_SREC_NAME = "IrrigationSensorAppl_FW1.srec"
+FW2_SREC_NAME = "IrrigationSensorAppl_FW2.srec"
+BOOTLOADER_SREC_NAME = "IrrigationSensorBootld.srec"
 
 
 use_gui = True
 srec_path = None
 
 
-def run_jlink_cmd_file(cmd_file_name, verbose=True):
+def get_jlink_target_options(mcu_type, probe_sn=None):
+    """ J-Link command-line options for given MCU - and (optionally) a specific J-Link probe. """
+    jlink_options = list(JLINK_TARGET_OPTIONS)
+    jlink_options[JLINK_TARGET_MCU_OPTION_IDX] = mcu_type
+    if probe_sn is not None:
+        jlink_options.extend([JLINK_SELECT_PROBE_OPTION, str(probe_sn)])
+    return jlink_options
+
+
+JLINK_CMD_FILE_TIMEOUT = 30     # in seconds - max. time for running a J-Link command file
+
+
+def _enqueue_output_lines(stream, out_queue):
+    """ Reader thread - passes J-Link output lines on as soon as they are written (None = EOF). """
+    for line in iter(stream.readline, b''):
+        out_queue.put(line)
+    out_queue.put(None)
+
+
+def run_jlink_cmd_file(cmd_file_name, verbose=True, jlink_options=None):
+    """
+    Run J-Link command file. Output is streamed line-by-line (and shown immediately if 'verbose'),
+    and J-Link is terminated right away if connection to probe or target fails.
+    Returns: (status, JLinkOutput) - output is None on timeout
+    """
+    if jlink_options is None:
+        jlink_options = JLINK_TARGET_OPTIONS
+    with tracer.stage("J-Link command file", cat='jlink', cmd_file=os.path.basename(cmd_file_name),
+                      probe=get_probe_sn(jlink_options)) as stage:
+        status, jlink_output, stage['exit_code'] = _run_jlink_process(cmd_file_name, verbose, jlink_options)
+        stage['status'] = status
+    return status, jlink_output
+
+
+def _run_jlink_process(cmd_file_name, verbose, jlink_options):
+    """ Returns: (status, JLinkOutput, J-Link exit code) - exit code is None if J-Link was not started, or killed """
     SUBPROC_RETVAL_STATUS_SUCCESS = 0
     status = False
     #
     cmd_with_args = []
     cmd_with_args.append(resource_path(JLINK_EXE_FILE))
-    cmd_with_args.extend(JLINK_TARGET_OPTIONS)
+    cmd_with_args.extend(jlink_options)
     cmd_with_args.append(cmd_file_name)
     #
     print("Running: " + str(cmd_with_args))
@@ -86,102 +163,148 @@ def run_jlink_cmd_file(cmd_file_name, verbose=True):
                                   shell=False,
                                   stdin=subprocess.DEVNULL,
                                   stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL,
                                   startupinfo=startup_info)
         else:
             p1 = subprocess.Popen(cmd_with_args,
                                   shell=False,
                                   stdin=subprocess.DEVNULL,
                                   stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE)
-        # Run the command
-        output = p1.communicate(timeout=30)[0]
-    except subprocess.TimeoutExpired:
-        print("ERROR: timeout from running J-Link!")
-        return status, None
-
-    lines = output.splitlines()
-    lines_out = []
-    for line in lines:
-        line_str = line.decode('latin1', 'ignore')
-        lines_out.append(line_str)
+                                  stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print(f"ERROR: could not start J-Link - {e}")
+        return status, None, None
+    out_queue = queue.Queue()
+    threading.Thread(target=_enqueue_output_lines, args=(p1.stdout, out_queue), daemon=True).start()
+    # Single pass over output - connect problems, write errors and 'Error'/'ERROR' lines are classified by parser:
+    jlink_output = JLinkOutput()
+    deadline = time.monotonic() + JLINK_CMD_FILE_TIMEOUT
+    while True:
+        try:
+            line = out_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            print("ERROR: timeout from running J-Link!")
+            p1.kill()
+            p1.wait()
+            return status, None, None
+        if line is None:
+            break
+        line_str = line.decode('latin1', 'ignore').rstrip('\r\n')
+        jlink_output.feed(line_str)
         if verbose:
-            print(line_str)
-        # Check for J-Link NOT connected, or connection problems:
-        if line_str.startswith("Cannot connect to target") or line_str.startswith("Connecting to J-Link via USB...FAILED"):
-            return status, lines_out
-        # Check for WRITE-errors:
-        if line_str.startswith("Could not write"):
-            return status, lines_out
-        # Check for 'Error'/'ERROR' in output:
-        if line_str.find('Error') > 0 or line_str.find('ERROR') > 0:
-            return status, lines_out
-        # Check for 'Error'/'ERROR' in output:
-        if line_str.find('Error') > 0 or line_str.find('ERROR') > 0:
-            return status, lines_out
+            print(line_str, flush=True)
+        # Fail fast - no probe or no target means rest of command file cannot succeed:
+        if not jlink_output.connected:
+            print("ERROR: no connection to J-Link probe or target - aborting J-Link!", flush=True)
+            p1.kill()
+            p1.wait()
+            return status, jlink_output, None
+    p1.wait()
     # If 'normal' output - or NO output at all - the return value is used to decide 'status':
-    status = (p1.returncode == SUBPROC_RETVAL_STATUS_SUCCESS)
+    status = jlink_output.status and (p1.returncode == SUBPROC_RETVAL_STATUS_SUCCESS)
     #
-    return status, lines_out
+    return status, jlink_output, p1.returncode
 
 
 # ********************* FRAM erase task ***********************
-def vv_fram_erase(cleanup=True, verbose=True, debug=False):
+def get_fram_erase_cmds(mcu_type):
     """
-    Erase FRAM on irrigation-sensor target (VV).
-    Note that erase-application START-address is NOT equal to RAM-startaddr!
-    Instead, the 'ResetISR' symbol is located 212 bytes ABOVE the vector table, at addr=0x1FFFE0D4.
+    J-Link commands for loading and starting FRAM-erase application on target - completion is polled separately.
+    Returns: (list of commands, name of FRAM-erase app - see 'FRAM_ERASE_APP_DONE')
     """
-    FRAM_ERASE_JLINK_CMD_FILE = "FRAM_erase.tmp.jlink"
-    # 
-    mcu_type = JLINK_TARGET_OPTIONS[JLINK_TARGET_MCU_OPTION_IDX]
     # Settings dependent on rev.AA or rev.AB platform:
     if IRRIGATION_SENSOR_REV_AA_MCU == mcu_type:
+        fram_erase_app_name = IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_SREC_NAME
         FRAM_ERASE_APP_SREC = resource_path(IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_SREC_NAME)      
         FRAM_ERASE_APP_START_ADDR = IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_START_ADDR    # NOTE: to start application correct, as it is loaded into SRAM (=won't start automatically after a Reset)!
     elif IRRIGATION_SENSOR_REV_AB_MCU == mcu_type:
         # FRAM_ERASE_APP_SREC = resource_path(IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_SREC_NAME)      
         # FRAM_ERASE_APP_START_ADDR = IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_START_ADDR    
         # For now, we need a work-around for fixing FRAM - run app from flash!
+        fram_erase_app_name = IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_FLASH_SREC_NAME
         FRAM_ERASE_APP_SREC = IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_FLASH_SREC_NAME
     else:
         print("ERROR: no valid MCU-type specified! Just assuming sensor-type is 'AA' when trying to erase FRAM ...")
+        fram_erase_app_name = IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_SREC_NAME
         FRAM_ERASE_APP_SREC = resource_path(IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_SREC_NAME)      
         FRAM_ERASE_APP_START_ADDR = IRRIGATION_SENSOR_REV_AA_FRAM_ERASE_APP_START_ADDR     
     #
-    with open(FRAM_ERASE_JLINK_CMD_FILE, 'w') as fp:
-        fp.write("unlock Kinetis\n")                            # NOTE: needed if device is programmed 1st time!
-        fp.write("r\n")                                        # Reset + Halt
-        fp.write(f"loadfile {FRAM_ERASE_APP_SREC}\n")
-        if IRRIGATION_SENSOR_REV_AB_MCU == mcu_type:
-            # Work-around for AB for the time being (problem running from SRAM) - Flas executable is luckily for us smaller than boot-sector!
-            pass
-        else:
-            fp.write(f"setpc {hex(FRAM_ERASE_APP_START_ADDR)}\n")
-        fp.write("g\n")             # Start the app ...
-        fp.write("sleep 6000\n")    # Must ensure we sleep at least 5sec to allow erase-app to run to finish!
-        fp.write("q\n")
-    # Need to sleep at least 5sec to allow FRAM-erase process to complete.
-    # TODO: check when erase-app has finished blanking FRAM!
-    #  (but, tricky without serial port connection ...)
-    # TODO: also determine end result of FRAM-erase (PASS or FAIL)!
-    cmd_status, jlink_output = run_jlink_cmd_file(FRAM_ERASE_JLINK_CMD_FILE)
-    # Remove file if specified:
-    if cleanup:
-        try:
-            os.remove(FRAM_ERASE_JLINK_CMD_FILE)
-        except OSError:
-            pass
+    cmds = ["unlock Kinetis",                          # NOTE: needed if device is programmed 1st time!
+            "r",                                       # Reset + Halt
+            f"loadfile {FRAM_ERASE_APP_SREC}"]
+    if IRRIGATION_SENSOR_REV_AB_MCU == mcu_type:
+        # Work-around for AB for the time being (problem running from SRAM) - Flas executable is luckily for us smaller than boot-sector!
+        pass
+    else:
+        cmds.append(f"setpc {hex(FRAM_ERASE_APP_START_ADDR)}")
+    cmds.append("g")             # Start the app ...
+    #
+    return cmds, fram_erase_app_name
+
+
+@traced()
+def poll_fram_erase(session, fram_erase_app_name, timeout=FRAM_ERASE_TIMEOUT):
+    """
+    Wait for FRAM-erase app to finish (in running J-Link session) - instead of a fixed 6sec sleep.
+    Target is halted every 'FRAM_ERASE_POLL_INTERVAL': the app has finished once PC is in its final idle loop,
+    and its 'FRAM is blank' flag is then read - see 'FRAM_ERASE_APP_DONE'. Otherwise the app is resumed.
+    Returns: True if PASS, False if FAIL - or if app not finished within 'timeout' (erase result unknown).
+    """
+    done_loop_addr, flag_reg, flag_ofs = FRAM_ERASE_APP_DONE[fram_erase_app_name]
+    t_start = time.monotonic()
+    while time.monotonic() - t_start < timeout:
+        time.sleep(FRAM_ERASE_POLL_INTERVAL)
+        status, output = session.run_cmds_parsed(["h"])
+        if not session.connected:
+            break
+        if status and output.registers.get('PC') in (done_loop_addr, done_loop_addr + 2) and flag_reg in output.registers:
+            flag_addr = output.registers[flag_reg] + flag_ofs
+            flag_word = session.read_mem32(flag_addr & ~0x3)
+            if flag_word is None:
+                print("FAIL: FRAM-erase app finished, but its result could not be read!!", flush=True)
+                return False
+            if (flag_word >> (8 * (flag_addr & 0x3))) & 0xFF:
+                print(f"PASS: FRAM erased after {time.monotonic() - t_start:.1f} sec.", flush=True)
+                return True
+            print("FAIL: FRAM-erase app reports FRAM is NOT blank!!", flush=True)
+            return False
+        session.run_cmds(["g"])     # Not finished yet - resume app
+    print(f"FAIL: FRAM-erase app not finished within {timeout} sec - FRAM erase result UNKNOWN!!", flush=True)
+    return False
+
+
+@traced()
+def vv_fram_erase(cleanup=True, verbose=True, debug=False, jlink_options=None, timeout=FRAM_ERASE_TIMEOUT):
+    """
+    Erase FRAM on irrigation-sensor target (VV).
+    Note that erase-application START-address is NOT equal to RAM-startaddr!
+    Instead, the 'ResetISR' symbol is located 212 bytes ABOVE the vector table, at addr=0x1FFFE0D4.
+    The erase-app is polled until it has finished (or 'timeout' expires) - see 'poll_fram_erase()'.
+    """
+    if jlink_options is None:
+        jlink_options = JLINK_TARGET_OPTIONS
+    # 
+    mcu_type = jlink_options[JLINK_TARGET_MCU_OPTION_IDX]
+    cmds, fram_erase_app_name = get_fram_erase_cmds(mcu_type)
+    with JLinkSession(resource_path(JLINK_EXE_FILE), jlink_options, verbose=verbose) as session:
+        cmd_status, jlink_output = session.run_cmds(cmds)
+        if cmd_status:
+            cmd_status = poll_fram_erase(session, fram_erase_app_name, timeout)
     #
     return cmd_status, jlink_output
 
 
 # ********************* Flash prog tasks **********************
 
-def fw_prepare_target(erase=True, keep_serno=False, serial=0, cleanup=True, verbose=True, debug=False):
+@traced()
+def fw_prepare_target(erase=True, keep_serno=False, serial=0, cleanup=True, verbose=True, debug=False,
+                      jlink_options=None):
     status = False
     serial_num_read = 0
-    mcu_type = JLINK_TARGET_OPTIONS[JLINK_TARGET_MCU_OPTION_IDX]
+    if jlink_options is None:
+        jlink_options = JLINK_TARGET_OPTIONS
+    pre_tasks_cmd_file = get_tmp_cmd_file(PRE_TASKS_CMD_FILE)
+    mcu_type = jlink_options[JLINK_TARGET_MCU_OPTION_IDX]
     # Determine MCU-type from sensor-type:
     if IRRIGATION_SENSOR_REV_AA_MCU == mcu_type:
         config_sector_offset_addr = IRRIGATION_SENSOR_REV_AA_CONFIG_START
@@ -193,7 +316,7 @@ def fw_prepare_target(erase=True, keep_serno=False, serial=0, cleanup=True, verb
     # INFO:
     print(f"INFO: using 0x{config_sector_offset_addr:08X} for CONFIG-sector START-adress.")
     #
-    with open(PRE_TASKS_CMD_FILE, 'w') as fp:
+    with open(pre_tasks_cmd_file, 'w') as fp:
         fp.write("halt\n")
         fp.write("r\n")
         # If required, ERASE target ...
@@ -204,7 +327,7 @@ def fw_prepare_target(erase=True, keep_serno=False, serial=0, cleanup=True, verb
         fp.write(f"w4 0x{config_sector_offset_addr:X} 0x00000001\n")  # Set image-number=1
         # Default write given serial number into config-sector in Flash:
         if not keep_serno:
-            if serial in range(1, 65355):
+            if SERIAL_NUMBER_FIRST <= serial <= SERIAL_NUMBER_LAST:
                 fp.write(f"w4 0x{config_sector_offset_addr + CONFIG_SECTOR_SERIALNO_OFFSET:X} " + hex(serial) + "\n")  # Set serial number
             else:
                 print(f"Serial number = {serial} is OUT OF RANGE! Cannot use ...")
@@ -214,20 +337,21 @@ def fw_prepare_target(erase=True, keep_serno=False, serial=0, cleanup=True, verb
         fp.write("q\n")
     # Run JLink w. file input:
     if not debug:
-        cmd_status, jlink_output = run_jlink_cmd_file(PRE_TASKS_CMD_FILE)
+        cmd_status, jlink_output = run_jlink_cmd_file(pre_tasks_cmd_file, jlink_options=jlink_options)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(PRE_TASKS_CMD_FILE)
+            os.remove(pre_tasks_cmd_file)
         except OSError:
             pass
     #
     if cmd_status:
         # Verify image number:
-        status = verify_image_number(out_text=jlink_output)
+        status = verify_image_number(out_text=jlink_output, jlink_options=jlink_options)
         # Verify serial number:
         do_serno_verification = not keep_serno
-        serno_status, serial_num_read = verify_serial_number(out_text=jlink_output, verify=do_serno_verification, serial=serial)
+        serno_status, serial_num_read = verify_serial_number(out_text=jlink_output, verify=do_serno_verification,
+                                                             serial=serial, jlink_options=jlink_options)
         if not keep_serno:
             status = status and serno_status
         else:
@@ -237,125 +361,442 @@ def fw_prepare_target(erase=True, keep_serno=False, serial=0, cleanup=True, verb
     return status, serial_num_read
 
 
-def run_fw_programming(fw_type, cleanup=True, debug=False):
+def get_config_sector_addr(mcu_type):
+    if IRRIGATION_SENSOR_REV_AA_MCU == mcu_type:
+        return IRRIGATION_SENSOR_REV_AA_CONFIG_START
+    elif IRRIGATION_SENSOR_REV_AB_MCU == mcu_type:
+        return IRRIGATION_SENSOR_REV_AB_CONFIG_START
+    print("ERROR: no valid MCU-type specified! Just assuming sensor-type is 'AA' ...")
+    return IRRIGATION_SENSOR_REV_AA_CONFIG_START
+
+
+def get_flash_sector_size(mcu_type):
+    if IRRIGATION_SENSOR_REV_AB_MCU == mcu_type:
+        return IRRIGATION_SENSOR_REV_AB_FLASH_SECTOR_SIZE
+    return IRRIGATION_SENSOR_REV_AA_FLASH_SECTOR_SIZE
+
+
+def get_fw_srec_files(path, fw_type):
+    """ SREC files to program for given FW-type (FW1, FW2, bootloader - in that order). Missing files are skipped. """
+    srec_files = []
+    # Fill in step for FW1 if relevant:
+    if fw_type == '1' or fw_type == 'all':
+        fw1_srec = os.path.join(path, FW1_SREC_NAME)
+        if not os.path.exists(fw1_srec):
+            print(f"Could not write FW1 to Flash memory - SREC file '{fw1_srec}' missing!",
+                  flush=True)
+        else:
+            print(f"Writing FW1 firmware '{fw1_srec}' to boot Flash memory ...", flush=True)
+            srec_files.append(fw1_srec)
+    # Fill in step for FW2 if relevant:
+    if fw_type == '2' or fw_type == 'all':
+        fw2_srec = os.path.join(path, FW2_SREC_NAME)
+        if not os.path.exists(fw2_srec):
+            print(f"Could not write FW2 to Flash memory - SREC file '{fw2_srec}' missing!", flush=True)
+        else:
+            print(f"Writing FW2 firmware '{fw2_srec}' to boot Flash memory ...", flush=True)
+            srec_files.append(fw2_srec)
+    # Fill in step for BootLoader if relevant:
+    if fw_type == 'bl' or fw_type == 'all':
+        bootloader_srec = os.path.join(path, BOOTLOADER_SREC_NAME)
+        if not os.path.exists(bootloader_srec):
+            print(f"Could not write bootloader to Flash memory - SREC file '{bootloader_srec}' missing!", flush=True)
+        else:
+            print(f"Writing bootloader firmware '{bootloader_srec}' to boot Flash memory ...", flush=True)
+            srec_files.append(bootloader_srec)
+    #
+    return srec_files
+
+
+@traced()
+def preflight_check_images(path, fw_type, fram_erase, erase, mcu_type):
+    """
+    Check address ranges of all images for a board - before any board is programmed.
+    Firmware images (FW1, FW2, bootloader) must be within Flash, and must not overlap each other or the CONFIG-sector.
+    A FRAM-erase app loaded into Flash ('AB') is removed by mass erase only - w/o erase, parts of it
+    not overwritten by firmware are reported.
+    Returns: True if no errors
+    """
+    status = True
+    index = AddressIndex()
+    config_sector_addr = get_config_sector_addr(mcu_type)
+    index.add_range(config_sector_addr, config_sector_addr + get_flash_sector_size(mcu_type), "CONFIG")
+    fw_labels = []
+    for label, srec_name, fw_types in (("FW1", FW1_SREC_NAME, ('1', 'all')), ("FW2", FW2_SREC_NAME, ('2', 'all')),
+                                       ("bootloader", BOOTLOADER_SREC_NAME, ('bl', 'all'))):
+        srec_file = os.path.join(path, srec_name)
+        if fw_type in fw_types and os.path.exists(srec_file):
+            segments = index.add_image(srec_file, label)
+            fw_labels.append(label)
+            print(f"Preflight: {label} at " + ", ".join(f"0x{start:05X}-0x{end - 1:05X}" for start, end in segments),
+                  flush=True)
+    fram_erase_segments = []
+    if fram_erase and mcu_type == IRRIGATION_SENSOR_REV_AB_MCU:
+        fram_erase_segments = index.add_image(resource_path(IRRIGATION_SENSOR_REV_AB_FRAM_ERASE_APP_FLASH_SREC_NAME),
+                                              "FRAM eraser")
+    # FRAM-erase app runs (and is overwritten) before firmware is programmed - it may overlap anything:
+    for label, other_label, start, end in index.find_conflicts():
+        if "FRAM eraser" not in (label, other_label):
+            print(f"PREFLIGHT ERROR: {label} and {other_label} overlap at 0x{start:05X}-0x{end - 1:05X}!", flush=True)
+            status = False
+    for start, end, label in index.overlaps(IRRIGATION_SENSOR_FLASH_SIZE, 1 << 32):
+        if label in fw_labels:
+            print(f"PREFLIGHT ERROR: {label} is outside Flash (0x{start:X}-0x{end - 1:X})!", flush=True)
+            status = False
+    if not erase:
+        for seg_start, seg_end in fram_erase_segments:
+            for start, end in index.gaps(seg_start, seg_end, labels=fw_labels):
+                print(f"PREFLIGHT WARNING: FRAM-erase app stays in Flash at 0x{start:05X}-0x{end - 1:05X} "
+                      f"(no mass erase, no firmware there)!", flush=True)
+    #
+    return status
+
+
+@traced()
+def run_fw_programming(fw_type, cleanup=True, debug=False, jlink_options=None, path=None):
+    if path is None:
+        path = srec_path
+    fw_prog_cmd_file = get_tmp_cmd_file(FW_PROG_CMD_FILE)
     #
     # Commit action:
-    with open(FW_PROG_CMD_FILE, 'w') as fp:
+    with open(fw_prog_cmd_file, 'w') as fp:
         fp.write("halt\n")
         # fp.write("r\n")
-        # Fill in step for FW1 if relevant:
-        if fw_type == '1' or fw_type == 'all':
-            fw1_srec = os.path.join(srec_path, "IrrigationSensorAppl_FW1.srec")
-            if not os.path.exists(fw1_srec):
-                print(f"Could not write FW1 to Flash memory - SREC file '{fw1_srec}' missing!",
-                      flush=True)
-            else:
-                print(f"Writing FW1 firmware '{fw1_srec}' to boot Flash memory ...", flush=True)
-                fp.write("loadfile %s\n" % fw1_srec)
-        # Fill in step for FW2 if relevant:
-        if fw_type == '2' or fw_type == 'all':
-            fw2_srec = os.path.join(srec_path, "IrrigationSensorAppl_FW2.srec")
-            if not os.path.exists(fw2_srec):
-                print(f"Could not write FW2 to Flash memory - SREC file '{fw1_srec}' missing!", flush=True)
-            else:
-                print(f"Writing FW2 firmware '{fw2_srec}' to boot Flash memory ...", flush=True)
-                fp.write("loadfile %s\n" % fw2_srec)
-        # Fill in step for BootLoader if relevant:
-        if fw_type == 'bl' or fw_type == 'all':
-            bootloader_srec = os.path.join(srec_path, "IrrigationSensorBootld.srec")
-            if not os.path.exists(bootloader_srec):
-                print(f"Could not write bootloader to Flash memory - SREC file '{bootloader_srec}' missing!", flush=True)
-            else:
-                print(f"Writing bootloader firmware '{bootloader_srec}' to boot Flash memory ...", flush=True)
-                fp.write("loadfile %s\n" % bootloader_srec)
-
+        for srec_file in get_fw_srec_files(path, fw_type):
+            fp.write("loadfile %s\n" % srec_file)
         # Finalize:
         fp.write("rnh\n")
         fp.write("qc\n")
     # Run J-Link command scriptfile:
-    status, jlink_output = run_jlink_cmd_file(FW_PROG_CMD_FILE)
+    status, jlink_output = run_jlink_cmd_file(fw_prog_cmd_file, jlink_options=jlink_options)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(FW_PROG_CMD_FILE)
+            os.remove(fw_prog_cmd_file)
         except OSError:
             pass
     #
     return status
 
 
+# ******************** Single-pass programming plan ***********************
+
+JLINK_PLAN_POLL_FRAM_ERASE = "<poll FRAM-erase app>"        # Pseudo-command - wait for FRAM-erase app to finish
+JLINK_PLAN_PROGRAM_IF_CHANGED = "<program if changed>"      # Pseudo-command - 'verifybin', then 'loadbin' only on mismatch
+JLINK_PLAN_VERIFY_SECTOR = "<verify sector>"                # Pseudo-command - 'verifybin' (readback), mismatch is recorded as failure
+
+
+@traced()
+def plan_board_programming(path, serial, fw_type, fram_erase, erase, mcu_type, use_image_cache=True,
+                           differential=False, verify=False, board_dir=None):
+    """
+    Merge all programming steps (FRAM erase, CONFIG-sector prep, Flash programming) into one command stream
+    for a single J-Link session: one connect, resets merged, no redundant halts.
+    With 'use_image_cache', firmware is loaded as pre-parsed binary segments ('loadbin') instead of SREC text.
+    With 'differential', firmware is compared sector-by-sector against target Flash (J-Link readback), and only
+    differing sectors are programmed (no mass erase - unchanged sectors are neither erased nor re-written).
+    NOTE: the host-side sector CRCs only identify sector contents in the plan - there is no target-side digest.
+    With 'verify', the complete firmware is read back sector-by-sector after programming ('verifybin') and
+    compared by J-Link - a full Flash readback, the CRCs in the comments are only labels.
+    With 'board_dir', CONFIG-sector values are merged into a per-board copy of the (first) firmware image,
+    written to 'board_dir' - so they are programmed and verified along w. the firmware ('w4' writes are skipped).
+    Returns: list of (command, comment) - printable as dry-run.
+    """
+    plan = []
+    unlocked = False
+    if fram_erase:
+        fram_cmds, fram_erase_app_name = get_fram_erase_cmds(mcu_type)
+        plan.extend((cmd, "FRAM erase") for cmd in fram_cmds)
+        plan.append((JLINK_PLAN_POLL_FRAM_ERASE + " " + fram_erase_app_name, "FRAM erase: wait for completion"))
+        unlocked = True
+    # A single reset(+halt) stops the FRAM-erase app (if any) - a separate 'halt' is redundant:
+    plan.append(("r", "Reset + Halt"))
+    if erase and differential:
+        print("NOTE: differential programming - Flash mass erase is skipped!", flush=True)
+    elif erase:
+        if not unlocked:
+            plan.append(("unlock Kinetis", "Needed if device is programmed 1st time!"))
+        plan.append(("erase", "Erase Flash"))
+    # CONFIG-sector:
+    config_sector_offset_addr = get_config_sector_addr(mcu_type)
+    serial_valid = SERIAL_NUMBER_FIRST <= serial <= SERIAL_NUMBER_LAST
+    if not serial_valid:
+        print(f"Serial number = {serial} is OUT OF RANGE! Cannot use ...")
+    srec_files = get_fw_srec_files(path, fw_type)
+    patched_srec_file = None
+    if board_dir is not None and srec_files:
+        config_patches = get_config_sector_patches(config_sector_offset_addr, image_num=1,
+                                                   serial=serial if serial_valid else None)
+        srec_name, srec_ext = os.path.splitext(os.path.basename(srec_files[0]))
+        patched_srec_file = patch_srec_file(srec_files[0], config_patches,
+                                            os.path.join(board_dir, f"{srec_name}_serial{serial}{srec_ext}"))
+        srec_files[0] = patched_srec_file
+    else:
+        plan.append((f"w4 0x{config_sector_offset_addr:X} 0x00000001", "Set image-number=1"))
+        if serial_valid:
+            plan.append((f"w4 0x{config_sector_offset_addr + CONFIG_SECTOR_SERIALNO_OFFSET:X} " + hex(serial),
+                         "Set serial number"))
+    # Firmware - per-board image is cached in 'board_dir' (not in shared image cache):
+    for srec_file in srec_files:
+        cache_dir = board_dir if srec_file == patched_srec_file else None
+        if differential:
+            sectors = cache_srec_sectors(srec_file, get_flash_sector_size(mcu_type), cache_dir)
+            plan.extend((f"{JLINK_PLAN_PROGRAM_IF_CHANGED} {bin_file},0x{addr:X}",
+                         f"Program sector if changed ({os.path.basename(srec_file)}, host CRC=0x{crc:04X})")
+                        for addr, size, bin_file, crc in sectors)
+        elif use_image_cache:
+            plan.extend((cmd, f"Program Flash ({os.path.basename(srec_file)}, cached)")
+                        for cmd in get_loadbin_cmds(srec_file, cache_dir))
+        else:
+            plan.append((f"loadfile {srec_file}", "Program Flash"))
+    # CONFIG-sector readback - after firmware, as CONFIG-sector may be part of (per-board) firmware image:
+    plan.append((f"mem32 0x{config_sector_offset_addr:X},1", "Readback image-number"))
+    plan.append((f"mem32 0x{config_sector_offset_addr + CONFIG_SECTOR_SERIALNO_OFFSET:X},1", "Readback serial number"))
+    if verify:
+        for srec_file in srec_files:
+            cache_dir = board_dir if srec_file == patched_srec_file else None
+            plan.extend((f"{JLINK_PLAN_VERIFY_SECTOR} {bin_file},0x{addr:X}",
+                         f"Readback + compare sector ({os.path.basename(srec_file)}, host CRC=0x{crc:04X})")
+                        for addr, size, bin_file, crc in cache_srec_sectors(srec_file, get_flash_sector_size(mcu_type),
+                                                                            cache_dir))
+    plan.append(("rnh", "Reset - no halt (start bootloader)"))
+    #
+    return plan
+
+
+def print_board_plan(plan):
+    print("J-Link command plan:", flush=True)
+    print("--------------------", flush=True)
+    for cmd, comment in plan:
+        print(f"  {cmd:<60} # {comment}", flush=True)
+
+
+def verify_sector(session, bin_file, addr):
+    """
+    Compare binary file against target memory at 'addr' - by J-Link ('verifybin'), which reads the memory back
+    over SWD. This is a full readback of the sector (not a digest) - but reading is much faster than erase + write.
+    Returns: True if target memory matches
+    """
+    status, lines_out = session.run_cmds([f"verifybin {bin_file},0x{addr:X}"])
+    return status and any(line.startswith("Verify successful") for line in lines_out)
+
+
+def program_if_changed(session, bin_file, addr):
+    """
+    Compare binary file against target memory at 'addr' (readback - see 'verify_sector()'),
+    and program it only if different. Unchanged sectors are neither erased nor re-written.
+    Returns: (status, programmed)
+    """
+    if verify_sector(session, bin_file, addr):
+        return True, False
+    status, _ = session.run_cmds([f"loadbin {bin_file},0x{addr:X}"])
+    return status, True
+
+
+@traced()
+def run_board_plan(plan, serial, jlink_options, verbose=True):
+    """ Run programming plan in one J-Link session - then verify CONFIG-sector readback. """
+    status = True
+    jlink_output = JLinkOutput()
+    num_sectors_programmed = 0
+    num_sectors_skipped = 0
+    verify_failures = []
+    num_sectors_verified = 0
+    with JLinkSession(resource_path(JLINK_EXE_FILE), jlink_options, verbose=verbose) as session:
+        for cmd, comment in plan:
+            if cmd.startswith(JLINK_PLAN_POLL_FRAM_ERASE):
+                status = poll_fram_erase(session, cmd.split()[-1]) and status
+                continue
+            if cmd.startswith(JLINK_PLAN_PROGRAM_IF_CHANGED):
+                bin_file, addr = cmd[len(JLINK_PLAN_PROGRAM_IF_CHANGED):].strip().rsplit(',', 1)
+                cmd_status, programmed = program_if_changed(session, bin_file, int(addr, 16))
+                if not cmd_status:
+                    print(f"ERROR: programming of sector at {addr} ({comment}) failed!", flush=True)
+                    return False
+                if programmed:
+                    num_sectors_programmed += 1
+                else:
+                    num_sectors_skipped += 1
+                continue
+            if cmd.startswith(JLINK_PLAN_VERIFY_SECTOR):
+                bin_file, addr = cmd[len(JLINK_PLAN_VERIFY_SECTOR):].strip().rsplit(',', 1)
+                num_sectors_verified += 1
+                if not verify_sector(session, bin_file, int(addr, 16)):
+                    verify_failures.append((addr, comment))
+                continue
+            cmd_status, _ = session.run_cmds_parsed([cmd], jlink_output)
+            if not cmd_status:
+                print(f"ERROR: J-Link command '{cmd}' ({comment}) failed!", flush=True)
+                return False
+    if num_sectors_programmed or num_sectors_skipped:
+        print(f"Differential programming: {num_sectors_programmed} sector(s) programmed, "
+              f"{num_sectors_skipped} unchanged sector(s) skipped.", flush=True)
+    if num_sectors_verified:
+        print(f"Firmware verification (readback): {num_sectors_verified - len(verify_failures)} of {num_sectors_verified} "
+              f"sector(s) OK.", flush=True)
+        for addr, comment in verify_failures:
+            print(f"ERROR: sector at {addr} does NOT match firmware! ({comment})", flush=True)
+        status = status and not verify_failures
+    #
+    status = verify_image_number(out_text=jlink_output, jlink_options=jlink_options) and status
+    serno_status, _ = verify_serial_number(out_text=jlink_output, serial=serial, jlink_options=jlink_options)
+    #
+    return status and serno_status
+
+
 # ******************** FW verification ***********************************
 
-def verify_image_number(out_text=None, img_num=1, verbose=True):
+@traced()
+def verify_image_number(out_text=None, img_num=1, verbose=True, jlink_options=None):
     status = False
-    mcu_type = JLINK_TARGET_OPTIONS[JLINK_TARGET_MCU_OPTION_IDX]
+    if jlink_options is None:
+        jlink_options = JLINK_TARGET_OPTIONS
+    mcu_type = jlink_options[JLINK_TARGET_MCU_OPTION_IDX]
     # Determine MCU-type from sensor-type:
     if IRRIGATION_SENSOR_REV_AA_MCU == mcu_type:
-        IMAGE_NUM_FLASH_ADDR = f"{IRRIGATION_SENSOR_REV_AA_CONFIG_START:08X}"
+        IMAGE_NUM_FLASH_ADDR = IRRIGATION_SENSOR_REV_AA_CONFIG_START
     elif IRRIGATION_SENSOR_REV_AB_MCU == mcu_type:
-        IMAGE_NUM_FLASH_ADDR = f"{IRRIGATION_SENSOR_REV_AB_CONFIG_START:08X}"
+        IMAGE_NUM_FLASH_ADDR = IRRIGATION_SENSOR_REV_AB_CONFIG_START
     else:
         print("ERROR: no valid MCU-type specified! Just assuming sensor-type is 'AA' ...")
-        IMAGE_NUM_FLASH_ADDR = f"{IRRIGATION_SENSOR_REV_AA_CONFIG_START:08X}"
+        IMAGE_NUM_FLASH_ADDR = IRRIGATION_SENSOR_REV_AA_CONFIG_START
+    # Output lines (if not already parsed) are parsed once - readback values are then looked up by address:
+    if not isinstance(out_text, JLinkOutput):
+        out_text = parse_jlink_output(out_text)
     #
     print("")
     print("Output analysis:", flush=True)
     print("---------------------", flush=True)
-    for line in out_text:
-        if line.startswith(IMAGE_NUM_FLASH_ADDR):
-            addr_content = line.split('=')[-1]      # First field is address, last field is value
-            print(f"Content of address {IMAGE_NUM_FLASH_ADDR} = {addr_content}", flush=True)
-            try:
-                val = int(addr_content, 16)
-                if val == img_num:
-                    print(f"Readback-value={val} is equal to expected(={img_num}).", flush=True)
-                    status = True
-                else:
-                    print(f"Readback-value={val} is equal to expected(={img_num}).", flush=True)
-            except ValueError:
-                print(f"{addr_content} is not a valid HEX-string!", flush=True)
+    val = out_text.mem32.get(IMAGE_NUM_FLASH_ADDR)
+    if val is not None:
+        print(f"Content of address {IMAGE_NUM_FLASH_ADDR:08X} = {val:08X}", flush=True)
+        if val == img_num:
+            print(f"Readback-value={val} is equal to expected(={img_num}).", flush=True)
+            status = True
+        else:
+            print(f"Readback-value={val} is NOT equal to expected(={img_num})!!", flush=True)
     #
     return status
 
 
-def verify_serial_number(out_text=None, verify=True, serial=0, verbose=True):
+@traced()
+def verify_serial_number(out_text=None, verify=True, serial=0, verbose=True, jlink_options=None):
     status = False
     readout = serial
-    mcu_type = JLINK_TARGET_OPTIONS[JLINK_TARGET_MCU_OPTION_IDX]
+    if jlink_options is None:
+        jlink_options = JLINK_TARGET_OPTIONS
+    mcu_type = jlink_options[JLINK_TARGET_MCU_OPTION_IDX]
     # Determine MCU-type from sensor-type:
     if IRRIGATION_SENSOR_REV_AA_MCU == mcu_type:
-        SER_NUM_FLASH_ADDR = f"{IRRIGATION_SENSOR_REV_AA_CONFIG_START + CONFIG_SECTOR_SERIALNO_OFFSET:08X}"
+        SER_NUM_FLASH_ADDR = IRRIGATION_SENSOR_REV_AA_CONFIG_START + CONFIG_SECTOR_SERIALNO_OFFSET
     elif IRRIGATION_SENSOR_REV_AB_MCU == mcu_type:
-        SER_NUM_FLASH_ADDR = f"{IRRIGATION_SENSOR_REV_AB_CONFIG_START + CONFIG_SECTOR_SERIALNO_OFFSET:08X}"
+        SER_NUM_FLASH_ADDR = IRRIGATION_SENSOR_REV_AB_CONFIG_START + CONFIG_SECTOR_SERIALNO_OFFSET
     else:
         print("ERROR: no valid MCU-type specified! Just assuming sensor-type is 'AA' ...")
-        SER_NUM_FLASH_ADDR = f"{IRRIGATION_SENSOR_REV_AA_CONFIG_START + CONFIG_SECTOR_SERIALNO_OFFSET:08X}"
+        SER_NUM_FLASH_ADDR = IRRIGATION_SENSOR_REV_AA_CONFIG_START + CONFIG_SECTOR_SERIALNO_OFFSET
+    if not isinstance(out_text, JLinkOutput):
+        out_text = parse_jlink_output(out_text)
     #
     print("")
     print("Output analysis:", flush=True)
     print("---------------------", flush=True)
-    for line in out_text:
-        if line.startswith(SER_NUM_FLASH_ADDR):
-            addr_content = line.split('=')[-1]  # First field is address, last field is value
-            print("Content of address %s = %s" % (SER_NUM_FLASH_ADDR, addr_content))
-            try:
-                val = int(addr_content, 16)
-                if val == serial and 0 != serial:
-                    print(f"Readback serno={val} is equal to expected(={serial}).", flush=True)
-                    status = True
-                else:
-                    if verify:
-                        print(f"Readback serno={val} is NOT equal to expected(={serial})!!", flush=True)
-                    else:
-                        status = True
-                # Readback value:
-                readout = val
-            except ValueError:
-                print(f"{addr_content} is not a valid HEX-string!", flush=True)
+    val = out_text.mem32.get(SER_NUM_FLASH_ADDR)
+    if val is not None:
+        print(f"Content of address {SER_NUM_FLASH_ADDR:08X} = {val:08X}", flush=True)
+        if val == serial and 0 != serial:
+            print(f"Readback serno={val} is equal to expected(={serial}).", flush=True)
+            status = True
+        else:
+            if verify:
+                print(f"Readback serno={val} is NOT equal to expected(={serial})!!", flush=True)
+            else:
+                status = True
+        # Readback value:
+        readout = val
     #
     return status, readout
 
 
+# ******************** Board programming *********************************
+
+@traced()
+def program_board(path, serial, fw_type, fram_erase, erase, mcu_type, probe_sn=None, single_pass=True, dry_run=False,
+                  use_image_cache=True, differential=False, verify=False, patch_config=False):
+    """
+    Run all programming steps (FRAM erase, CONFIG-sector prep and Flash programming) on one board.
+    J-Link options are passed to every step (no global state), so boards on different probes can be programmed in parallel.
+    By default, all steps run as one merged command stream in a single J-Link session ('dry_run' only prints it).
+    With 'patch_config', CONFIG-sector values are programmed as part of a per-board firmware image.
+    Returns: (probe_sn, serial, status)
+    """
+    jlink_options = get_jlink_target_options(mcu_type, probe_sn)
+    t_start = time.monotonic()
+    if single_pass:
+        board_dir = tempfile.mkdtemp(prefix="board_", dir=JLINK_CMD_FILE_DIR) if patch_config else None
+        try:
+            plan = plan_board_programming(path, serial, fw_type, fram_erase, erase, mcu_type, use_image_cache,
+                                          differential, verify, board_dir)
+            print_board_plan(plan)
+            if dry_run:
+                return probe_sn, serial, True
+            total_status = run_board_plan(plan, serial, jlink_options)
+        finally:
+            if board_dir is not None:
+                shutil.rmtree(board_dir, ignore_errors=True)
+        print(f"Board programmed in {time.monotonic() - t_start:.1f} sec.", flush=True)
+        return probe_sn, serial, total_status
+    # Erase FRAM memory on sensor *first* - before doing a full erase of Flash etc.
+    if fram_erase:
+        # Task will wait (until FRAM-eraser application reports completion) to allow it to run on target ....
+        print("FRAM erase: waiting for FRAM on target to be erased ...", flush=True)
+        fram_status, _ = vv_fram_erase(jlink_options=jlink_options)
+        print("FRAM erase finished - continuing ...", flush=True)
+    else:
+        fram_status = True
+    #
+    # Test only example:
+    # ret_val = run_fw_programming(fw_type, serial_num, erase_flash_first, cleanup=False, debug=True)
+    # Non-test environment:
+    config_status, _ = fw_prepare_target(erase=erase, keep_serno=False, serial=serial, jlink_options=jlink_options)
+    fw_prog_status = run_fw_programming(fw_type=fw_type, jlink_options=jlink_options, path=path)
+    #
+    total_status = config_status and fw_prog_status and fram_status
+    print(f"Board programmed in {time.monotonic() - t_start:.1f} sec.", flush=True)
+    #
+    return probe_sn, serial, total_status
+
+
+def print_trace_summary(trace_file, t_start):
+    """ Total time per stage (all boards), for stages started after 't_start' - slowest first. """
+    events = [event for event in read_trace(trace_file) if event['start'] >= t_start]
+    print("Timing per stage (all boards):", flush=True)
+    for name, (num_calls, seconds, num_failed) in sorted(get_stage_summary(events).items(), key=lambda item: -item[1][1]):
+        failed_info = f", {num_failed} FAILED" if num_failed else ""
+        print(f"  {name:28s} {num_calls:4d} call(s) {seconds:7.2f} sec{failed_info}", flush=True)
+
+
+@traced()
+def run_gang_programming(path, probe_sns, serials, fw_type, fram_erase, erase, mcu_type, max_workers=None,
+                         dry_run=False, differential=False, verify=False, patch_config=False):
+    """
+    Gang programming - one board per J-Link probe (selected by probe serial number), all probes in parallel.
+    Each worker process gets its own board serial number from 'serials'.
+    Returns: list of (probe_sn, serial, status) - in same order as 'probe_sns'.
+    """
+    if len(serials) < len(probe_sns):
+        raise Exception(f"Need one serial number per probe - got {len(serials)} serial numbers for {len(probe_sns)} probes!")
+    if max_workers is None:
+        max_workers = len(probe_sns)
+    #
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        jobs = [pool.submit(program_board, path, serial, fw_type, fram_erase, erase, mcu_type, probe_sn, dry_run=dry_run,
+                            differential=differential, verify=verify, patch_config=patch_config)
+                for probe_sn, serial in zip(probe_sns, serials)]
+        results = [job.result() for job in jobs]
+    #
+    return results
+
+
 # ******************** Generic stuff *************************************
 
 # ------------------------------ Click setup -------------------------------
@@ -381,20 +822,54 @@ def verify_serial_number(out_text=None, verify=True, serial=0, verbose=True):
               type=click.Choice(['AA', 'AB']),
               default='all',
               help="IrrigationSensor type. Set to 'AA' if rev.A HW-platform, set to 'AB' if rev.B HW-platform(w. pressure-sensor interface).")
+@click.option("--probes",
+              type=str,
+              default="",
+              help="Gang programming: comma-separated J-Link serial numbers - boards get serial numbers 'serial', 'serial'+1, ... (empty = single probe)")
+@click.option('--dry_run/--no_dry_run',
+              default=False,
+              help="Only print the J-Link command plan for each board - do not program")
+@click.option('--differential/--no_differential',
+              default=False,
+              help="Re-programming: only erase+program Flash sectors that differ from firmware (implies no Flash mass erase)")
+@click.option('--verify/--no_verify',
+              default=False,
+              help="Verify complete firmware after programming (J-Link reads every Flash sector back and compares it)")
+@click.option('--patch_config/--no_patch_config',
+              default=False,
+              help="Program CONFIG-sector (image-number, serial) as part of a per-board firmware image - no separate writes")
+@click.option('--auto_serial/--no_auto_serial',
+              default=False,
+              help="Draw next unused serial number(s) from serial-number ledger - instead of 'serial'")
+@click.option('--force_serial/--no_force_serial',
+              default=False,
+              help="Program given serial number(s) even if ledger shows them as already used (default: abort)")
+@click.option("--ledger",
+              type=click.Path(file_okay=True, dir_okay=False),
+              default=DEFAULT_LEDGER_FILE,
+              help="Serial-number ledger file (shared by all stations/processes programming this product)")
+@click.option("--trace_file",
+              type=click.Path(file_okay=True, dir_okay=False),
+              default="",
+              help="Timing trace: duration + status of every programming step and J-Link command (empty = no trace)")
+@click.option("--trace_format",
+              type=click.Choice(['jsonl', 'chrome']),
+              default='jsonl',
+              help="Timing trace format: 'jsonl' = JSON lines (appended), 'chrome' = Chrome trace (chrome://tracing, Perfetto)")
 # The command itself:
-def run_irrigation_sensor_programming(path, serial, fw_type, fram_erase, erase, sensor_type) -> bool:
+def run_irrigation_sensor_programming(path, serial, fw_type, fram_erase, erase, sensor_type, probes, dry_run,
+                                      differential, verify, patch_config, auto_serial, force_serial, ledger,
+                                      trace_file, trace_format) -> bool:
     # NOTE: no doc-block here to avoid Quick picking it up and use for window title!
     #
     global srec_path
-    global JLINK_TARGET_OPTIONS
 
     mcu_type = MAP_SENSOR_TYPE_TO_MCU[sensor_type]
-    # Modify J-Link setup to match target MCU:
-    JLINK_TARGET_OPTIONS[JLINK_TARGET_MCU_OPTION_IDX] = mcu_type
+    probe_sns = [probe_sn.strip() for probe_sn in probes.split(',') if probe_sn.strip()]
 
     print("Startup ...", flush=True)
     # Run:
-    print(f"path={path}, fw_type={fw_type}, serial={serial}, fram_erase={fram_erase}, erase={erase},  MCU={mcu_type}...", flush=True)
+    print(f"path={path}, fw_type={fw_type}, serial={serial}, fram_erase={fram_erase}, erase={erase},  MCU={mcu_type}, probes={probe_sns}...", flush=True)
     #
     if path is None or fw_type is None or serial is None or erase is None:
         raise Exception("Not all options specified!")
@@ -403,24 +878,64 @@ def run_irrigation_sensor_programming(path, serial, fw_type, fram_erase, erase,
     elif serial is None:
         raise Exception("No value given for serial number!\nLegal values: 1-65535")
     else:
+        # Preflight - a bad image set must not be programmed on any board (or use up serial numbers):
+        if not preflight_check_images(path, fw_type, fram_erase, erase and not differential, mcu_type):
+            print("ERROR: preflight check of firmware images failed - no boards programmed!", flush=True)
+            quick.set_app_status(status='error')
+            return False
         srec_path = path
-        # Erase FRAM memory on sensor *first* - before doing a full erase of Flash etc.
-        if fram_erase:
-            # Task will wait to allow FRAM-eraser application to run on target ....
-            print("FRAM erase: 5 seconds is required to allow FRAM on target to be erased ...", flush=True)
-            fram_status = vv_fram_erase()
-            print("FRAM on target is now erased - continuing ...", flush=True)
+        num_boards = max(1, len(probe_sns))
+        allocator = None
+        if dry_run:
+            serials = [serial + idx for idx in range(num_boards)]
+        else:
+            allocator = SerialAllocator(ledger, product=SERIAL_LEDGER_PRODUCT, first_serial=SERIAL_NUMBER_FIRST,
+                                        last_serial=SERIAL_NUMBER_LAST)
+            owner = f"{platform.node()}:{os.getpid()}"
+            if auto_serial:
+                serials = allocator.reserve(num_boards, owner=owner)
+                print(f"Serial number(s) from ledger: {serials}", flush=True)
+            else:
+                serials = [serial + idx for idx in range(num_boards)]
+                try:
+                    # All or none - nothing is registered if any serial number is already used (unless forced):
+                    used_serials = allocator.register_block(serials, owner=owner, allow_used=force_serial)
+                except ValueError as exc:
+                    used_serials = None
+                    print(f"ERROR: {exc}", flush=True)
+                for board_serial in used_serials or ():
+                    print(f"{'WARNING' if force_serial else 'ERROR'}: serial number {board_serial} already used "
+                          f"(ledger status: '{allocator.get_status(board_serial)}')!", flush=True)
+                if used_serials is None or (used_serials and not force_serial):
+                    print("ERROR: serial number(s) not available - no boards programmed!", flush=True)
+                    allocator.close()
+                    quick.set_app_status(status='error')
+                    return False
+        if trace_file:
+            # Chrome trace is converted from a JSON-lines trace of this run only:
+            trace_jsonl_file = trace_file + ".jsonl" if trace_format == 'chrome' else trace_file
+            tracer.enable(trace_jsonl_file, append=trace_format != 'chrome')
+            t_trace_start = time.time()
+        if probe_sns:
+            results = run_gang_programming(path, probe_sns, serials, fw_type, fram_erase, erase, mcu_type,
+                                           dry_run=dry_run, differential=differential, verify=verify,
+                                           patch_config=patch_config)
         else:
-            fram_status = True
-        
-        # Test only example:
-        # ret_val = run_fw_programming(fw_type, serial_num, erase_flash_first, cleanup=False, debug=True)
-        # Non-test environment:
-        config_status = fw_prepare_target(erase=erase, keep_serno=False, serial=serial)
-        fw_prog_status = run_fw_programming(fw_type=fw_type)
+            results = [program_board(path, serials[0], fw_type, fram_erase, erase, mcu_type, dry_run=dry_run,
+                                     differential=differential, verify=verify, patch_config=patch_config)]
+        if allocator is not None:
+            for _, board_serial, status in results:
+                allocator.set_status(board_serial, SERIAL_STATUS_PROGRAMMED if status else SERIAL_STATUS_FAILED)
+            allocator.close()
+        if trace_file:
+            tracer.disable()
+            print_trace_summary(trace_jsonl_file, t_trace_start)
+            if trace_format == 'chrome':
+                write_chrome_trace(read_trace(trace_jsonl_file), trace_file)
+                os.remove(trace_jsonl_file)
+            print(f"Timing trace written to '{trace_file}'.", flush=True)
         #
-        # total_status = status1 and status2 and status3 and status4
-        total_status = config_status and fw_prog_status and fram_status
+        total_status = all(status for _, _, status in results)
         if total_status:
             quick.set_app_status(status='success')
         else:
@@ -430,10 +945,12 @@ def run_irrigation_sensor_programming(path, serial, fw_type, fram_erase, erase,
         print("")
         print("================================")
         #
-        if total_status:
-            print("PASS: successful programming.")
-        else:
-            print("FAIL: programming error!!")
+        for probe_sn, board_serial, status in results:
+            board_info = f"board serial={board_serial}" if probe_sn is None else f"probe {probe_sn}, board serial={board_serial}"
+            if status:
+                print(f"PASS: successful programming ({board_info}).")
+            else:
+                print(f"FAIL: programming error!! ({board_info})")
         print("================================")
         print("")
     #
@@ -445,11 +962,12 @@ def run_irrigation_sensor_programming(path, serial, fw_type, fram_erase, erase,
 # ***************** MAIN ************************
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()    # Needed for gang programming (process pool) in PyInstaller executable
     prog_func = run_irrigation_sensor_programming
     prog_func.__setattr__("name", f"Irrigation Sensor Programming Tool ver.{VER_MAJOR}.{VER_MINOR}.{VER_SUBMINOR}")
     quick.gui_it(prog_func,
            run_exit=False,
-           new_thread=False,
+           new_thread=True,
            style="qdarkstyle",
            output="gui",
            width=650,
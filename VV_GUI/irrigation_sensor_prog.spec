@@ -6,7 +6,7 @@ block_cipher = None
 
 
 a = Analysis(['irrigation_sensor_prog.py'],
-             pathex=['.'],
+             pathex=['.', '..'],
              binaries=[('JLink.exe', '.'), ('JLinkARM.dll', '.')],
              datas=[('7sense-7-hvit.png', '.'), ('copy.png', '.'), ('VV_FRAM_eraser.srec', '.'), ('VV_revB_platform_FRAM_ERASER.srec', '.'), ('VV_revB_platform_FRAM_ERASER_Flash.srec', '.'), ('7sense.ico', '.')],
              hiddenimports=[],
@@ -652,10 +652,13 @@ class CommandLayout(QtWidgets.QGridLayout):
         row = self.rowCount()+1
         cmd_layout = QtWidgets.QGridLayout()
         cmd_layout.setHorizontalSpacing(20)
+        buttons = []
         for col, arg in enumerate(args):
             button = self.generate_cmd_button(**arg)
             cmd_layout.addWidget(button, 0, col)
+            buttons.append(button)
         self.addLayout(cmd_layout, row, 0, 1, 2)
+        return buttons
 
     @QtCore.pyqtSlot()
     def clean_sysargv(self):
@@ -699,11 +702,18 @@ class CommandLayout(QtWidgets.QGridLayout):
         self.addLayout(comp_layout2, self.rowCount() + 1, 1)
 
 
+class RunCommandSignals(QtCore.QObject):
+    # QRunnable is no QObject - signals to GUI thread go via this helper:
+    finished = QtCore.pyqtSignal()
+    error = QtCore.pyqtSignal(str)
+
+
 class RunCommand(QtCore.QRunnable):
     def __init__(self, func, run_exit):
         super(RunCommand, self).__init__()
         self.func = func
         self.run_exit = run_exit
+        self.signals = RunCommandSignals()
 
     @QtCore.pyqtSlot()
     def run(self):
@@ -711,16 +721,12 @@ class RunCommand(QtCore.QRunnable):
         try:
             self.func(standalone_mode=self.run_exit)
         except click.exceptions.BadParameter as bpe:
-            # warning message
-            msg = QtWidgets.QMessageBox()
-            msg.setIcon(QtWidgets.QMessageBox.Warning)
-            msg.setText(bpe.format_message())
-            msg.exec_()
+            # warning message (shown by GUI thread - command may run in worker thread)
+            self.signals.error.emit(bpe.format_message())
         except Exception as bpe:
-            msg = QtWidgets.QMessageBox()
-            msg.setIcon(QtWidgets.QMessageBox.Warning)
-            msg.setText(repr(bpe))
-            msg.exec_()
+            self.signals.error.emit(repr(bpe))
+        finally:
+            self.signals.finished.emit()
         # if self.outputEdit is not None:
             # self.outputEdit.show()
 
@@ -794,6 +800,7 @@ class App(QtWidgets.QWidget):
         self.new_thread = new_thread
         self.title = func.name
         self.func = func
+        self.run_buttons = []
         self.initUI(run_exit, QtCore.QRect(left, top, width, height))
         self.threadpool = QtCore.QThreadPool()
         # self.outputEdit = self.initOutput(output)
@@ -827,7 +834,7 @@ class App(QtWidgets.QWidget):
             # return opt_set
         elif isinstance(func, click.Command):
             new_thread = getattr(func, "new_thread", self.new_thread)
-            opt_set.add_cmd_buttons( args=
+            buttons = opt_set.add_cmd_buttons( args=
                     [
                         {
                             'label': '&Run',
@@ -849,6 +856,7 @@ class App(QtWidgets.QWidget):
                         },
                     ]
                     )
+            self.run_buttons.append(buttons[0])
         #
         opt_set.add_status_indicator()
         #
@@ -896,17 +904,38 @@ class App(QtWidgets.QWidget):
     def exit_cmd(self):
         sys.exit(0)
 
+    def set_run_enabled(self, enabled: bool):
+        for button in self.run_buttons:
+            button.setEnabled(enabled)
+
     def run_cmd(self, new_thread):
+        # No second run (on same probe) while command is running - Qt drops clicks on disabled buttons:
+        self.set_run_enabled(False)
         runcmd = RunCommand(self.func, self.run_exit)
+        runcmd.signals.error.connect(self.show_cmd_error)
+        runcmd.signals.finished.connect(self.cmd_finished)
         if new_thread:
+            # Output pane is repainted by GUI thread meanwhile ('textWritten' is queued across threads):
             self.threadpool.start(runcmd)
         else:
             runcmd.run()
+
+    @QtCore.pyqtSlot(str)
+    def show_cmd_error(self, text: str):
+        msg = QtWidgets.QMessageBox()
+        msg.setIcon(QtWidgets.QMessageBox.Warning)
+        msg.setText(text)
+        msg.exec_()
+
+    @QtCore.pyqtSlot()
+    def cmd_finished(self):
         # Check if status updated:
         new_app_status = get_app_status()
         if new_app_status != self.app_status:
             self.app_status = new_app_status
             self.update_status_indicator(self.app_status)
+        # Re-enable from event loop - clicks queued during a run in GUI thread are dropped first:
+        QtCore.QTimer.singleShot(0, partial(self.set_run_enabled, True))
 
 
 # Make CLI app into GUI app:
@@ -2,6 +2,7 @@ import sys
 import os
 import argparse
 import subprocess
+import tempfile
 import platform
 
 
@@ -25,6 +26,19 @@ POST_TASKS_CMD_FILE = "VV_post_tasks.tmp.jlink"
 srec_path = None
 
 
+# RAM-backed folder (if available) for temporary J-Link command files.
+# NOTE: local copy of 'srec_utils.jlink_cmd_file' - this tool is standalone (no 'srec_utils' package):
+JLINK_CMD_FILE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def get_tmp_cmd_file(cmd_file_name):
+    """ Unique (per-run) command file path - concurrent runs from same install folder do not collide. """
+    fd, tmp_file_name = tempfile.mkstemp(prefix=os.path.splitext(cmd_file_name)[0] + '_', suffix='.jlink',
+                                         dir=JLINK_CMD_FILE_DIR)
+    os.close(fd)
+    return tmp_file_name
+
+
 def run_jlink_cmd_file(cmd_file_name):
     status = False
     #
@@ -54,18 +68,19 @@ def run_jlink_cmd_file(cmd_file_name):
 def fw_pre_task(erase=True, cleanup=True, debug=False):
     status = False
     #
-    with open(PRE_TASKS_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(PRE_TASKS_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         if erase:
             fp.writelines("erase\n")
         fp.writelines("w4 0x5c00 0x00000001\n")
     # Run JLink w. file input:
     if not debug:
-        status = run_jlink_cmd_file(PRE_TASKS_CMD_FILE)
+        status = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(PRE_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -79,16 +94,17 @@ def fw_bl_prog(security=False, cleanup=True, debug=False):
     #
     bootloader_srec = srec_path + "\\" + "IrrigationSensorBootld.srec"
     #
-    with open(BL_TASKS_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(BL_TASKS_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.writelines("loadfile %s\n" % bootloader_srec)
     # Run JLink w. file input:
     if not debug:
-        status = run_jlink_cmd_file(BL_TASKS_CMD_FILE)
+        status = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(BL_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -111,16 +127,17 @@ def fw_app_prog(num=None, cleanup=True, debug=False):
     # Add cmds:
     fw_name = srec_path + "\\" + fw_name
     #
-    with open(file_name, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(file_name)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.writelines("loadfile " + fw_name + "\n")
     # Run JLink w. file input:
     if not debug:
-        status = run_jlink_cmd_file(file_name)
+        status = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(file_name)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -130,17 +147,18 @@ def fw_app_prog(num=None, cleanup=True, debug=False):
 def fw_post_task(serNo=None, cleanup=True, debug=False):
     status = False
     #
-    with open(POST_TASKS_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(POST_TASKS_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.write("w4 0x5c08 " + hex(serNo) + "\n")
         fp.write("read32 0x5c00,12\n")
     # Run JLink w. file input:
     if not debug:
-        status = run_jlink_cmd_file(PRE_TASKS_CMD_FILE)
+        status = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(PRE_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
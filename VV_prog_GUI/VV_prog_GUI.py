@@ -4,6 +4,7 @@ import sys
 import os
 import argparse
 import subprocess
+import tempfile
 # For (optional) GUI
 from gooey import Gooey, GooeyParser
 
@@ -33,6 +34,19 @@ use_gui = True
 srec_path = None
 
 
+# RAM-backed folder (if available) for temporary J-Link command files.
+# NOTE: local copy of 'srec_utils.jlink_cmd_file' - this tool is standalone (no 'srec_utils' package):
+JLINK_CMD_FILE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def get_tmp_cmd_file(cmd_file_name):
+    """ Unique (per-run) command file path - concurrent runs from same install folder do not collide. """
+    fd, tmp_file_name = tempfile.mkstemp(prefix=os.path.splitext(cmd_file_name)[0] + '_', suffix='.jlink',
+                                         dir=JLINK_CMD_FILE_DIR)
+    os.close(fd)
+    return tmp_file_name
+
+
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
@@ -98,7 +112,8 @@ def run_jlink_cmd_file(cmd_file_name: str, utf_encode: bool = True, verbose: boo
 def fw_pre_task(erase=True, cleanup=True, debug=False):
     status = False
     #
-    with open(PRE_TASKS_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(PRE_TASKS_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         if erase:
             fp.write("unlock Kinetis\n")      # Needed if device is programmed 1st time!
@@ -106,11 +121,11 @@ def fw_pre_task(erase=True, cleanup=True, debug=False):
         fp.write("q\n")
     # Run JLink w. file input:
     if not debug:
-        status, out_text = run_jlink_cmd_file(PRE_TASKS_CMD_FILE)
+        status, out_text = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(PRE_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -124,17 +139,18 @@ def fw_bl_prog(security=False, cleanup=True, debug=False):
     #
     bootloader_srec = srec_path + "\\" + "IrrigationSensorBootld.srec"
     #
-    with open(BL_TASKS_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(BL_TASKS_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.write("loadfile %s\n" % bootloader_srec)
         fp.write("q\n")
     # Run JLink w. file input:
     if not debug:
-        status, out_text = run_jlink_cmd_file(BL_TASKS_CMD_FILE)
+        status, out_text = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(BL_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -157,17 +173,18 @@ def fw_app_prog(num=None, cleanup=True, debug=False):
     # Add cmds:
     fw_name = srec_path + "\\" + fw_name
     #
-    with open(file_name, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(file_name)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.write("loadfile " + fw_name + "\n")
         fp.write("q\n")
     # Run JLink w. file input:
     if not debug:
-        status, out_text = run_jlink_cmd_file(file_name)
+        status, out_text = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(file_name)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -177,18 +194,19 @@ def fw_app_prog(num=None, cleanup=True, debug=False):
 def fw_post_task(serNo=None, cleanup=True, debug=False):
     status = False
     #
-    with open(POST_TASKS_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(POST_TASKS_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.write("w4 0x5c00 0x00000001\n")              # Set image-number=1
         fp.write("w4 0x5c08 " + hex(serNo) + "\n")      # Set serial number
         fp.write("q\n")
     # Run JLink w. file input:
     if not debug:
-        status, out_text = run_jlink_cmd_file(POST_TASKS_CMD_FILE)
+        status, out_text = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(POST_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -217,16 +235,17 @@ def fw_verify_imagenumber(img_num=1, cleanup=True, verbose=False):
     status = False
     IMAGE_NUM_FLASH_ADDR = "00005C00"
     #
-    with open(VERIFY_IMAGENUM_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(VERIFY_IMAGENUM_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.write("mem32 0x00005c00,1\n")
         fp.write("q\n")
     # Run JLink w. file input:
-    cmd_status, out_text = run_jlink_cmd_file(VERIFY_IMAGENUM_CMD_FILE)
+    cmd_status, out_text = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(VERIFY_IMAGENUM_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -259,16 +278,17 @@ def fw_verify_serialnumber(snum, cleanup=True, verbose=False):
     status = False
     SER_NUM_FLASH_ADDR = "00005C08"
     #
-    with open(VERIFY_SERNUM_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(VERIFY_SERNUM_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.write("mem32 0x00005c08,1\n")
         fp.write("q\n")
     # Run JLink w. file input:
-    cmd_status, out_text = run_jlink_cmd_file(VERIFY_SERNUM_CMD_FILE)
+    cmd_status, out_text = run_jlink_cmd_file(cmd_file)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(VERIFY_SERNUM_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
@@ -299,20 +319,21 @@ def fw_verify_serialnumber(snum, cleanup=True, verbose=False):
 def fw_dummy_task(cleanup=True, debug=False, verbose=True):
     status = False
     #
-    with open(DUMMY_TASKS_CMD_FILE, 'w') as fp:
+    cmd_file = get_tmp_cmd_file(DUMMY_TASKS_CMD_FILE)
+    with open(cmd_file, 'w') as fp:
         fp.write("r\n")
         fp.write("mem32 0x5c00,12\n")
         fp.write("q\n")
     # Run JLink w. file input:
     if not debug:
-        status, out_text = run_jlink_cmd_file(DUMMY_TASKS_CMD_FILE)
+        status, out_text = run_jlink_cmd_file(cmd_file)
     if verbose:
         for line in out_text:
             print(line)
     # Remove file if specified:
     if cleanup:
         try:
-            os.remove(DUMMY_TASKS_CMD_FILE)
+            os.remove(cmd_file)
         except OSError:
             pass
     #
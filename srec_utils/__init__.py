@@ -1 +1 @@
-__all__ = ['srecutils', 'verify_firmware', 'verify_srec']
+__all__ = ['srecutils', 'verify_firmware', 'verify_srec', 'image_cache', 'image_patcher', 'serial_allocator', 'prog_trace', 'address_index', 'sparse_image', 'binary_utils', 'jlink_output', 'jlink_session', 'jlink_cmd_file']
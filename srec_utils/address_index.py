@@ -0,0 +1,127 @@
+"""
+@file address_index.py
+
+@brief Address-range index over several images (and reserved regions) - overlap, gap and coverage queries.
+Data records of each image are coalesced into contiguous segments - all segments are kept in a list sorted by start
+address, along w. a running max-end prefix (max. end address of all segments up to each one).
+Queries bisect both lists to bound their candidates: O(log n + k) while segments do not overlap much (the usual
+firmware layout) - a long segment below the query keeps all ranges after it in the candidates, so worst case is O(n).
+
+Use e.g.:
+    index = AddressIndex()
+    index.add_image("FW1.srec", "FW1")
+    index.add_range(0x5C00, 0x6000, "CONFIG")
+    conflicts = index.find_conflicts()
+"""
+
+import bisect
+
+from .sparse_image import SparseImage
+
+
+class AddressIndex:
+    """ Address ranges [start, end) w. labels (e.g. image name) - ranges may overlap. """
+
+    def __init__(self):
+        self.ranges = []        # (start, end, label) - sorted
+        self._starts = []       # Start addresses of 'ranges'
+        self._max_ends = []     # Running max. of end addresses - non-decreasing, so it can be bisected
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def add_range(self, start, end, label):
+        self.add_ranges([(start, end, label)])
+
+    def add_ranges(self, ranges):
+        """ Add (start, end, label) ranges - index is rebuilt once. Empty ranges are ignored. """
+        self.ranges.extend((start, end, label) for start, end, label in ranges if end > start)
+        self.ranges.sort()
+        self._starts = [range_start for range_start, _, _ in self.ranges]
+        self._max_ends = []
+        max_end = 0
+        for _, range_end, _ in self.ranges:
+            max_end = max(max_end, range_end)
+            self._max_ends.append(max_end)
+
+    def add_image(self, srec_file, label):
+        """ Add data records of SREC file - contiguous records are coalesced. Returns: list of (start, end) """
+        merged = SparseImage.from_srec_file(srec_file).ranges()
+        self.add_ranges((start, end, label) for start, end in merged)
+        return merged
+
+    def overlaps(self, start, end):
+        """ Ranges intersecting [start, end). Returns: list of (start, end, label) """
+        # Candidates: start below 'end' - and (running max.) end above 'start':
+        hi = bisect.bisect_left(self._starts, end)
+        lo = bisect.bisect_right(self._max_ends, start, 0, hi)
+        return [entry for entry in self.ranges[lo:hi] if entry[1] > start]
+
+    def labels_at(self, addr):
+        """ Labels of all ranges containing 'addr'. """
+        return [label for _, _, label in self.overlaps(addr, addr + 1)]
+
+    def gaps(self, start, end, labels=None):
+        """ Parts of [start, end) not covered by any range (w. one of 'labels', if given). Returns: list of (start, end) """
+        gaps = []
+        pos = start
+        for range_start, range_end, label in self.overlaps(start, end):
+            if labels is not None and label not in labels:
+                continue
+            if range_start > pos:
+                gaps.append((pos, range_start))
+            pos = max(pos, range_end)
+            if pos >= end:
+                break
+        if pos < end:
+            gaps.append((pos, end))
+        return gaps
+
+    def is_covered(self, start, end, labels=None):
+        return not self.gaps(start, end, labels)
+
+    def coverage(self, start, end, labels=None):
+        """ No. of bytes in [start, end) covered by ranges (w. one of 'labels', if given). """
+        return (end - start) - sum(gap_end - gap_start for gap_start, gap_end in self.gaps(start, end, labels))
+
+    def find_conflicts(self):
+        """ All overlaps between ranges of different labels. Returns: list of (label, label, start, end) """
+        conflicts = []
+        active = []     # Ranges that may still overlap the next ones (sweep over sorted ranges)
+        for start, end, label in self.ranges:
+            active = [entry for entry in active if entry[1] > start]
+            for other_start, other_end, other_label in active:
+                if other_label != label:
+                    conflicts.append((other_label, label, start, min(end, other_end)))
+            active.append((start, end, label))
+        return conflicts
+
+
+# ******************* TESTS / BENCHMARK **********************
+if __name__ == "__main__":
+    import os
+    import random
+    import time
+    #
+    srec_dir = os.path.dirname(os.path.abspath(__file__))
+    index = AddressIndex()
+    for image_name in ("FW1", "FW2"):
+        image_segments = index.add_image(os.path.join(srec_dir, f"{image_name}.srec"), image_name)
+        print(f"{image_name}: " + ", ".join(f"0x{seg_start:05X}-0x{seg_end:05X}" for seg_start, seg_end in image_segments))
+    index.add_range(0x5C00, 0x6000, "CONFIG")
+    print(f"Conflicts: {index.find_conflicts()}")
+    print("Gaps in Flash (0x0-0x40000): " + ", ".join(f"0x{gap_start:05X}-0x{gap_end:05X}"
+                                                     for gap_start, gap_end in index.gaps(0, 0x40000)))
+    print(f"Labels at 0x6000: {index.labels_at(0x6000)}, at 0x5C08: {index.labels_at(0x5C08)}")
+    # Image placed over CONFIG-sector is detected:
+    index.add_range(0x5000, 0x5D00, "FRAM eraser")
+    print(f"Conflicts w. FRAM eraser: {index.find_conflicts()}")
+    # Query speed on many ranges:
+    big_index = AddressIndex()
+    big_index.add_ranges((idx * 0x100, idx * 0x100 + 0x80, f"img{idx % 4}") for idx in range(2000))
+    queries = [random.randrange(0, 2000 * 0x100) for _ in range(100000)]
+    t_start = time.perf_counter()
+    for query_addr in queries:
+        big_index.overlaps(query_addr, query_addr + 0x10)
+    t_elapsed = time.perf_counter() - t_start
+    print(f"{len(queries)} overlap queries on {len(big_index)} ranges: {t_elapsed * 1e6 / len(queries):.2f} us/query")
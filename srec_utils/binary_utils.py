@@ -1,9 +1,430 @@
-import bincopy
+"""
+@file binary_utils.py
 
+@brief Conversion between S-Record (S19/S28/S37), Intel HEX and raw binary files.
+Input is read, and output written, in chunks - memory use is bounded by chunk size, not by file size
+(except 'convert_to_bin_format_bytearray()', which returns the whole image).
+Data records are re-grouped on output to the given record width: wider records mean fewer lines
+for J-Link (or a bootloader) to parse - S-Records hold up to 250 data bytes (S37), Intel HEX records up to 255.
 
-def convert_to_bin_format_bytearray(fname: string=None) -> bytes:
-    with open(fname, 'r') as fp:
-        data = fp.read()
-    #
-    return bytearray(data)
+Use e.g.:
+    convert_file("FW1.srec", "FW1.hex")
+    convert_file("FW1.hex", "FW1.s37", record_size=128)
+    convert_file("FW1.bin", "FW1.srec", base_addr=0x6000)
+    convert_file("FW1.bin", "FW1.srec", base_addr=0x6000, skip_fill=True)     # w/o records of erased (0xFF) Flash
+"""
+
+import os
+import re
+
+from .sparse_image import SparseImage
+from .srecutils import SREC_STREAM_CHUNK_SIZE, _ADDR_LEN_BY_TYPE, decode_srec, encode_srec, iter_srec_lines
+
+
+FORMAT_SREC = 'srec'
+FORMAT_IHEX = 'ihex'
+FORMAT_BIN = 'bin'
+
+# File name extension --> (format, S-Record data record type)
+FILE_EXTENSIONS = {'.srec': (FORMAT_SREC, None), '.mot': (FORMAT_SREC, None), '.s19': (FORMAT_SREC, 1),
+                   '.s28': (FORMAT_SREC, 2), '.s37': (FORMAT_SREC, 3), '.hex': (FORMAT_IHEX, None),
+                   '.ihex': (FORMAT_IHEX, None), '.bin': (FORMAT_BIN, None)}
+
+DEFAULT_RECORD_SIZE = 32        # Data bytes per output record
+IHEX_MAX_RECORD_SIZE = 255
+BIN_FILL_BYTE = 0xFF            # Gaps in binary output (erased Flash)
+
+# Intel HEX record types:
+IHEX_DATA = 0x00
+IHEX_EOF = 0x01
+IHEX_EXT_SEGMENT_ADDR = 0x02
+IHEX_START_SEGMENT_ADDR = 0x03
+IHEX_EXT_LINEAR_ADDR = 0x04
+IHEX_START_LINEAR_ADDR = 0x05
+
+
+def get_file_format(filename: str) -> tuple:
+    """
+    Format of file from its extension - or from first character of an existing file ('S'/':'), else binary.
+    Returns: (format, S-Record data record type or None)
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in FILE_EXTENSIONS:
+        return FILE_EXTENSIONS[ext]
+    if os.path.isfile(filename):
+        with open(filename, 'rb') as fp:
+            first = fp.read(1)
+        if first == b'S':
+            return FORMAT_SREC, None
+        if first == b':':
+            return FORMAT_IHEX, None
+    return FORMAT_BIN, None
+
+
+def get_srec_type(max_addr: int) -> int:
+    """ Smallest S-Record data record type (1, 2 or 3) for addresses up to 'max_addr'. """
+    if max_addr <= 0xFFFF:
+        return 1
+    if max_addr <= 0xFFFFFF:
+        return 2
+    return 3
+
+
+# ******************* Input: (addr, data) chunks **********************
+def iter_srec_data(fp, chunk_size=SREC_STREAM_CHUNK_SIZE, info=None):
+    """
+    Yield (addr, data) of S-Record data records from file object.
+    'info' (dict, optional) gets 'header' (S0 data), 'srec_type' (of 1st data record) and 'start_addr' (S7/S8/S9).
+    """
+    info = {} if info is None else info
+    for srec in iter_srec_lines(fp, chunk_size):
+        rtype, addr, data = decode_srec(srec)
+        if rtype in (1, 2, 3):
+            info.setdefault('srec_type', rtype)
+            yield addr, data
+        elif rtype == 0:
+            info['header'] = data
+        elif rtype in (7, 8, 9):
+            info['start_addr'] = addr
+
+
+def iter_ihex_data(fp, chunk_size=SREC_STREAM_CHUNK_SIZE, info=None):
+    """ Yield (addr, data) of Intel HEX data records from file object. 'info' gets 'start_addr' (type 03/05). """
+    info = {} if info is None else info
+    base_addr = 0
+    for line_no, line in enumerate(iter_srec_lines(fp, chunk_size)):
+        line = line.strip()
+        try:
+            if not line.startswith(':'):
+                raise ValueError("Record does not start with ':'")
+            raw = bytes.fromhex(line[1:])
+            if len(raw) < 5 or len(raw) != raw[0] + 5:
+                raise ValueError("Record length does not match byte count")
+            if sum(raw) & 0xFF:
+                raise ValueError("Record checksum mismatch")
+        except ValueError as e:
+            raise ValueError(f"Line {line_no + 1}: {e}")
+        rtype = raw[3]
+        data = raw[4:-1]
+        if rtype == IHEX_DATA:
+            yield base_addr + int.from_bytes(raw[1:3], 'big'), data
+        elif rtype == IHEX_EOF:
+            break
+        elif rtype == IHEX_EXT_SEGMENT_ADDR:
+            base_addr = int.from_bytes(data, 'big') << 4
+        elif rtype == IHEX_EXT_LINEAR_ADDR:
+            base_addr = int.from_bytes(data, 'big') << 16
+        elif rtype == IHEX_START_SEGMENT_ADDR:
+            info['start_addr'] = (int.from_bytes(data[:2], 'big') << 4) + int.from_bytes(data[2:], 'big')
+        elif rtype == IHEX_START_LINEAR_ADDR:
+            info['start_addr'] = int.from_bytes(data, 'big')
+
+
+def iter_bin_data(fp, base_addr=0, chunk_size=SREC_STREAM_CHUNK_SIZE):
+    """ Yield (addr, data) chunks of binary file object - file starts at 'base_addr'. """
+    addr = base_addr
+    while True:
+        data = fp.read(chunk_size)
+        if not data:
+            break
+        yield addr, data
+        addr += len(data)
+
+
+def iter_skip_fill(records, min_run, fill=BIN_FILL_BYTE):
+    """
+    Drop runs of 'fill' bytes at least 'min_run' long (e.g. erased Flash in a binary image) from (addr, data) chunks -
+    shorter runs are kept. Runs may span chunks: only their length is held. Yields: (addr, data)
+    """
+    fill_byte = bytes([fill])
+    long_run = re.compile(re.escape(fill_byte) + b'{%d,}' % min_run)
+    run_addr = 0
+    run_len = 0     # Fill bytes at end of data so far - not yet yielded (or dropped)
+    for addr, data in records:
+        if run_len and addr != run_addr + run_len:
+            if run_len < min_run:
+                yield run_addr, fill_byte * run_len
+            run_len = 0
+        if not run_len:
+            run_addr = addr
+        lead = len(data) - len(data.lstrip(fill_byte))
+        if lead == len(data):
+            run_len += lead
+            continue
+        if run_len + lead < min_run and run_len + lead:
+            yield run_addr, fill_byte * (run_len + lead)
+        body = data[lead:len(data.rstrip(fill_byte))]
+        body_addr = addr + lead
+        pos = 0
+        for match in long_run.finditer(body):
+            yield body_addr + pos, body[pos:match.start()]
+            pos = match.end()
+        yield body_addr + pos, body[pos:]
+        run_addr = body_addr + len(body)
+        run_len = len(data) - lead - len(body)
+    if 0 < run_len < min_run:
+        yield run_addr, fill_byte * run_len
+
+
+# ******************* Output **********************
+def iter_regrouped(records, record_size, boundary=None):
+    """
+    Re-group (addr, data) chunks into records of 'record_size' bytes - contiguous data is joined,
+    a record ends at a gap (and at a multiple of 'boundary', if given). Yields: (addr, bytes)
+    """
+    pending = bytearray()
+    pending_addr = 0
+    for addr, data in records:
+        if pending and addr != pending_addr + len(pending):
+            yield from _split_records(pending_addr, pending, record_size, boundary, final=True)
+            pending = bytearray()
+        if not pending:
+            pending_addr = addr
+        pending += data
+        num_done = 0
+        for rec_addr, rec_data in _split_records(pending_addr, pending, record_size, boundary, final=False):
+            num_done += len(rec_data)
+            yield rec_addr, rec_data
+        if num_done:
+            del pending[:num_done]
+            pending_addr += num_done
+    if pending:
+        yield from _split_records(pending_addr, pending, record_size, boundary, final=True)
 
+
+def _split_records(addr, data, record_size, boundary, final):
+    """ Records from contiguous 'data' - a last partial record only if 'final'. """
+    view = memoryview(data)
+    ofs = 0
+    while ofs < len(view):
+        rec_len = record_size
+        if boundary is not None:
+            rec_len = min(rec_len, boundary - (addr + ofs) % boundary)
+        if ofs + rec_len > len(view):
+            if not final:
+                break
+            rec_len = len(view) - ofs
+        yield addr + ofs, bytes(view[ofs:ofs + rec_len])
+        ofs += rec_len
+
+
+def iter_srec_output(records, record_size=DEFAULT_RECORD_SIZE, srec_type=3, header=None, info=None):
+    """
+    Yield S-Record lines (w/o line ending) for (addr, data) chunks: S0 header (if given), data records,
+    S5/S6 record count and S7/S8/S9 termination w. 'info["start_addr"]' (read at end - default: 0).
+    """
+    max_record_size = 0xFF - _ADDR_LEN_BY_TYPE[srec_type] - 1
+    if not 0 < record_size <= max_record_size:
+        raise ValueError(f"S{srec_type} record size must be 1..{max_record_size}")
+    if header is not None:
+        yield encode_srec(0, 0, header)
+    max_addr = 1 << (8 * _ADDR_LEN_BY_TYPE[srec_type])
+    num_records = 0
+    for addr, data in iter_regrouped(records, record_size, max_addr):
+        if addr >= max_addr:
+            raise ValueError(f"Address 0x{addr:X} too large for S{srec_type} records")
+        yield encode_srec(srec_type, addr, data)
+        num_records += 1
+    if num_records <= 0xFFFF:
+        yield encode_srec(5, num_records)
+    elif num_records <= 0xFFFFFF:
+        yield encode_srec(6, num_records)
+    yield encode_srec(10 - srec_type, (info or {}).get('start_addr', 0))
+
+
+def _encode_ihex(rtype, addr, data=b''):
+    raw = bytearray([len(data)]) + addr.to_bytes(2, 'big') + bytes([rtype]) + data
+    raw.append(-sum(raw) & 0xFF)
+    return ":" + raw.hex().upper()
+
+
+def iter_ihex_output(records, record_size=DEFAULT_RECORD_SIZE, info=None):
+    """
+    Yield Intel HEX lines for (addr, data) chunks - type 04 records when upper 16 address bits change,
+    type 05 start address (if in 'info') and EOF record.
+    """
+    if not 0 < record_size <= IHEX_MAX_RECORD_SIZE:
+        raise ValueError(f"Intel HEX record size must be 1..{IHEX_MAX_RECORD_SIZE}")
+    upper = 0
+    for addr, data in iter_regrouped(records, record_size, 0x10000):
+        if addr >> 16 != upper:
+            if addr >> 32:
+                raise ValueError(f"Address 0x{addr:X} too large for Intel HEX")
+            upper = addr >> 16
+            yield _encode_ihex(IHEX_EXT_LINEAR_ADDR, 0, upper.to_bytes(2, 'big'))
+        yield _encode_ihex(IHEX_DATA, addr & 0xFFFF, data)
+    if info and info.get('start_addr') is not None:
+        yield _encode_ihex(IHEX_START_LINEAR_ADDR, 0, info['start_addr'].to_bytes(4, 'big'))
+    yield _encode_ihex(IHEX_EOF, 0)
+
+
+def write_lines(fp, lines, chunk_size=SREC_STREAM_CHUNK_SIZE) -> int:
+    """ Write lines (+ newline) to text file object - about 'chunk_size' characters per write. Returns: no. of lines """
+    num_lines = 0
+    batch = []
+    batch_len = 0
+    for line in lines:
+        batch.append(line)
+        batch_len += len(line) + 1
+        if batch_len >= chunk_size:
+            fp.write("\n".join(batch) + "\n")
+            num_lines += len(batch)
+            batch = []
+            batch_len = 0
+    if batch:
+        fp.write("\n".join(batch) + "\n")
+        num_lines += len(batch)
+    return num_lines
+
+
+def write_bin_data(fp, records, base_addr=None, fill=BIN_FILL_BYTE) -> tuple:
+    """
+    Write (addr, data) chunks to binary file object - from 'base_addr' (default: 1st address) on,
+    gaps filled w. 'fill'. Chunks out of address order are written in place (seek).
+    Returns: (base address, size)
+    """
+    size = 0        # Bytes written so far (from 'base_addr')
+    for addr, data in records:
+        if base_addr is None:
+            base_addr = addr
+        ofs = addr - base_addr
+        if ofs < 0:
+            raise ValueError(f"Address 0x{addr:X} below binary base address 0x{base_addr:X}")
+        if ofs > size:
+            fp.seek(size)
+            gap = ofs - size
+            while gap:
+                fill_len = min(gap, SREC_STREAM_CHUNK_SIZE)
+                fp.write(bytes([fill]) * fill_len)
+                gap -= fill_len
+        else:
+            fp.seek(ofs)
+        fp.write(data)
+        size = max(size, ofs + len(data))
+    return base_addr, size
+
+
+# ******************* File conversion **********************
+def convert_file(in_file: str, out_file: str, in_format: str = None, out_format: str = None,
+                 record_size: int = DEFAULT_RECORD_SIZE, srec_type: int = None, base_addr: int = 0,
+                 chunk_size: int = SREC_STREAM_CHUNK_SIZE, skip_fill: bool = False) -> str:
+    """
+    Convert between S-Record, Intel HEX and binary - formats from file name extensions unless given.
+    'srec_type' (1/2/3) for S-Record output - default: from '.s19'/'.s28'/'.s37' extension, else as SREC input,
+    else the smallest type for a binary input's address range, else 3.
+    'base_addr' is the address of binary input, and of the first byte of binary output (default: lowest address).
+    'skip_fill' (S-Record/Intel HEX output): runs of 0xFF (erased Flash) at least one record long are left out -
+    e.g. for binary input, only the used parts of a Flash image end up in the records.
+    Returns: 'out_file'
+    """
+    in_format = in_format or get_file_format(in_file)[0]
+    out_format, out_srec_type = (out_format, None) if out_format else get_file_format(out_file)
+    srec_type = srec_type or out_srec_type
+    info = {}
+    with open(in_file, 'rb') as fp_in:
+        if in_format == FORMAT_SREC:
+            records = iter_srec_data(fp_in, chunk_size, info)
+            if out_format == FORMAT_SREC and srec_type is None:
+                # Type of 1st data record - data is read once only:
+                first = next(records, None)
+                srec_type = info.get('srec_type', 3)
+                records = _chain_first(first, records)
+        elif in_format == FORMAT_IHEX:
+            records = iter_ihex_data(fp_in, chunk_size, info)
+        elif in_format == FORMAT_BIN:
+            records = iter_bin_data(fp_in, base_addr, chunk_size)
+            if srec_type is None:
+                srec_type = get_srec_type(base_addr + max(0, os.path.getsize(in_file) - 1))
+        else:
+            raise ValueError(f"Unknown input format '{in_format}'")
+        #
+        if out_format == FORMAT_BIN:
+            # Lowest address is only known after reading all data - sorted segments are needed anyway:
+            if in_format != FORMAT_BIN:
+                image = SparseImage(records)
+                records = image.segments()
+                base_addr = image.start
+            with open(out_file, 'wb') as fp_out:
+                write_bin_data(fp_out, records, base_addr)
+        elif out_format in (FORMAT_SREC, FORMAT_IHEX):
+            if skip_fill:
+                records = iter_skip_fill(records, record_size)
+            if out_format == FORMAT_SREC:
+                header = info.get('header', os.path.basename(out_file).encode('ascii', 'replace'))
+                lines = iter_srec_output(records, record_size, srec_type or 3, header, info)
+            else:
+                lines = iter_ihex_output(records, record_size, info)
+            with open(out_file, 'w') as fp_out:
+                write_lines(fp_out, lines, chunk_size)
+        else:
+            raise ValueError(f"Unknown output format '{out_format}'")
+    return out_file
+
+
+def _chain_first(first, records):
+    if first is not None:
+        yield first
+    yield from records
+
+
+def read_image(filename: str, file_format: str = None, base_addr: int = 0) -> SparseImage:
+    """ Data of S-Record, Intel HEX or binary file (starting at 'base_addr'). """
+    file_format = file_format or get_file_format(filename)[0]
+    with open(filename, 'rb') as fp:
+        if file_format == FORMAT_SREC:
+            return SparseImage(iter_srec_data(fp))
+        if file_format == FORMAT_IHEX:
+            return SparseImage(iter_ihex_data(fp))
+        return SparseImage(iter_bin_data(fp, base_addr))
+
+
+def convert_to_bin_format_bytearray(fname: str) -> bytearray:
+    """ Image of S-Record, Intel HEX or binary file - from its lowest address, gaps filled w. 0xFF. """
+    image = read_image(fname)
+    if image.start is None:
+        return bytearray()
+    return bytearray(image.read(image.start, image.end - image.start, BIN_FILL_BYTE))
+
+
+# ******************* TESTS / BENCHMARK **********************
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import time
+    #
+    srec_dir = os.path.dirname(os.path.abspath(__file__))
+    test_dir = tempfile.mkdtemp()
+    for srec_name in ("FW1.srec", "S19_testfile.s19"):
+        srec_path = os.path.join(srec_dir, srec_name)
+        ref_image = read_image(srec_path)
+        in_size = os.path.getsize(srec_path)
+        print(f"{srec_name}: {ref_image} - {len(ref_image)} data bytes, {in_size} bytes file")
+        base_name = os.path.join(test_dir, os.path.splitext(srec_name)[0])
+        conversions = [(srec_path, base_name + ".hex", {}),
+                       (base_name + ".hex", base_name + ".bin", {}),
+                       (base_name + ".bin", base_name + "_bin.s37", {'base_addr': ref_image.start}),
+                       (base_name + ".bin", base_name + "_skip.s37", {'base_addr': ref_image.start, 'skip_fill': True})]
+        conversions += [(srec_path, f"{base_name}_{size}.srec", {'record_size': size}) for size in (16, 32, 64, 128, 250)]
+        for conv_in, conv_out, kwargs in conversions:
+            t_start = time.perf_counter()
+            convert_file(conv_in, conv_out, **kwargs)
+            t_elapsed = time.perf_counter() - t_start
+            base_addr = kwargs.get('base_addr', ref_image.start)
+            out_image = read_image(conv_out, base_addr=base_addr)
+            if conv_out.endswith(".srec") or conv_out.endswith(".hex"):
+                assert out_image == ref_image
+            else:
+                # Binary (and converted from binary) has gaps filled:
+                assert out_image.read(ref_image.start, ref_image.end - ref_image.start) == \
+                    ref_image.read(ref_image.start, ref_image.end - ref_image.start)
+            with open(conv_out, 'rb') as fp_count:
+                num_lines = fp_count.read().count(b'\n')
+            print(f"    {os.path.basename(conv_in):22s} --> {os.path.basename(conv_out):24s} "
+                  f"{t_elapsed * 1000:7.1f} ms {os.path.getsize(conv_in) / t_elapsed / 1e6:6.2f} MB/s in "
+                  f"{num_lines:6d} lines {os.path.getsize(conv_out):8d} bytes")
+        assert convert_to_bin_format_bytearray(srec_path) == \
+            bytearray(ref_image.read(ref_image.start, ref_image.end - ref_image.start))
+    # Termination record start address preserved (S8 of FW1.srec):
+    with open(os.path.join(test_dir, "FW1_250.srec"), 'r') as fp_term:
+        assert fp_term.read().splitlines()[-1] == encode_srec(8, 0x64E9)
+    shutil.rmtree(test_dir)
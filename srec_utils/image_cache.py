@@ -0,0 +1,151 @@
+"""
+@file image_cache.py
+
+@brief Binary image cache for S-Record files.
+Each SREC file is converted once into binary segment files (one per contiguous address range)
+plus a segment map, stored under a folder named by the SHA-256 hash of the SREC contents.
+Later runs use the cached binaries directly (e.g. J-Link 'loadbin' per segment) - no SREC parsing.
+Segments can also be split into Flash-sector sized binaries for differential flashing - w. CRC-CCITT per sector,
+which identifies sector contents (e.g. in programming plans). The sectors are compared against target Flash
+by J-Link readback ('verifybin') - comparing CRCs would need a digest computed on the target.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from .srecutils import iter_srec_file
+from .CRCCCITT import CRCCCITT
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.srec_image_cache')
+SEGMENT_MAP_FILE = "segments.json"
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def get_srec_hash(srec_file: str) -> str:
+    """ SHA-256 (hex-string) of SREC file contents - used as cache key. """
+    sha = hashlib.sha256()
+    with open(srec_file, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_srec_segments(srec_file: str) -> list:
+    """
+    Parse SREC data records and merge adjacent records into contiguous segments.
+    Returns: list of (start address, bytearray) - sorted by address.
+    """
+    segments = []
+    for addr, data in sorted(iter_srec_file(srec_file), key=lambda record: record[0]):
+        if segments and segments[-1][0] + len(segments[-1][1]) == addr:
+            segments[-1][1].extend(data)
+        else:
+            segments.append((addr, bytearray(data)))
+    return segments
+
+
+def cache_srec_image(srec_file: str, cache_dir: str = None) -> list:
+    """
+    Get cached binary segments for SREC file - converting (and caching) it first if not already in cache.
+    Returns: list of (start address, size, binary file name)
+    """
+    if cache_dir is None:
+        cache_dir = DEFAULT_CACHE_DIR
+    image_dir = os.path.join(cache_dir, get_srec_hash(srec_file))
+    segment_map_file = os.path.join(image_dir, SEGMENT_MAP_FILE)
+    #
+    if not os.path.exists(segment_map_file):
+        # Convert into temporary folder, then rename - so concurrent runs never see a partial cache entry:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+        segment_map = {'srec': os.path.basename(srec_file), 'segments': []}
+        for addr, data in get_srec_segments(srec_file):
+            bin_name = f"seg_{addr:08X}.bin"
+            with open(os.path.join(tmp_dir, bin_name), 'wb') as fp:
+                fp.write(data)
+            segment_map['segments'].append({'addr': addr, 'size': len(data), 'file': bin_name})
+        with open(os.path.join(tmp_dir, SEGMENT_MAP_FILE), 'w') as fp:
+            json.dump(segment_map, fp, indent=2)
+        try:
+            os.replace(tmp_dir, image_dir)
+        except OSError:
+            # Another process has cached the same image in the meantime:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    #
+    with open(segment_map_file, 'r') as fp:
+        segment_map = json.load(fp)
+    return [(seg['addr'], seg['size'], os.path.join(image_dir, seg['file'])) for seg in segment_map['segments']]
+
+
+def cache_srec_sectors(srec_file: str, sector_size: int, cache_dir: str = None) -> list:
+    """
+    Get cached per-sector binaries for SREC file - i.e. segments split on Flash-sector boundaries.
+    A sector only partially covered by the image is NOT padded (the rest of the sector is left untouched).
+    Returns: list of (start address, size, binary file name, CRC-CCITT(XModem) of sector data)
+    """
+    segments = cache_srec_image(srec_file, cache_dir)
+    image_dir = os.path.dirname(segments[0][2]) if segments else None
+    if image_dir is None:
+        return []
+    sector_dir = os.path.join(image_dir, f"sectors_{sector_size}")
+    sector_map_file = os.path.join(sector_dir, SEGMENT_MAP_FILE)
+    #
+    if not os.path.exists(sector_map_file):
+        tmp_dir = tempfile.mkdtemp(dir=image_dir)
+        crc_calc = CRCCCITT()
+        sector_map = {'sector_size': sector_size, 'sectors': []}
+        for seg_addr, seg_size, seg_file in segments:
+            with open(seg_file, 'rb') as fp:
+                seg_data = memoryview(fp.read())
+            addr = seg_addr
+            while addr < seg_addr + seg_size:
+                sector_end = min((addr // sector_size + 1) * sector_size, seg_addr + seg_size)
+                sector_data = seg_data[addr - seg_addr:sector_end - seg_addr]
+                bin_name = f"sec_{addr:08X}.bin"
+                with open(os.path.join(tmp_dir, bin_name), 'wb') as fp:
+                    fp.write(sector_data)
+                sector_map['sectors'].append({'addr': addr, 'size': len(sector_data), 'file': bin_name,
+                                              'crc': crc_calc.calculate(sector_data)})
+                addr = sector_end
+        with open(os.path.join(tmp_dir, SEGMENT_MAP_FILE), 'w') as fp:
+            json.dump(sector_map, fp, indent=2)
+        try:
+            os.replace(tmp_dir, sector_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    #
+    with open(sector_map_file, 'r') as fp:
+        sector_map = json.load(fp)
+    return [(sec['addr'], sec['size'], os.path.join(sector_dir, sec['file']), sec['crc'])
+            for sec in sector_map['sectors']]
+
+
+def get_loadbin_cmds(srec_file: str, cache_dir: str = None) -> list:
+    """ J-Link commands loading cached binary segments of SREC file - replaces 'loadfile <srec_file>'. """
+    return [f"loadbin {bin_file},0x{addr:X}" for addr, size, bin_file in cache_srec_image(srec_file, cache_dir)]
+
+
+# ******************* TESTS **********************
+if __name__ == "__main__":
+    import time
+    #
+    test_cache_dir = tempfile.mkdtemp()
+    for srec_name in ("FW1.srec", "FW2.srec", "S19_testfile.s19"):
+        srec_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), srec_name)
+        t_start = time.perf_counter()
+        segments = cache_srec_image(srec_path, test_cache_dir)
+        t_convert = time.perf_counter() - t_start
+        t_start = time.perf_counter()
+        assert cache_srec_image(srec_path, test_cache_dir) == segments
+        t_cached = time.perf_counter() - t_start
+        print(f"{srec_name}: {len(segments)} segment(s), convert={t_convert * 1000:.1f} ms, cached={t_cached * 1000:.2f} ms")
+        for cmd in get_loadbin_cmds(srec_path, test_cache_dir):
+            print(f"  {cmd}")
+        sectors = cache_srec_sectors(srec_path, 1024, test_cache_dir)
+        assert sum(size for _, size, _, _ in sectors) == sum(size for _, size, _ in segments)
+        print(f"  {len(sectors)} sector(s) of max. 1KB, first CRC=0x{sectors[0][3]:04X}")
+    shutil.rmtree(test_cache_dir)
@@ -0,0 +1,126 @@
+"""
+@file image_patcher.py
+
+@brief Per-board firmware image generation.
+Board-specific data (e.g. CONFIG-sector image number/upgrade bit/serial number, or a serial number at end of Flash)
+is merged into the firmware image in memory, and a new SREC file is written w. recomputed record checksums.
+Board data is then programmed (and verified) together with the firmware - no separate 'w4' writes.
+"""
+
+from .srecutils import SREC_DATA_RECORD_TYPES, _ADDR_LEN_BY_TYPE, decode_srec, encode_srec, iter_srec_lines
+
+
+# CONFIG-sector layout - 32-bit little-endian fields (as written by J-Link 'w4' on Cortex-M):
+CONFIG_SECTOR_IMAGENUM_OFFSET = 0
+CONFIG_SECTOR_UPGBIT_OFFSET = 4
+CONFIG_SECTOR_SERIALNO_OFFSET = 8
+PATCH_RECORD_SIZE = 16      # Data bytes per S-record added for patch data not covered by existing records
+
+
+def get_word_patch(addr: int, value: int) -> tuple:
+    """ Patch for one 32-bit (little-endian) word. Returns: (address, bytes) """
+    return addr, value.to_bytes(4, 'little')
+
+
+def get_config_sector_patches(config_addr: int, image_num: int = 1, upgrade: int = None, serial: int = None) -> list:
+    """
+    Patches for CONFIG-sector fields - fields given as None are left out (i.e. stay erased).
+    Returns: list of (address, bytes)
+    """
+    patches = [get_word_patch(config_addr + CONFIG_SECTOR_IMAGENUM_OFFSET, image_num)]
+    if upgrade is not None:
+        patches.append(get_word_patch(config_addr + CONFIG_SECTOR_UPGBIT_OFFSET, upgrade))
+    if serial is not None:
+        patches.append(get_word_patch(config_addr + CONFIG_SECTOR_SERIALNO_OFFSET, serial))
+    return patches
+
+
+def iter_patched_srec(source, patches):
+    """
+    Apply patches to S-Records from 'source' (file object, or iterable of text lines).
+    Patched data records are re-encoded (new checksum) - other records pass unchanged.
+    Patch bytes not covered by any data record are emitted as new records, ahead of the termination record.
+    Yields: S-Record strings (w/o line ending)
+    """
+    # Address --> patch byte - so overlap w. a record is found by address lookup:
+    patch_bytes = {addr + ofs: byte for addr, data in patches for ofs, byte in enumerate(data)}
+    data_rtype = None
+    num_data_records = 0
+    for srec in iter_srec_lines(source):
+        rtype = int(srec[1])
+        if rtype in SREC_DATA_RECORD_TYPES:
+            data_rtype = rtype
+            num_data_records += 1
+            rtype, addr, data = decode_srec(srec)
+            if any(addr + ofs in patch_bytes for ofs in range(len(data))):
+                data = bytearray(data)
+                for ofs in range(len(data)):
+                    byte = patch_bytes.pop(addr + ofs, None)
+                    if byte is not None:
+                        data[ofs] = byte
+                srec = encode_srec(rtype, addr, data)
+            yield srec
+        elif rtype in (5, 6, 7, 8, 9):
+            # Count or termination record - remaining patch data goes in front of it:
+            for patch_srec in _get_patch_srecs(patch_bytes, data_rtype or (10 - rtype if rtype > 6 else 3)):
+                num_data_records += 1
+                yield patch_srec
+            patch_bytes = {}
+            if rtype in (5, 6) and _ADDR_LEN_BY_TYPE[rtype] * 8 >= num_data_records.bit_length():
+                # Record count is held in address field:
+                srec = encode_srec(rtype, num_data_records)
+            yield srec
+        else:
+            yield srec
+    # No termination record in source:
+    for patch_srec in _get_patch_srecs(patch_bytes, data_rtype or 3):
+        yield patch_srec
+
+
+def _get_patch_srecs(patch_bytes: dict, rtype: int) -> list:
+    """ New data records for patch bytes - contiguous bytes are grouped, max. 'PATCH_RECORD_SIZE' per record. """
+    srecs = []
+    addr = None
+    data = bytearray()
+    for byte_addr in sorted(patch_bytes):
+        if addr is not None and (byte_addr != addr + len(data) or len(data) == PATCH_RECORD_SIZE):
+            srecs.append(encode_srec(rtype, addr, data))
+            addr = None
+        if addr is None:
+            addr = byte_addr
+            data = bytearray()
+        data.append(patch_bytes[byte_addr])
+    if addr is not None:
+        srecs.append(encode_srec(rtype, addr, data))
+    return srecs
+
+
+def patch_srec_file(srec_file: str, patches: list, out_file: str) -> str:
+    """ Write patched copy of SREC file. Returns: 'out_file' """
+    with open(srec_file, 'r') as fp_in, open(out_file, 'w') as fp_out:
+        for srec in iter_patched_srec(fp_in, patches):
+            fp_out.write(srec + "\n")
+    return out_file
+
+
+# ******************* TESTS / BENCHMARK **********************
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+    from .srecutils import iter_srec_file
+    #
+    srec_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FW1.srec")
+    out_path = os.path.join(tempfile.mkdtemp(), "FW1_board1234.srec")
+    # CONFIG-sector (below FW1) + one word inside FW1 image:
+    test_patches = get_config_sector_patches(0x5C00, image_num=1, serial=1234) + [get_word_patch(0x6010, 0xCAFEBABE)]
+    t_start = time.perf_counter()
+    patch_srec_file(srec_path, test_patches, out_path)
+    t_elapsed = time.perf_counter() - t_start
+    image = {}
+    for addr, data in iter_srec_file(out_path, verify_checksum=True):
+        image.update((addr + ofs, byte) for ofs, byte in enumerate(data))
+    for addr, data in test_patches:
+        assert bytes(image[addr + ofs] for ofs in range(len(data))) == data
+    print(f"Patched '{os.path.basename(srec_path)}' --> '{out_path}' in {t_elapsed * 1000:.1f} ms - checksums OK")
+    os.remove(out_path)
@@ -0,0 +1,22 @@
+"""
+@file jlink_cmd_file.py
+
+@brief Temporary J-Link command files - shared by all programming tools (VV_GUI, FW_prog).
+Each run writes its command scripts to unique files in a RAM-backed folder (if available),
+so gang runs (or parallel stations started from the same install folder) do not collide.
+"""
+
+import os
+import tempfile
+
+
+# RAM-backed folder (if available) for temporary J-Link command files:
+JLINK_CMD_FILE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def get_tmp_cmd_file(cmd_file_name):
+    """ Unique (per-run) command file path - named after 'cmd_file_name'. """
+    fd, tmp_file_name = tempfile.mkstemp(prefix=os.path.splitext(cmd_file_name)[0] + '_', suffix='.jlink',
+                                         dir=JLINK_CMD_FILE_DIR)
+    os.close(fd)
+    return tmp_file_name
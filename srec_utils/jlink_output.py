@@ -0,0 +1,88 @@
+"""
+J-Link Commander output parser.
+Classifies output lines in a single pass (one precompiled pattern per line type), and collects:
+  - connect status,
+  - per-command status (commands are identified by their 'J-Link>' echo in command-file output),
+  - 'mem32' readback values as dictionary: address --> 32-bit value,
+  - CPU registers shown on halt ('h') as dictionary: register name (e.g. 'PC', 'R7') --> value.
+Lines can be fed one at a time (e.g. while J-Link is still running), or all at once via 'parse_jlink_output()'.
+"""
+
+import re
+
+
+# Connect failure - J-Link probe or target not reachable:
+RE_CONNECT_FAILURE = re.compile(r"Cannot connect to target|Connecting to J-Link via USB\.\.\.FAILED")
+# Command failure - 'Could not ...' at start of line, 'ERROR' anywhere, or 'Error' anywhere *after* start of line:
+RE_CMD_FAILURE = re.compile(r"Could not|.*?ERROR|.+?Error")
+# Command echo (command-file mode) - e.g. 'J-Link>mem32 0x5C00,1':
+RE_CMD_ECHO = re.compile(r"J-Link>\s*(\S.*?)\s*$")
+# 'mem32' output - e.g. '00005C00 = 00000001 ' (up to 4 words per line):
+RE_MEM32 = re.compile(r"([0-9A-Fa-f]{8})\s*=\s*((?:[0-9A-Fa-f]{8}\s*)+)$")
+# Register lines of 'h' output - e.g. 'PC = 1FFFE98A, CycleCnt = 0012D4F0' or 'R4 = 20005FE0, R5 = 00000000, ...':
+RE_REGISTER_LINE = re.compile(r"(?:PC|R\d+)\s*=")
+RE_REGISTER = re.compile(r"(PC|R\d+)\s*=\s*([0-9A-Fa-f]{8})")
+
+
+class JLinkOutput:
+    """
+    Structured J-Link output. Use e.g.:
+        output = parse_jlink_output(lines_out)
+        if output.status:
+            image_num = output.mem32.get(0x5C00)
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.connected = True
+        self.commands = []      # List of [command, status] - in order of execution
+        self.errors = []        # List of failure lines
+        self.mem32 = {}
+        self.registers = {}
+
+    @property
+    def status(self):
+        return self.connected and not self.errors
+
+    def start_cmd(self, cmd):
+        """ Mark start of command output (session mode - where J-Link does not echo commands). """
+        self.commands.append([cmd, True])
+
+    def feed(self, line_str):
+        """ Classify one output line. Returns: False if line signals a failure """
+        self.lines.append(line_str)
+        if RE_CONNECT_FAILURE.match(line_str):
+            self.connected = False
+            self.errors.append(line_str)
+        elif RE_CMD_FAILURE.match(line_str):
+            self.errors.append(line_str)
+            if self.commands:
+                self.commands[-1][1] = False
+        else:
+            match = RE_MEM32.match(line_str)
+            if match:
+                addr = int(match.group(1), 16)
+                for idx, word in enumerate(match.group(2).split()):
+                    self.mem32[addr + 4 * idx] = int(word, 16)
+                return True
+            if RE_REGISTER_LINE.match(line_str):
+                self.registers.update((name, int(value, 16)) for name, value in RE_REGISTER.findall(line_str))
+                return True
+            match = RE_CMD_ECHO.match(line_str)
+            if match:
+                self.start_cmd(match.group(1))
+            return True
+        return False
+
+    def feed_lines(self, lines):
+        """ Classify list of output lines. Returns: False if any line signals a failure """
+        status = True
+        for line_str in lines:
+            status = self.feed(line_str) and status
+        return status
+
+
+def parse_jlink_output(lines):
+    output = JLinkOutput()
+    output.feed_lines(lines)
+    return output
@@ -0,0 +1,303 @@
+"""
+@file jlink_session.py
+
+@brief Persistent J-Link Commander session - shared by all programming tools (VV_GUI, FW_prog).
+One JLinkExe process is kept attached to target - commands are written to its STDIN,
+and output is collected from STDOUT until the 'J-Link>' prompt shows up again.
+Allows e.g. polling of target memory without a new JLinkExe process (and USB connect) per read.
+Output is classified by 'JLinkOutput' - prompt handling and error detection exist in this module only:
+'JLinkSession' (blocking, reader thread) and 'AsyncJLinkSession' (asyncio subprocess) differ in I/O only.
+"""
+
+import asyncio
+import os
+import queue
+import subprocess
+import threading
+
+from .jlink_output import JLinkOutput
+from .prog_trace import tracer
+
+
+JLINK_PROMPT = b'J-Link>'
+JLINK_SESSION_TIMEOUT = 30      # in seconds - max. time for connect, or for a single command to complete
+JLINK_SELECT_PROBE_OPTION = '-SelectEmuBySN'    # Selects J-Link probe by its serial number
+
+
+def get_probe_sn(jlink_options):
+    """ J-Link probe serial number from J-Link options ('-SelectEmuBySN <sn>') - None if no probe selected. """
+    options = [option.lower() for option in jlink_options]
+    if JLINK_SELECT_PROBE_OPTION.lower() in options[:-1]:
+        return jlink_options[options.index(JLINK_SELECT_PROBE_OPTION.lower()) + 1]
+    return None
+
+
+def split_at_prompt(output: bytes):
+    """ Output received before J-Link prompt - None if prompt not (yet) received. """
+    output = output.rstrip()
+    if output.endswith(JLINK_PROMPT):
+        return output[:-len(JLINK_PROMPT)]
+    return None
+
+
+class JLinkSessionBase:
+    """ Session state and output handling - I/O is done by subclasses. """
+
+    def __init__(self, jlink_exe, jlink_options, timeout=JLINK_SESSION_TIMEOUT, verbose=True):
+        self.jlink_exe = jlink_exe
+        self.jlink_options = list(jlink_options)
+        self.timeout = timeout
+        self.verbose = verbose
+        self.probe_sn = get_probe_sn(self.jlink_options)
+        self.proc = None
+        self.connected = False
+
+    def _print(self, text, verbose_only=False):
+        if self.verbose or not verbose_only:
+            print(f"[{self.probe_sn}] {text}" if self.probe_sn is not None else text, flush=True)
+
+    def _get_lines(self, output: bytes):
+        lines_out = [line.decode('latin1', 'ignore') for line in output.splitlines()]
+        for line_str in lines_out:
+            self._print(line_str, verbose_only=True)
+        return lines_out
+
+    def _get_output_until_prompt(self, output: bytes, data: bytes):
+        """ Add received 'data' to 'output'. Returns: (output, lines before prompt - None until prompt received) """
+        output += data
+        before_prompt = split_at_prompt(output)
+        return output, (None if before_prompt is None else self._get_lines(before_prompt))
+
+    def _check_connect(self, prompt_seen, lines_out):
+        self.connected = prompt_seen and JLinkOutput().feed_lines(lines_out)
+        return self.connected
+
+    def _check_cmd(self, output, prompt_seen, cmd_out):
+        """ Classify command output. Returns: command status - session is lost w/o prompt """
+        cmd_status = output.feed_lines(cmd_out) and prompt_seen
+        if not prompt_seen:
+            self.connected = False
+        return cmd_status
+
+    def _get_cmd_stage(self, cmd):
+        # Stage is named by J-Link command (e.g. 'erase', 'loadfile') - full command line in args:
+        return tracer.stage(cmd.split()[0] if cmd.strip() else cmd, cat='jlink_cmd', probe=self.probe_sn, cmd=cmd)
+
+
+class JLinkSession(JLinkSessionBase):
+    """
+    Use as context manager:
+        with JLinkSession(jlink_exe, jlink_options) as session:
+            status, out_text = session.run_cmds(["r", "g"])
+            value = session.read_mem32(0x20000000)
+    """
+
+    def __init__(self, jlink_exe, jlink_options, timeout=JLINK_SESSION_TIMEOUT, verbose=True):
+        super().__init__(jlink_exe, jlink_options, timeout, verbose)
+        self.out_queue = queue.Queue()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _reader(self):
+        # Raw reads - the prompt is NOT terminated by newline, so line-based reading would block:
+        fd = self.proc.stdout.fileno()
+        while True:
+            data = os.read(fd, 4096)
+            self.out_queue.put(data)
+            if not data:
+                break
+
+    def _read_until_prompt(self):
+        """ Collect output until J-Link prompt (or EOF/timeout). Returns: (prompt_seen, list of lines) """
+        output = b''
+        while True:
+            try:
+                data = self.out_queue.get(timeout=self.timeout)
+            except queue.Empty:
+                self._print("ERROR: timeout from running J-Link!")
+                break
+            if not data:
+                break
+            output, lines_out = self._get_output_until_prompt(output, data)
+            if lines_out is not None:
+                return True, lines_out
+        return False, self._get_lines(output)
+
+    def open(self):
+        cmd_with_args = [self.jlink_exe] + self.jlink_options
+        self._print("Opening J-Link session: " + str(cmd_with_args))
+        startup_info = None
+        if os.name != 'posix':
+            startup_info = subprocess.STARTUPINFO()
+            startup_info.dwFlags = subprocess.CREATE_NEW_CONSOLE | subprocess.STARTF_USESHOWWINDOW
+            startup_info.wShowWindow = subprocess.SW_HIDE
+        # Process start + USB enumeration + target connect:
+        with tracer.stage("J-Link connect", cat='jlink', probe=self.probe_sn) as stage:
+            self.proc = subprocess.Popen(cmd_with_args,
+                                         shell=False,
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT,
+                                         startupinfo=startup_info)
+            threading.Thread(target=self._reader, daemon=True).start()
+            prompt_seen, lines_out = self._read_until_prompt()
+            stage['status'] = self._check_connect(prompt_seen, lines_out)
+        return self.connected, lines_out
+
+    def run_cmds(self, cmds, echo=False):
+        """ Run J-Link commands (list of str, w/o 'q') in session. Returns: (status, list of output lines) """
+        status, output = self.run_cmds_parsed(cmds, echo=echo)
+        return status, output.lines
+
+    def run_cmds_parsed(self, cmds, output=None, echo=False):
+        """
+        Run J-Link commands in session - output is classified while collected.
+        Returns: (status, JLinkOutput) - new, or 'output' extended if given
+        """
+        if output is None:
+            output = JLinkOutput()
+        status = self.connected
+        if not self.connected:
+            self._print("ERROR: J-Link session is not connected!")
+            return status, output
+        for cmd in cmds:
+            if echo:
+                self._print("J-Link> " + cmd)
+            with self._get_cmd_stage(cmd) as stage:
+                try:
+                    self.proc.stdin.write((cmd + "\n").encode('ascii'))
+                    self.proc.stdin.flush()
+                except OSError:
+                    self._print("ERROR: J-Link session terminated!")
+                    self.connected = False
+                    stage['status'] = False
+                    return False, output
+                output.start_cmd(cmd)
+                prompt_seen, cmd_out = self._read_until_prompt()
+                cmd_status = stage['status'] = self._check_cmd(output, prompt_seen, cmd_out)
+            status = cmd_status and status
+            if not self.connected:
+                return False, output
+        return status, output
+
+    def read_mem32(self, addr):
+        """ Read one 32-bit word from target. Returns: value, or None if read failed """
+        status, output = self.run_cmds_parsed([f"mem32 0x{addr:X},1"])
+        return output.mem32.get(addr) if status else None
+
+    def close(self):
+        if self.proc is None:
+            return
+        with tracer.stage("J-Link close", cat='jlink', probe=self.probe_sn) as stage:
+            try:
+                self.proc.stdin.write(b"q\n")
+                self.proc.stdin.flush()
+                self.proc.stdin.close()
+                self.proc.wait(timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+            stage['exit_code'] = self.proc.returncode
+            stage['status'] = self.proc.returncode == 0
+        self.proc.stdout.close()
+        self.proc = None
+        self.connected = False
+
+
+class AsyncJLinkSession(JLinkSessionBase):
+    """
+    asyncio version of 'JLinkSession' - no thread per session. Use as async context manager:
+        async with AsyncJLinkSession(jlink_exe, jlink_options) as session:
+            status, out_text = await session.run_cmds(["r", "erase"])
+    """
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # Cancelled (or timed out) - J-Link may be stuck in a command, so do not wait for it to quit:
+        await self.close(kill=exc_type is not None and issubclass(exc_type, asyncio.CancelledError))
+
+    async def _read_until_prompt(self):
+        """ Collect output until J-Link prompt (or EOF/timeout). Returns: (prompt_seen, list of lines) """
+        output = b''
+        while True:
+            try:
+                data = await asyncio.wait_for(self.proc.stdout.read(4096), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self._print("ERROR: timeout from running J-Link!")
+                break
+            if not data:
+                break
+            output, lines_out = self._get_output_until_prompt(output, data)
+            if lines_out is not None:
+                return True, lines_out
+        return False, self._get_lines(output)
+
+    async def open(self):
+        cmd_with_args = [self.jlink_exe] + self.jlink_options
+        self._print("Opening J-Link session: " + str(cmd_with_args), verbose_only=True)
+        with tracer.stage("J-Link connect", cat='jlink', probe=self.probe_sn) as stage:
+            self.proc = await asyncio.create_subprocess_exec(*cmd_with_args,
+                                                             stdin=asyncio.subprocess.PIPE,
+                                                             stdout=asyncio.subprocess.PIPE,
+                                                             stderr=asyncio.subprocess.STDOUT)
+            prompt_seen, lines_out = await self._read_until_prompt()
+            stage['status'] = self._check_connect(prompt_seen, lines_out)
+        return self.connected, lines_out
+
+    async def run_cmds(self, cmds):
+        """ Run J-Link commands (list of str, w/o 'q') in session. Returns: (status, list of output lines) """
+        status, output = await self.run_cmds_parsed(cmds)
+        return status, output.lines
+
+    async def run_cmds_parsed(self, cmds, output=None):
+        """ Run J-Link commands in session. Returns: (status, JLinkOutput) - new, or 'output' extended if given """
+        if output is None:
+            output = JLinkOutput()
+        status = self.connected
+        if not self.connected:
+            self._print("ERROR: J-Link session is not connected!")
+            return status, output
+        for cmd in cmds:
+            self._print("J-Link> " + cmd, verbose_only=True)
+            with self._get_cmd_stage(cmd) as stage:
+                try:
+                    self.proc.stdin.write((cmd + "\n").encode('ascii'))
+                    await self.proc.stdin.drain()
+                except (OSError, ConnectionError):
+                    self._print("ERROR: J-Link session terminated!")
+                    self.connected = False
+                    stage['status'] = False
+                    return False, output
+                output.start_cmd(cmd)
+                prompt_seen, cmd_out = await self._read_until_prompt()
+                cmd_status = stage['status'] = self._check_cmd(output, prompt_seen, cmd_out)
+            status = cmd_status and status
+            if not self.connected:
+                return False, output
+        return status, output
+
+    async def close(self, kill=False):
+        """ End session - J-Link is killed if 'kill', or if it does not quit in time. """
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        self.connected = False
+        if not kill:
+            try:
+                proc.stdin.write(b"q\n")
+                await proc.stdin.drain()
+                proc.stdin.close()
+                await asyncio.wait_for(proc.wait(), timeout=self.timeout)
+            except (OSError, ConnectionError, asyncio.TimeoutError):
+                pass
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
@@ -0,0 +1,183 @@
+"""
+@file prog_trace.py
+
+@brief Timing trace for programming tools - duration and status of every J-Link invocation and programming step.
+Events are appended to a JSON-lines file (one JSON object per line), so gang-programming worker processes
+can all write to the same trace. A trace can be converted to Chrome trace format afterwards
+(open in 'chrome://tracing' or https://ui.perfetto.dev - one row per process, i.e. per probe).
+
+Use e.g.:
+    tracer.enable("station1.trace.jsonl")
+    with tracer.stage("J-Link connect", cat='jlink', probe='600111111') as stage:
+        ...
+        stage['status'] = connected
+
+    @traced()
+    def fw_prepare_target(...):
+        ...
+"""
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+TRACE_FILE_ENV = 'PROG_TRACE_FILE'      # Trace file is passed to worker processes in environment
+
+
+class StageTracer:
+    """ Records stages (name, start, duration, status) - only while enabled. """
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.trace_file is not None
+
+    def enable(self, trace_file, append=True):
+        """ Start tracing to 'trace_file' - also for processes started from now on. """
+        if not append:
+            open(trace_file, 'w').close()
+        self.trace_file = trace_file
+        os.environ[TRACE_FILE_ENV] = trace_file
+
+    def disable(self):
+        self.trace_file = None
+        os.environ.pop(TRACE_FILE_ENV, None)
+
+    def record(self, name, t_start, duration, status=None, cat='step', **args):
+        """ Append one event - 't_start' is wall-clock time (time.time()), 'duration' in seconds. """
+        if self.trace_file is None:
+            return
+        event = {'name': name, 'cat': cat, 'start': t_start, 'duration': duration, 'status': status,
+                 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args}
+        # One write per event (append mode) - lines from several processes do not interleave:
+        with self.lock, open(self.trace_file, 'a') as fp:
+            fp.write(json.dumps(event) + "\n")
+
+    @contextlib.contextmanager
+    def stage(self, name, cat='step', **args):
+        """
+        Time the 'with' block. Yields a dict - set 'status' in it (and any other keys, recorded as event args).
+        An exception ends the stage w. status 'exception'.
+        """
+        stage_info = dict(args, status=None)
+        if self.trace_file is None:
+            yield stage_info
+            return
+        t_start = time.time()
+        t_perf = time.perf_counter()
+        try:
+            yield stage_info
+        except BaseException:
+            stage_info['status'] = 'exception'
+            raise
+        finally:
+            duration = time.perf_counter() - t_perf
+            status = stage_info.pop('status')
+            self.record(name, t_start, duration, status, cat, **stage_info)
+
+
+def _get_status(result):
+    """ Status from a step's return value: bool, or 1st/last bool of a tuple (e.g. '(status, output)'). """
+    if isinstance(result, bool):
+        return result
+    if isinstance(result, tuple) and result:
+        for value in (result[0], result[-1]):
+            if isinstance(value, bool):
+                return value
+    return None
+
+
+tracer = StageTracer(os.environ.get(TRACE_FILE_ENV))
+
+
+def traced(name=None, cat='step'):
+    """ Decorator - every call of function is a stage (named as function, unless 'name' given). """
+    def decorator(func):
+        stage_name = func.__name__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if tracer.trace_file is None:
+                return func(*args, **kwargs)
+            with tracer.stage(stage_name, cat) as stage:
+                result = func(*args, **kwargs)
+                stage['status'] = _get_status(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def read_trace(trace_file) -> list:
+    """ Events from JSON-lines trace file - a partly written last line (process killed) is skipped. """
+    events = []
+    with open(trace_file, 'r') as fp:
+        for line in fp:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                pass
+    return events
+
+
+def write_chrome_trace(events, out_file):
+    """ Write events in Chrome trace format ('complete' events, times in microseconds). """
+    trace_events = []
+    process_names = {}
+    for event in events:
+        args = dict(event['args'], status=event['status'])
+        trace_events.append({'name': event['name'], 'cat': event['cat'], 'ph': 'X',
+                             'ts': event['start'] * 1e6, 'dur': event['duration'] * 1e6,
+                             'pid': event['pid'], 'tid': event['tid'], 'args': args})
+        if event['args'].get('probe') is not None:
+            process_names[event['pid']] = f"probe {event['args']['probe']} (pid {event['pid']})"
+    for pid, process_name in process_names.items():
+        trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': process_name}})
+    with open(out_file, 'w') as fp:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, fp)
+    return out_file
+
+
+def get_stage_summary(events) -> dict:
+    """ Per stage name: (no. of calls, total seconds, no. of failed calls). """
+    summary = {}
+    for event in events:
+        num_calls, seconds, num_failed = summary.get(event['name'], (0, 0.0, 0))
+        summary[event['name']] = (num_calls + 1, seconds + event['duration'],
+                                  num_failed + (event['status'] in (False, 'exception')))
+    return summary
+
+
+# ******************* TESTS / BENCHMARK **********************
+if __name__ == "__main__":
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    @traced()
+    def fake_step(seconds):
+        time.sleep(seconds)
+        return seconds < 0.05, "output"
+
+    def fake_board(probe):
+        with tracer.stage("program_board", probe=probe) as stage:
+            results = [fake_step(0.01), fake_step(0.02 * probe)]
+            stage['status'] = all(status for status, _ in results)
+        return probe
+
+    test_dir = tempfile.mkdtemp()
+    test_trace = os.path.join(test_dir, "test.trace.jsonl")
+    tracer.enable(test_trace, append=False)
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        list(pool.map(fake_board, range(4)))
+    tracer.disable()
+    test_events = read_trace(test_trace)
+    for stage_name, (calls, total, failed) in get_stage_summary(test_events).items():
+        print(f"{stage_name:15s} {calls:3d} call(s) {total * 1000:8.1f} ms  {failed} failed")
+    assert len({event['pid'] for event in test_events}) > 1
+    print("Chrome trace: " + write_chrome_trace(test_events, os.path.join(test_dir, "test.trace.json")))
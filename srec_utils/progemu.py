@@ -2,29 +2,81 @@
 @file progemu.py
 
 @brief Emulates Flash program-memory of microcontroller.
-The implementation is a bytearray.
+The implementation is a bytearray - or optionally an mmap'ed file (persistent image).
+All writes/erases are done in-place via slice-assignment (no per-byte copying).
 """
 
-from srecutils import get_srec_addr_and_data
+import mmap
+import os
+
+from srecutils import iter_srec_file
 from CRCCCITT import CRCCCITT
 
 
 ONE_KB = 1024
 FLASH_SIZE = ONE_KB * 116                   # VV ver.1 has 116KB image-sizes
+SECTOR_SIZE = ONE_KB                        # Flash sector size - also used as CRC-cache block size
 
 
 class ProgMem:
-    def __init__(self, image_offset=0x6000, pmem_size=FLASH_SIZE, debug: bool = False):
-        self.prog_mem = bytearray([0xFF]*pmem_size)
+    def __init__(self, image_offset=0x6000, pmem_size=FLASH_SIZE, block_size=SECTOR_SIZE, backing_file: str = None,
+                 debug: bool = False):
+        self.backing_fp = None
+        if backing_file is None:
+            self.prog_mem = bytearray(b'\xFF') * pmem_size
+        else:
+            # Existing image-file contents is kept - a new (or too short) file is padded w. erased(=0xFF) bytes:
+            self.backing_fp = open(backing_file, 'a+b')
+            file_size = os.fstat(self.backing_fp.fileno()).st_size
+            if file_size < pmem_size:
+                self.backing_fp.write(b'\xFF' * (pmem_size - file_size))
+                self.backing_fp.flush()
+            self.prog_mem = mmap.mmap(self.backing_fp.fileno(), pmem_size)
         self.prog_offset = image_offset       
         self.psize = pmem_size
         self.debug = debug                 
+        # CRC-cache: one CRC (w. starting value=0) per block, re-calculated for 'dirty' blocks only:
+        self.crc_calc = CRCCCITT()
+        self.block_size = block_size
+        self.num_blocks = pmem_size // block_size        # NOTE: a trailing partial block is not cached
+        self.block_crcs = [0] * self.num_blocks
+        self.dirty_blocks = set(range(self.num_blocks))
+        # Shift-tables for CRC combination - CRC of 'block_size' zero-bytes is linear in the starting value:
+        zero_block = bytes(block_size)
+        self.crc_shift_hi = [self.crc_calc.calculate_accumulated(zero_block, val << 8) for val in range(256)]
+        self.crc_shift_lo = [self.crc_calc.calculate_accumulated(zero_block, val) for val in range(256)]
 
     def progmem_info(self):
         print(f"Progmem length: {len(self.prog_mem)} bytes ({len(self.prog_mem)/ONE_KB} KB)")
 
+    def progmem_close(self):
+        """ Flush and close image-file (if memory is backed by mmap'ed file). """
+        if self.backing_fp is not None:
+            self.prog_mem.flush()
+            self.prog_mem.close()
+            self.backing_fp.close()
+            self.backing_fp = None
+
+    def progmem_view(self, start_addr: int, length: int) -> memoryview:
+        """ Zero-copy (read-only) view of 'length' bytes of program memory from (absolute) 'start_addr'. """
+        prog_start_addr = start_addr - self.prog_offset
+        if prog_start_addr < 0 or prog_start_addr + length > self.psize:
+            print(f"ERROR: address range 0x{start_addr:X} - 0x{start_addr + length - 1:X} is outside program memory!")
+            raise ValueError
+        return memoryview(self.prog_mem).toreadonly()[prog_start_addr:prog_start_addr + length]
+
     def progmem_fill(self, val: int = 0xFF):
-        self.prog_mem = bytearray([val]*self.psize)
+        # Fill in-place, one block at a time - avoids allocating a new 'psize' buffer for every erase:
+        fill_block = bytes([val]) * self.block_size
+        pmem_view = memoryview(self.prog_mem)
+        for block_start in range(0, self.psize, self.block_size):
+            block_end = min(block_start + self.block_size, self.psize)
+            pmem_view[block_start:block_end] = fill_block[:block_end - block_start]
+        pmem_view.release()
+        # All blocks are equal after a fill - one CRC covers them all:
+        fill_crc = self.crc_calc.calculate_accumulated(fill_block, 0)
+        self.block_crcs = [fill_crc] * self.num_blocks
+        self.dirty_blocks.clear()
 
     def progmem_erase(self):
         self.progmem_fill()
@@ -38,11 +90,14 @@ class ProgMem:
             print(f"ERROR: START-address = 0x{start_addr:X} is below image-OFFSET = 0x{self.prog_offset:X}")
             raise ValueError
         #
-        data_len = len(data)   # TODO: check data-length too!
+        data_len = len(data)
         end_addr = prog_start_addr + (data_len - 1)
+        if end_addr >= self.psize:
+            print(f"ERROR: END-address = 0x{start_addr + data_len - 1:X} is beyond program memory size = 0x{self.psize:X}")
+            raise ValueError
         #
-        for i in range(data_len):
-            self.prog_mem[prog_start_addr + i] = data[i]
+        self.prog_mem[prog_start_addr:prog_start_addr + data_len] = data
+        self.dirty_blocks.update(range(prog_start_addr // self.block_size, end_addr // self.block_size + 1))
         # DEBUG:
         if self.debug:
             print(f"Wrote {data_len} bytes to address range 0x{prog_start_addr:X} - 0x{end_addr:X}")
@@ -50,19 +105,37 @@ class ProgMem:
         return data_len
 
     def progmem_crc(self) -> int:
-        crc_calc = CRCCCITT()
-        check_sum = crc_calc.calculate(self.prog_mem)
+        """
+        CRC-CCITT(XModem) of entire program memory.
+        Only blocks written since last call are re-calculated - cached block-CRCs are then combined
+        using crc(s, block) = crc(s, zeros) ^ crc(0, block), where crc(s, zeros) comes from the shift-tables.
+        """
+        pmem_view = memoryview(self.prog_mem)
+        bsize = self.block_size
+        for block in self.dirty_blocks:
+            if block < self.num_blocks:
+                self.block_crcs[block] = self.crc_calc.calculate_accumulated(pmem_view[block*bsize:(block+1)*bsize], 0)
+        self.dirty_blocks.clear()
+        #
+        check_sum = self.crc_calc.starting_value
+        for block_crc in self.block_crcs:
+            check_sum = self.crc_shift_hi[check_sum >> 8] ^ self.crc_shift_lo[check_sum & 0xFF] ^ block_crc
+        # Trailing partial block (if any):
+        if self.num_blocks * bsize < self.psize:
+            check_sum = self.crc_calc.calculate_accumulated(pmem_view[self.num_blocks*bsize:], check_sum)
+        pmem_view.release()
         return check_sum
 
+    def progmem_crc_full(self) -> int:
+        """ CRC-CCITT(XModem) of entire program memory - no caching (reference for 'progmem_crc'). """
+        with memoryview(self.prog_mem) as pmem_view:
+            return self.crc_calc.calculate(pmem_view)
+
     def progmem_load(self, filename: str):
-        with open(filename, 'r') as srec_file:
-            s_records = srec_file.readlines()
-        # Program:
+        # Program - records are streamed from file (constant memory, regardless of file size):
         total_bytes_programmed = 0
-        for s_record in s_records:
-            if s_record.startswith('S2'):                     # DATA-record (w. 24-bit address)?
-                addr, data = get_srec_addr_and_data(s_record)
-                total_bytes_programmed += self.progmem_write(addr, data)
+        for addr, data in iter_srec_file(filename, record_types=(2,)):     # DATA-records (w. 24-bit address) only
+            total_bytes_programmed += self.progmem_write(addr, data)
         #
         print(f"\nFINISHED programming! Wrote {total_bytes_programmed} bytes to program memory.")
 
@@ -85,6 +158,33 @@ if __name__ == "__main__":
     pmem.progmem_load("srec_utils/FW2.srec")
     print(f"Programmed pmem checksum: 0x{pmem.progmem_crc():X}")
     #pmem.progmem_write( 0x5000, bytearray([0x0A, 0x0B, 0x0C]) )
+    #
+    # Incremental (cached) CRC vs. full re-calculation after many small writes:
+    import random
+    import time
+    NUM_PARTIAL_UPDATES = 5000
+    pmem.debug = False
+    t_start = time.perf_counter()
+    for _ in range(NUM_PARTIAL_UPDATES):
+        pmem.progmem_write(0x23000 + random.randrange(0, FLASH_SIZE - 16), bytearray(random.randbytes(16)))
+        crc_incr = pmem.progmem_crc()
+    t_incr = time.perf_counter() - t_start
+    assert crc_incr == pmem.progmem_crc_full()
+    t_start = time.perf_counter()
+    for _ in range(NUM_PARTIAL_UPDATES):
+        pmem.progmem_crc_full()
+    t_full = time.perf_counter() - t_start
+    print(f"{NUM_PARTIAL_UPDATES} x (16-byte write + CRC): cached={t_incr:.3f}s, full CRC only={t_full:.3f}s")
+    #
+    # Persistent image - backed by mmap'ed file:
+    import tempfile
+    image_file = os.path.join(tempfile.gettempdir(), "progemu_FW2.bin")
+    pmem = ProgMem(image_offset=0x23000, backing_file=image_file)
+    pmem.progmem_erase()
+    pmem.progmem_load("srec_utils/FW2.srec")
+    print(f"mmap'ed pmem checksum: 0x{pmem.progmem_crc():X} (vector table: {pmem.progmem_view(0x23000, 8).hex()})")
+    pmem.progmem_close()
+    os.remove(image_file)
     
 
 
@@ -0,0 +1,163 @@
+"""
+@file serial_allocator.py
+
+@brief Serial number allocator w. persistent ledger (SQLite).
+Blocks of serial numbers are reserved atomically - several programming tools/stations (processes)
+can draw from the same ledger file without ever getting the same serial number.
+Every serial number handed out (or registered manually) stays in the ledger w. its status:
+'reserved' --> 'programmed' or 'failed'. Serial numbers are never re-used.
+Blocks are taken from the lowest free serial numbers in range - manually registered serial numbers
+(e.g. a high one) do not use up the rest of the range.
+"""
+
+import os
+import sqlite3
+import time
+
+
+DEFAULT_LEDGER_FILE = os.path.join(os.path.expanduser('~'), '.serial_ledger.sqlite')
+LEDGER_LOCK_TIMEOUT = 30.0      # in seconds - max. wait for other process holding ledger lock
+
+SERIAL_STATUS_RESERVED = 'reserved'
+SERIAL_STATUS_PROGRAMMED = 'programmed'
+SERIAL_STATUS_FAILED = 'failed'
+
+
+class SerialAllocator:
+    """
+    Use e.g.:
+        allocator = SerialAllocator(product='irrigation_sensor', first_serial=1, last_serial=65535)
+        for serial in allocator.reserve(4, owner='station1'):
+            ...
+            allocator.set_status(serial, SERIAL_STATUS_PROGRAMMED)
+    """
+
+    def __init__(self, ledger_file=None, product='default', first_serial=1, last_serial=0xFFFFFFFF):
+        self.ledger_file = DEFAULT_LEDGER_FILE if ledger_file is None else ledger_file
+        self.product = product
+        self.first_serial = first_serial
+        self.last_serial = last_serial
+        # Autocommit mode - transactions are explicit ('BEGIN IMMEDIATE' takes write-lock up front):
+        self.db = sqlite3.connect(self.ledger_file, timeout=LEDGER_LOCK_TIMEOUT, isolation_level=None)
+        self.db.execute("CREATE TABLE IF NOT EXISTS serials ("
+                        "product TEXT NOT NULL, serial INTEGER NOT NULL, status TEXT NOT NULL, owner TEXT, "
+                        "updated REAL NOT NULL, PRIMARY KEY (product, serial))")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _find_free_block(self, count):
+        """ Lowest start of 'count' consecutive serial numbers not in ledger - None if range has no such block. """
+        # Candidates: start of range, and the serial number just above each used one:
+        row = self.db.execute(
+            "SELECT start FROM (SELECT ? AS start UNION SELECT serial + 1 FROM serials "
+            "                   WHERE product=? AND serial >= ? AND serial < ?) "
+            "WHERE start + ? - 1 <= ? AND NOT EXISTS "
+            "(SELECT 1 FROM serials WHERE product=? AND serial BETWEEN start AND start + ? - 1) "
+            "ORDER BY start LIMIT 1",
+            (self.first_serial, self.product, self.first_serial, self.last_serial, count, self.last_serial,
+             self.product, count)).fetchone()
+        return None if row is None else row[0]
+
+    def _check_range(self, serial):
+        if not self.first_serial <= serial <= self.last_serial:
+            raise ValueError(f"Serial number {serial} out of range ({self.first_serial}-{self.last_serial})!")
+
+    def reserve(self, count=1, owner=None) -> list:
+        """ Reserve block of 'count' consecutive, never used serial numbers - lowest free block in range. Returns: list of serial numbers """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            first = self._find_free_block(count)
+            if first is None:
+                raise ValueError(f"No more serial numbers - no block of {count} free in range "
+                                 f"{self.first_serial}-{self.last_serial}!")
+            now = time.time()
+            serials = list(range(first, first + count))
+            self.db.executemany("INSERT INTO serials VALUES (?, ?, ?, ?, ?)",
+                                [(self.product, serial, SERIAL_STATUS_RESERVED, owner, now) for serial in serials])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return serials
+
+    def register_block(self, serials, owner=None, allow_used=False) -> list:
+        """
+        Register manually given serial numbers - all or none: if any is already in ledger, none is registered
+        (unless 'allow_used' - then only the new ones are). Raises ValueError for serial numbers out of range.
+        Returns: list of serial numbers already in ledger
+        """
+        for serial in serials:
+            self._check_range(serial)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            used = [serial for serial in serials if self.get_status(serial) is not None]
+            if not used or allow_used:
+                now = time.time()
+                self.db.executemany("INSERT OR IGNORE INTO serials VALUES (?, ?, ?, ?, ?)",
+                                    [(self.product, serial, SERIAL_STATUS_RESERVED, owner, now) for serial in serials])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return used
+
+    def register(self, serial, owner=None) -> bool:
+        """ Register manually given serial number. Returns: False if serial number is already in ledger """
+        return not self.register_block([serial], owner)
+
+    def set_status(self, serial, status):
+        self.db.execute("UPDATE serials SET status=?, updated=? WHERE product=? AND serial=?",
+                        (status, time.time(), self.product, serial))
+
+    def get_status(self, serial):
+        """ Returns: status of serial number - or None if not in ledger """
+        row = self.db.execute("SELECT status FROM serials WHERE product=? AND serial=?",
+                              (self.product, serial)).fetchone()
+        return None if row is None else row[0]
+
+
+# ******************* TESTS / BENCHMARK **********************
+if __name__ == "__main__":
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    def reserve_blocks(ledger_file, num_blocks, block_size):
+        with SerialAllocator(ledger_file, product='test') as allocator:
+            return [serial for _ in range(num_blocks) for serial in allocator.reserve(block_size)]
+
+    test_ledger = os.path.join(tempfile.mkdtemp(), "ledger.sqlite")
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=8) as pool:
+        jobs = [pool.submit(reserve_blocks, test_ledger, 50, 4) for _ in range(8)]
+        all_serials = [serial for job in jobs for serial in job.result()]
+    t_elapsed = time.perf_counter() - t_start
+    assert len(all_serials) == len(set(all_serials)) == 8 * 50 * 4
+    print(f"8 processes x 50 blocks of 4: {len(all_serials)} unique serial numbers in {t_elapsed:.2f} sec")
+    with SerialAllocator(test_ledger, product='test') as allocator:
+        assert not allocator.register(all_serials[0])
+        allocator.set_status(all_serials[0], SERIAL_STATUS_PROGRAMMED)
+        print(f"Serial {all_serials[0]}: {allocator.get_status(all_serials[0])}")
+    # Manual high serial number does not use up the range - and duplicates register nothing:
+    with SerialAllocator(test_ledger, product='test', last_serial=10000) as allocator:
+        assert allocator.register(9000)
+        assert allocator.reserve(2) == [len(all_serials) + 1, len(all_serials) + 2]
+        assert allocator.register_block([8999, 9000, 9001]) == [9000] and allocator.get_status(8999) is None
+        assert allocator.reserve(3) == [len(all_serials) + 3, len(all_serials) + 4, len(all_serials) + 5]
+        try:
+            allocator.register(10001)
+            assert False, "out-of-range serial number registered"
+        except ValueError:
+            pass
+    with SerialAllocator(test_ledger, product='test', first_serial=8999, last_serial=9001) as allocator:
+        assert allocator.reserve(1) == [8999] and allocator.reserve(1) == [9001]
+        print(f"Free blocks found in {allocator.db.execute('SELECT COUNT(*) FROM serials').fetchone()[0]} ledger entries")
+    os.remove(test_ledger)
@@ -0,0 +1,199 @@
+"""
+@file sparse_image.py
+
+@brief Sparse in-memory firmware image - data kept in contiguous segments, one buffer per segment.
+Adjacent (or overlapping) data is merged into one segment when added, so memory use is proportional to the image
+content, not to its address span (e.g. bootloader + CONFIG-sector + FW1 + FW2 on a 256 KB part).
+Segments are kept sorted by start address - an address is looked up by binary search: O(log n) for n segments.
+
+Use e.g.:
+    image = SparseImage.from_srec_file("FW1.srec")
+    image.add(0x5C00, config_data)
+    fw1_data = image.read(0x6000, 0x1D000)
+    for addr, data in image.segments():
+        ...
+"""
+
+import bisect
+
+from .srecutils import iter_srec_file
+
+
+ERASED_BYTE = 0xFF      # Value of bytes not in any segment (erased Flash)
+
+
+class SparseImage:
+    """ Data at addresses [start, end) - stored as sorted, non-adjacent segments (start address, bytearray). """
+
+    def __init__(self, segments=None):
+        self._starts = []       # Segment start addresses - sorted
+        self._buffers = []      # Segment data - one bytearray per segment
+        for addr, data in segments or ():
+            self.add(addr, data)
+
+    @classmethod
+    def from_srec_file(cls, srec_file):
+        """ Image from data records of SREC file - records may be in any address order. """
+        image = cls()
+        for addr, data in iter_srec_file(srec_file):
+            image.add(addr, data)
+        return image
+
+    def __len__(self):
+        """ No. of data bytes (not address span). """
+        return sum(len(buf) for buf in self._buffers)
+
+    def __eq__(self, other):
+        return isinstance(other, SparseImage) and self._starts == other._starts and self._buffers == other._buffers
+
+    def __contains__(self, addr):
+        return self._find(addr) is not None
+
+    def __getitem__(self, addr):
+        """ Byte at 'addr' - KeyError if not in image. """
+        idx = self._find(addr)
+        if idx is None:
+            raise KeyError(f"Address 0x{addr:X} not in image")
+        return self._buffers[idx][addr - self._starts[idx]]
+
+    def __repr__(self):
+        return "SparseImage(" + ", ".join(f"0x{start:X}-0x{end:X}" for start, end in self.ranges()) + ")"
+
+    @property
+    def start(self):
+        return self._starts[0] if self._starts else None
+
+    @property
+    def end(self):
+        return self._starts[-1] + len(self._buffers[-1]) if self._starts else None
+
+    @property
+    def num_segments(self):
+        return len(self._starts)
+
+    def _find(self, addr):
+        """ Index of segment containing 'addr' (or None). """
+        idx = bisect.bisect_right(self._starts, addr) - 1
+        if idx >= 0 and addr < self._starts[idx] + len(self._buffers[idx]):
+            return idx
+        return None
+
+    def segments(self):
+        """ Yields: (start address, memoryview of segment data) - in address order. """
+        for start, buf in zip(self._starts, self._buffers):
+            yield start, memoryview(buf)
+
+    def ranges(self):
+        """ Returns: list of (start, end) of segments """
+        return [(start, start + len(buf)) for start, buf in zip(self._starts, self._buffers)]
+
+    def add(self, addr, data, overwrite=True):
+        """
+        Add 'data' at 'addr' - merged w. segments it overlaps or adjoins.
+        Data already in image is replaced, unless 'overwrite' is False: then overlapping data raises ValueError.
+        """
+        end = addr + len(data)
+        if end == addr:
+            return
+        # Segments overlapping/adjoining [addr, end): idx_lo..idx_hi-1
+        idx_lo = bisect.bisect_right(self._starts, addr) - 1
+        if idx_lo < 0 or self._starts[idx_lo] + len(self._buffers[idx_lo]) < addr:
+            idx_lo += 1
+        idx_hi = bisect.bisect_right(self._starts, end)
+        if not overwrite and any(self._starts[idx] + len(self._buffers[idx]) > addr and self._starts[idx] < end
+                                 for idx in range(idx_lo, idx_hi)):
+            raise ValueError(f"Data at 0x{addr:X}-0x{end:X} overlaps image")
+        if idx_lo == idx_hi:
+            # New segment:
+            self._starts.insert(idx_lo, addr)
+            self._buffers.insert(idx_lo, bytearray(data))
+            return
+        seg_start = self._starts[idx_lo]
+        buf = self._buffers[idx_lo]
+        if seg_start <= addr:
+            # Common case (records in address order) - extended/overwritten in place:
+            buf[addr - seg_start:end - seg_start] = data
+        else:
+            buf[:end - seg_start] = data
+            seg_start = self._starts[idx_lo] = addr
+        # Following segments now joined - their data beyond 'end' is kept:
+        for idx in range(idx_lo + 1, idx_hi):
+            next_start, next_buf = self._starts[idx], self._buffers[idx]
+            if next_start + len(next_buf) > end:
+                buf += next_buf[end - next_start:]
+        del self._starts[idx_lo + 1:idx_hi]
+        del self._buffers[idx_lo + 1:idx_hi]
+
+    def merge(self, other, overwrite=True):
+        """ Add all segments of 'other' image - see 'add()'. Returns: self """
+        for addr, data in other.segments():
+            self.add(addr, data, overwrite)
+        return self
+
+    def crop(self, start, end):
+        """ New image w. data in [start, end) only. """
+        cropped = SparseImage()
+        idx = max(0, bisect.bisect_right(self._starts, start) - 1)
+        while idx < len(self._starts) and self._starts[idx] < end:
+            seg_start, buf = self._starts[idx], self._buffers[idx]
+            lo, hi = max(start, seg_start), min(end, seg_start + len(buf))
+            if hi > lo:
+                cropped._starts.append(lo)
+                cropped._buffers.append(buf[lo - seg_start:hi - seg_start])
+            idx += 1
+        return cropped
+
+    def read(self, addr, length, fill=ERASED_BYTE):
+        """ Bytes at [addr, addr + length) - gaps filled w. 'fill'. """
+        data = bytearray([fill]) * length
+        for seg_addr, seg_data in self.crop(addr, addr + length).segments():
+            data[seg_addr - addr:seg_addr - addr + len(seg_data)] = seg_data
+        return bytes(data)
+
+
+# ******************* TESTS / BENCHMARK **********************
+if __name__ == "__main__":
+    import os
+    import random
+    import sys
+    import time
+    #
+    srec_dir = os.path.dirname(os.path.abspath(__file__))
+    t_start = time.perf_counter()
+    fw1_image = SparseImage.from_srec_file(os.path.join(srec_dir, "FW1.srec"))
+    t_load = time.perf_counter() - t_start
+    fw2_image = SparseImage.from_srec_file(os.path.join(srec_dir, "FW2.srec"))
+    print(f"FW1: {fw1_image} - {len(fw1_image)} bytes, loaded in {t_load * 1000:.1f} ms")
+    print(f"FW2: {fw2_image} - {len(fw2_image)} bytes")
+    # Records added out of order/overlapping - same result as in order:
+    records = list(iter_srec_file(os.path.join(srec_dir, "FW1.srec")))
+    shuffled_image = SparseImage()
+    for rec_addr, rec_data in random.sample(records, len(records)):
+        shuffled_image.add(rec_addr, rec_data)
+    assert shuffled_image == fw1_image
+    # Multi-region image: bootloader stand-in + CONFIG-sector + FW1 + FW2:
+    full_image = SparseImage([(0x0, bytes(range(256)) * 16), (0x5C00, (1).to_bytes(4, 'little'))])
+    full_image.merge(fw1_image).merge(fw2_image)
+    print(f"Full image: {full_image}")
+    sparse_size = sum(sys.getsizeof(buf) for buf in full_image._buffers)
+    flat_size = sys.getsizeof(bytearray(full_image.end - full_image.start))
+    print(f"Memory: {sparse_size} bytes in {full_image.num_segments} segment(s) - flat span: {flat_size} bytes")
+    assert full_image.crop(fw1_image.start, fw1_image.end) == fw1_image
+    try:
+        full_image.add(0x5C00, b'\x00', overwrite=False)
+        assert False, "overlap not detected"
+    except ValueError:
+        pass
+    # Same content as flat Flash image:
+    flash = bytearray([ERASED_BYTE]) * 0x40000
+    for seg_addr, seg_data in full_image.segments():
+        flash[seg_addr:seg_addr + len(seg_data)] = seg_data
+    assert bytes(flash) == full_image.read(0, 0x40000)
+    assert all(full_image[addr] == flash[addr] for addr in random.sample(range(0x40000), 1000) if addr in full_image)
+    # Lookup speed:
+    queries = [random.randrange(0, 0x40000) for _ in range(100000)]
+    t_start = time.perf_counter()
+    for query_addr in queries:
+        query_addr in full_image
+    t_elapsed = time.perf_counter() - t_start
+    print(f"{len(queries)} address lookups: {t_elapsed * 1e6 / len(queries):.2f} us/lookup")
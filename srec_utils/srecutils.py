@@ -21,6 +21,8 @@
     - Kudos to Montreal CISSP Groupies
 """
 
+from array import array
+
 # Address len in bytes for S* types
 # http://www.amelek.gda.pl/avr/uisp/srecord.htm
 __ADDR_LEN = {'S0' : 2,
@@ -28,6 +30,7 @@ __ADDR_LEN = {'S0' : 2,
               'S2' : 3,
               'S3' : 4,
               'S5' : 2,
+              'S6' : 3,
               'S7' : 4,
               'S8' : 3,
               'S9' : 2}
@@ -199,3 +202,196 @@ def get_srec_addr_and_data(srec):
     #
     return addr, byte_data
 
+
+
+# Address len in bytes, indexed by numeric record type (i.e. 'S2' --> 2):
+_ADDR_LEN_BY_TYPE = {int(rtype[1]): addr_len for rtype, addr_len in __ADDR_LEN.items()}
+
+
+def decode_srec(srec, verify_checksum=False):
+    """
+        Decode a single S-Record (str, with or without line ending) using one 'bytes.fromhex()' call.
+        Returns: the numeric record type (ex: 2 for 'S2'), the address and the data as a memoryview
+    """
+    try:
+        rtype = int(srec[1])
+        addr_len = _ADDR_LEN_BY_TYPE[rtype]
+        raw = bytes.fromhex(srec[2:])
+    except (IndexError, KeyError, ValueError):
+        raise ValueError(f"Cannot parse S-Record: '{srec.strip()}'")
+    # 'raw' = count(1 byte) + address(2-4 bytes) + data + checksum(1 byte)
+    if verify_checksum and (sum(raw) & 0xFF) != 0xFF:
+        raise ValueError(f"Checksum error in S-Record: '{srec.strip()}'")
+    addr = int.from_bytes(raw[1:1 + addr_len], 'big')
+    return rtype, addr, memoryview(raw)[1 + addr_len:-1]
+
+
+def encode_srec(rtype, addr, data=b''):
+    """
+        Encode a single S-Record (w/o line ending) - inverse of 'decode_srec()'.
+        Returns: the S-Record string with count and checksum computed (ex: "S1130000...")
+    """
+    addr_len = _ADDR_LEN_BY_TYPE[rtype]
+    raw = bytearray([addr_len + len(data) + 1])
+    raw += addr.to_bytes(addr_len, 'big')
+    raw += data
+    raw.append(~sum(raw) & 0xFF)
+    return f"S{rtype}" + raw.hex().upper()
+
+
+def parse_srec_bulk(srec_buffer, verify_checksum=False):
+    """
+        Parse a complete S-Record file content (str, bytes or bytearray) in one pass.
+        Each record is decoded with a single 'bytes.fromhex()' call instead of hex pair by hex pair.
+        Returns: parallel arrays with record type, address and data length for each record,
+        plus one contiguous bytearray with the data of all records back-to-back
+        (data of record no.N starts at sum(lengths[:N]) in the payload).
+    """
+    if isinstance(srec_buffer, (bytes, bytearray, memoryview)):
+        srec_buffer = bytes(srec_buffer).decode('ascii')
+    #
+    rtypes = array('B')
+    addresses = array('L')
+    lengths = array('H')
+    payload = bytearray()
+    #
+    for line_no, srec in enumerate(srec_buffer.splitlines()):
+        srec = srec.strip()
+        if not srec:
+            continue
+        try:
+            rtype, addr, data = decode_srec(srec, verify_checksum=verify_checksum)
+        except ValueError as e:
+            raise ValueError(f"Line {line_no + 1}: {e}")
+        rtypes.append(rtype)
+        addresses.append(addr)
+        lengths.append(len(data))
+        payload += data
+    #
+    return rtypes, addresses, lengths, payload
+
+
+def parse_srec_file_bulk(filename, verify_checksum=False):
+    """
+        Read and parse a whole S-Record file in one go.
+        Returns: same as 'parse_srec_bulk()'
+    """
+    with open(filename, 'rb') as srec_file:
+        srec_buffer = srec_file.read()
+    #
+    return parse_srec_bulk(srec_buffer, verify_checksum=verify_checksum)
+
+
+# Streaming (bounded memory) S-Record reading:
+SREC_DATA_RECORD_TYPES = (1, 2, 3)
+SREC_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class SrecLineSplitter:
+    """
+        Split a stream of byte (or str) chunks into complete S-Record lines.
+        A partial line at the end of a chunk is kept until the next chunk arrives.
+        SRecords are separated by newline - file origin could mean only '\n'(POSIX) or '\r'+'\n'(WinXX).
+    """
+    def __init__(self):
+        self.pending = b''
+
+    def feed(self, chunk):
+        """ Returns: list of complete (stripped, non-empty) lines as str """
+        if isinstance(chunk, str):
+            chunk = chunk.encode('ascii')
+        lines = (self.pending + bytes(chunk)).replace(b'\r', b'\n').split(b'\n')
+        self.pending = lines.pop()
+        return [line.decode('ascii') for line in lines if line.strip()]
+
+    def flush(self):
+        """ Returns: the remaining line (if any) when stream has ended """
+        line = self.pending.strip()
+        self.pending = b''
+        return [line.decode('ascii')] if line else []
+
+
+def iter_srec_chunks(source, chunk_size=SREC_STREAM_CHUNK_SIZE):
+    """
+        Yield chunks from a file-like object (text or binary, read 'chunk_size' at a time)
+        or from any iterable of byte/str chunks.
+    """
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from source
+
+
+def iter_srec_lines(source, chunk_size=SREC_STREAM_CHUNK_SIZE):
+    """
+        Yield S-Record lines (str) from a file-like object or chunk iterable - with bounded memory.
+    """
+    splitter = SrecLineSplitter()
+    for chunk in iter_srec_chunks(source, chunk_size):
+        yield from splitter.feed(chunk)
+    yield from splitter.flush()
+
+
+def iter_srec_records(source, record_types=SREC_DATA_RECORD_TYPES, chunk_size=SREC_STREAM_CHUNK_SIZE,
+                      verify_checksum=False):
+    """
+        Yield decoded (addr, data) tuples for records of given (numeric) types - by default data records only.
+        'source' is a file-like object or an iterable of byte/str chunks. Memory use is bounded by 'chunk_size'.
+    """
+    for srec in iter_srec_lines(source, chunk_size):
+        rtype, addr, data = decode_srec(srec, verify_checksum=verify_checksum)
+        if record_types is None or rtype in record_types:
+            yield addr, data
+
+
+def iter_srec_file(filename, record_types=SREC_DATA_RECORD_TYPES, chunk_size=SREC_STREAM_CHUNK_SIZE,
+                   verify_checksum=False):
+    """
+        Yield decoded (addr, data) tuples from an S-Record file - see 'iter_srec_records()'.
+    """
+    with open(filename, 'rb') as srec_file:
+        yield from iter_srec_records(srec_file, record_types, chunk_size, verify_checksum)
+
+
+# ******************* BENCHMARK **********************
+if __name__ == "__main__":
+    import os
+    import timeit
+    #
+    srec_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FW1.srec")
+    with open(srec_name, 'r') as fp:
+        srec_text = fp.read()
+    srec_lines = srec_text.splitlines(keepends=True)
+    #
+    def per_line_parse():
+        payload = bytearray()
+        for s_record in srec_lines:
+            _, data = get_srec_addr_and_data(s_record)
+            payload += data
+        return payload
+    #
+    def bulk_parse():
+        return parse_srec_bulk(srec_text)
+    #
+    _, _, lengths, bulk_payload = bulk_parse()
+    print(f"Parsed {len(lengths)} records with {len(bulk_payload)} data bytes from '{srec_name}'")
+    #
+    NUM_RUNS = 10
+    t_line = timeit.timeit(per_line_parse, number=NUM_RUNS) / NUM_RUNS
+    t_bulk = timeit.timeit(bulk_parse, number=NUM_RUNS) / NUM_RUNS
+    print(f"Per-line parsing: {t_line * 1000:.2f} ms")
+    print(f"Bulk parsing:     {t_bulk * 1000:.2f} ms  (speedup x{t_line / t_bulk:.1f})")
+    #
+    def stream_parse():
+        payload = bytearray()
+        for _, data in iter_srec_file(srec_name, record_types=None):
+            payload += data
+        return payload
+    #
+    assert stream_parse() == bulk_payload
+    t_stream = timeit.timeit(stream_parse, number=NUM_RUNS) / NUM_RUNS
+    print(f"Stream parsing:   {t_stream * 1000:.2f} ms  (speedup x{t_line / t_stream:.1f})")
@@ -11,7 +11,7 @@ Created on Wed Apr 26 13:04:38 2017
 @author: ml
 """
 
-from .srecutils import parse_srec
+from .srecutils import SrecLineSplitter, decode_srec, iter_srec_lines
 
 
 class FirmwareVerify:
@@ -27,9 +27,10 @@ class FirmwareVerify:
     #
     def __init__(self, data, props=None):
         self.srec_props = props
+        self.line_splitter = SrecLineSplitter()
     #
     def check_srec(self, byte_chunk):
-        srec = list(byte_chunk)
+        srec = str(byte_chunk, encoding='ascii') if isinstance(byte_chunk, (bytes, bytearray)) else byte_chunk
         chk = False
         print("S-record no.%s: %s" % (self.srec_no, srec))
         print("-----------------")
@@ -41,44 +42,53 @@ class FirmwareVerify:
         # data 0-255 bytes
         # checksum = 1 byte
         # -----------------
-        record_type, data_len, addr, data, checksum = parse_srec(srec)
-        print("Record type: %s" % record_type)
-        print("Data length: %s" % data_len)
-        print("Address: %s" % addr)
-        print("Data: %s" % data)
-        print("Checksum(Rx): %s" % checksum)
-        # TODO: print calculated checksum ...
+        try:
+            record_type, addr, data = decode_srec(srec, verify_checksum=True)
+            chk = True
+        except ValueError as e:
+            print("Invalid S-record: %s" % e)
+            print("-----------------\n")
+            return chk
+        print("Record type: S%s" % record_type)
+        print("Data length: %s" % len(data))
+        print("Address: 0x%X" % addr)
+        print("Data: %s" % data.hex().upper())
+        print("Checksum: OK")
         print("-----------------\n")
         # may set 'status' depending on several criteria ...
         return chk
 
+    #
+    def verify_srec(self, srec):
+        chk = self.check_srec(srec)
+        if chk:
+            self.status = self.emulate_firmware_flashing(srec, 0)
+        else:
+            self.status = chk
+        self.srec_no += 1
+        return self.status
+
     #
     def verify_chunk(self, byte_chunk):
-        self.raw_data += byte_chunk
-        #
-        arr = bytearray()
-        # Traverse all bytes in chunk - build up all complete S-Records
-        for byte in byte_chunk:
-            # SRecords are separated by newline - file origin could mean only '\n'(POSIX) or '\r'+'\n'(WinXX)
-            if byte == 0xa or byte == 0xd:
-                if len(self.raw_data)>0:
-                    #chk = self.check_srec( str(arr, encoding='ascii') )
-                    chk = self.check_srec(arr)
-                    if chk:
-                        self.status = self.emulate_firmware_flashing(arr, 0)
-                    else:
-                        self.status = chk
-                    arr.clear()
-                    self.srec_no += 1
-            else:
-                arr.append(byte)
+        # Traverse chunk - all complete S-Records are checked, a partial S-Record is kept for next chunk:
+        for srec in self.line_splitter.feed(byte_chunk):
+            self.verify_srec(srec)
         #
         self.chunk_no += 1
-        # 'arr' typically contain a partial SRecord as a remainder from the byte-chunk:
-        self.raw_data = arr   
+        # 'raw_data' typically contain a partial SRecord as a remainder from the byte-chunk:
+        self.raw_data = self.line_splitter.pending
+
+    #
+    def verify_stream(self, source):
+        """ Verify all S-Records from a file-like object (or chunk iterable) - with bounded memory. """
+        # 'self.status' is per S-Record - a failed record must fail the whole stream:
+        status = True
+        for srec in iter_srec_lines(source):
+            status = self.verify_srec(srec) and status
+        return status
     #
 
-    def emulate_firmware_flashing(srec, prev_addr):
+    def emulate_firmware_flashing(self, srec, prev_addr):
         status = True
         # Flash logic:
         return status
@@ -5,10 +5,144 @@ Created on Mon Feb 26 16:29:51 2018
 @author: larsenm
 """
 
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
 valid_record_types = ["S0", "S1", "S2", "S3", "S4", "S5", "S6", "S7", "S8", "S9"]
 data_record_types = valid_record_types[1:4]
 type_to_address_length = {"S1": 4, "S2": 6, "S3": 8}
 
+# Check ids - as in error reports (one per 'VerifySrecord' check, plus file-level checks):
+CHECK_FORMAT = 'format'
+CHECK_LENGTH = 'length'
+CHECK_ADDRESS = 'address'
+CHECK_CRC = 'crc'
+CHECK_COUNT = 'count'               # S5/S6 record count vs. no. of data records
+CHECK_TERMINATION = 'termination'   # S7/S8/S9 record missing
+termination_record_types = valid_record_types[7:]
+
+SREC_CHECK_RESULTS_CAPACITY = 1024      # Failures held before result arrays are grown
+
+SREC_VALIDATE_POOL_MIN_SIZE = 8 * 1024 * 1024   # in bytes - smaller files are validated in-process (pool start-up costs more)
+SREC_VALIDATE_CHUNK_SIZE = 2 * 1024 * 1024      # in bytes - file part per worker-process job
+
+
+class SrecCheckResults:
+    """
+    @brief Failures collected by 'VerifySrecord.verify_silent()' - one entry per failed check.
+    Preallocated arrays (record index, check id, expected, actual) - no objects created per failure.
+    Check ids are the 'CHECK_*' constants, values are as returned by '_check_srec()'.
+    """
+
+    def __init__(self, capacity=SREC_CHECK_RESULTS_CAPACITY):
+        self.count = 0
+        self.record_index = array('q', bytes(8 * capacity))
+        self.check_id = [None] * capacity
+        self.expected = array('q', bytes(8 * capacity))
+        self.actual = array('q', bytes(8 * capacity))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """ Yields: (record index, check id, expected, actual) """
+        for idx in range(self.count):
+            yield self.record_index[idx], self.check_id[idx], self.expected[idx], self.actual[idx]
+
+    def add(self, record_index, check_id, expected, actual):
+        idx = self.count
+        if idx == len(self.check_id):
+            # Full - double capacity:
+            for field in (self.record_index, self.check_id, self.expected, self.actual):
+                field.extend(field)
+        self.record_index[idx] = record_index
+        self.check_id[idx] = check_id
+        self.expected[idx] = expected
+        self.actual[idx] = actual
+        self.count = idx + 1
+
+    def clear(self):
+        self.count = 0
+
+    def failed_records(self):
+        """ Indices of records w. at least one failed check. """
+        return sorted(set(self.record_index[:self.count]))
+
+
+def _srec_type_number(srec_type):
+    return int(srec_type[1]) if srec_type in valid_record_types else -1
+
+
+def _check_srec(srec, srec_type, addr_range):
+    """
+    Check format, length, checksum and address range of one record ('\r'/'\n' stripped, not empty).
+    The record is hex-decoded once - length and checksum are then checked on the bytes ('sum()' is done in C).
+    Only data records of 'srec_type' are range-checked - both first and last data byte must be within 'addr_range'.
+    Values are numbers: record types as type number (e.g. 2 for 'S2', -1 if not a valid record),
+    for address failures the violated limit and the first/last data byte address.
+    Returns: list of failures (check id, expected, actual) - empty if record is OK
+    """
+    rtype = srec[0:2]
+    if rtype not in valid_record_types:
+        return [(CHECK_FORMAT, _srec_type_number(srec_type), -1)]
+    try:
+        raw = bytes.fromhex(srec[2:])
+    except ValueError:
+        raw = b''
+    if len(raw) < 2:
+        # Not hex, or no count + checksum - other checks cannot run:
+        return [(CHECK_FORMAT, _srec_type_number(srec_type), -1)]
+    failures = []
+    if raw[0] != len(raw) - 1:
+        failures.append((CHECK_LENGTH, raw[0], len(raw) - 1))
+    checksum = ~sum(raw[:-1]) & 0xFF
+    if checksum != raw[-1]:
+        failures.append((CHECK_CRC, checksum, raw[-1]))
+    if rtype in data_record_types:
+        if rtype != srec_type:
+            failures.append((CHECK_FORMAT, _srec_type_number(srec_type), _srec_type_number(rtype)))
+            return failures
+        addr_min, addr_max = addr_range
+        addr_len = type_to_address_length[srec_type] // 2
+        addr = int.from_bytes(raw[1:1 + addr_len], 'big')
+        addr_last = addr + max(0, len(raw) - addr_len - 2) - 1
+        if addr < addr_min:
+            failures.append((CHECK_ADDRESS, addr_min, addr))
+        elif max(addr, addr_last) > addr_max:
+            failures.append((CHECK_ADDRESS, addr_max, max(addr, addr_last)))
+    return failures
+
+
+def _format_check_values(check, expected, actual):
+    """ Expected/actual values of a failed check as text - see '_check_srec()' """
+    if check == CHECK_FORMAT:
+        return "expected S%s, got %s" % (expected, "S%s" % actual if actual >= 0 else "invalid record")
+    if check == CHECK_LENGTH:
+        return "specified length = %s, actual length = %s" % (expected, actual)
+    if check == CHECK_ADDRESS:
+        return "limit 0x%X, got 0x%X" % (expected, actual)
+    if check == CHECK_CRC:
+        return "expected 0x%02X, got 0x%02X" % (expected, actual)
+    return "expected %s, got %s" % (expected, actual)
+
+
+def format_check_results(results, max_failures=None):
+    """ Render 'SrecCheckResults' - one line per failure (all, or the first 'max_failures'). Returns: list of str """
+    lines = []
+    for record_index, check, expected, actual in results:
+        if max_failures is not None and len(lines) == max_failures:
+            lines.append("... %s more failure(s)" % (len(results) - max_failures))
+            break
+        lines.append("FAIL! record %s: CHECK_SREC_%s (%s)" % (record_index, check.upper(),
+                                                             _format_check_values(check, expected, actual)))
+    return lines
+
+
+def print_check_results(results, max_failures=None):
+    for line in format_check_results(results, max_failures):
+        print(line)
+
 
 class VerifySrecord:
     """
@@ -149,6 +283,127 @@ class VerifySrecord:
                     break
         return res
 
+    def verify_silent(self, srecs, results=None, first_index=0, exit_on_first_error=False):
+        """
+        Fast path of 'verify()' for many records - failures are only collected (no printing).
+        Same checks as 'validate_srec_lines()'. Use 'print_check_results()' to report.
+        :param srecs: iterable of S-Record strings ('\r'/'\n' stripped)
+        :param results: 'SrecCheckResults' to add failures to (None = new)
+        :param first_index: record index of first record in 'srecs'
+        :param exit_on_first_error: only the first failed check of a record is collected
+        :return: 'SrecCheckResults'
+        """
+        if results is None:
+            results = SrecCheckResults()
+        add = results.add
+        addr_range = (self.addr_min, self.addr_max)
+        for record_index, srec in enumerate(srecs, first_index):
+            failures = _check_srec(srec, self.srec_type, addr_range)
+            if failures:
+                for check, expected, actual in failures[:1] if exit_on_first_error else failures:
+                    add(record_index, check, expected, actual)
+        return results
+
+
+def validate_srec_lines(lines, addr_range, srec_type="S2", first_line_no=1):
+    """
+    Check every record in 'lines' (str, line endings allowed) - see '_check_srec()'. Empty lines are skipped.
+    Returns: (no. of data records, list of errors) - an error is (line_no, check id, expected, actual)
+    """
+    errors = []
+    num_data_records = 0
+    for line_no, srec in enumerate(lines, first_line_no):
+        srec = srec.strip()
+        if not srec:
+            continue
+        if srec[0:2] in data_record_types:
+            num_data_records += 1
+        for check, expected, actual in _check_srec(srec, srec_type, addr_range):
+            errors.append((line_no, check, expected, actual))
+    return num_data_records, errors
+
+
+def _validate_srec_chunk(args):
+    """
+    Worker-process job: (filename, start, end, addr_range, srec_type) - bytes 'start' to 'end' of file, on line boundaries.
+    Each worker reads its own part of the file (no lines passed between processes).
+    Returns: (no. of lines, no. of data records, errors, last records) - line numbers are relative to chunk
+    """
+    filename, start, end, addr_range, srec_type = args
+    with open(filename, 'rb') as fp:
+        fp.seek(start)
+        lines = fp.read(end - start).decode('ascii', 'replace').splitlines()
+    num_data_records, errors = validate_srec_lines(lines, addr_range, srec_type)
+    last_records = [(line_no, srec.strip()) for line_no, srec in enumerate(lines, 1) if srec.strip()][-3:]
+    return len(lines), num_data_records, errors, last_records
+
+
+def _get_line_chunks(filename, chunk_size=SREC_VALIDATE_CHUNK_SIZE):
+    """ Split file in byte ranges of approx. 'chunk_size' - each range ends at a line boundary. """
+    file_size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as fp:
+        while bounds[-1] < file_size:
+            fp.seek(min(bounds[-1] + chunk_size, file_size))
+            fp.readline()
+            bounds.append(min(fp.tell(), file_size))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def validate_srec_file(filename, addr_range, srec_type="S2", workers=None):
+    """
+    Validate all records of SREC file - then record count (S5/S6, if any) and termination record.
+    Large files are split in chunks, validated by a pool of 'workers' processes (None = one per CPU).
+    Jobs are byte ranges only - each worker reads its own part of the file.
+    Validated in-process if only one worker (e.g. single-CPU machine), or file is small.
+    Returns: (no. of data records, list of errors sorted by line no.) - see 'validate_srec_lines()'
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    jobs = [(filename, start, end, addr_range, srec_type) for start, end in _get_line_chunks(filename)]
+    if os.path.getsize(filename) < SREC_VALIDATE_POOL_MIN_SIZE or workers <= 1 or len(jobs) <= 1:
+        results = list(map(_validate_srec_chunk, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_validate_srec_chunk, jobs))
+    num_lines = 0
+    num_data_records = 0
+    errors = []
+    trailer = []
+    for chunk_lines, chunk_records, chunk_errors, last_records in results:
+        num_data_records += chunk_records
+        errors.extend((line_no + num_lines, check, expected, actual) for line_no, check, expected, actual in chunk_errors)
+        if last_records:
+            trailer = [(line_no + num_lines, srec) for line_no, srec in last_records]
+        num_lines += chunk_lines
+    # File-level checks - on the (few) non-data records at end of file:
+    trailer = [(line_no, srec) for line_no, srec in trailer if srec[0:2] in ("S5", "S6") + tuple(termination_record_types)]
+    bad_lines = {line_no for line_no, check, _, _ in errors if check in (CHECK_FORMAT, CHECK_LENGTH)}
+    for line_no, srec in trailer:
+        if srec[0:2] in ("S5", "S6") and line_no not in bad_lines:
+            count = int(srec[4:-2], 16)
+            if count != num_data_records:
+                errors.append((line_no, CHECK_COUNT, num_data_records, count))
+    if not any(srec[0:2] in termination_record_types for _, srec in trailer):
+        errors.append((num_lines, CHECK_TERMINATION, "/".join(termination_record_types), "none"))
+    return num_data_records, sorted(errors, key=lambda error: error[0])
+
+
+def format_validation_report(filename, num_data_records, errors, max_errors=10):
+    """ Compact report: one summary line (errors per check), then the first 'max_errors' errors. """
+    if not errors:
+        return f"{os.path.basename(filename)}: {num_data_records} data records - OK"
+    per_check = {}
+    for _, check, _, _ in errors:
+        per_check[check] = per_check.get(check, 0) + 1
+    report = [f"{os.path.basename(filename)}: {num_data_records} data records - {len(errors)} error(s) (" +
+              ", ".join(f"{check}: {count}" for check, count in per_check.items()) + ")"]
+    for line_no, check, expected, actual in errors[:max_errors]:
+        report.append(f"  line {line_no}: {check} - {_format_check_values(check, expected, actual)}")
+    if len(errors) > max_errors:
+        report.append(f"  ... {len(errors) - max_errors} more")
+    return "\n".join(report)
+
 
 # ************** TEST *********************
 if __name__ == "__main__":
@@ -209,3 +464,55 @@ if __name__ == "__main__":
     print(UUT.verify(SREC3_FAIL_ADDR_HI))
 
 
+    #
+    # Silent fast path - same checks for all test records, reported afterwards:
+    import time
+    test_srecs = [SREC3_OK_EXAMPLE, SREC3_FAIL_CRC, SREC3_FAIL_FORMAT1, SREC3_FAIL_FORMAT2, SREC3_FAIL_LENGTH,
+                  SREC3_FAIL_ADDR_LO, SREC3_FAIL_ADDR_HI]
+    print("Running S3 SRecord checks (silent) ...")
+    print("======================================")
+    check_results = UUT.verify_silent(test_srecs)
+    print_check_results(check_results)
+    failed = check_results.failed_records()
+    assert ["NAK" if idx in failed else "OK" for idx in range(len(test_srecs))] == \
+        [UUT.verify(srec) for srec in test_srecs]
+    # Many records, 10% corrupt - no console output in the loop:
+    bulk_srecs = [SREC3_OK_EXAMPLE if idx % 10 else SREC3_FAIL_CRC for idx in range(20000)]
+    t_start = time.perf_counter()
+    check_results = UUT.verify_silent(bulk_srecs)
+    t_silent = time.perf_counter() - t_start
+    print("Silent: %s records, %s failure(s) in %.1f ms" % (len(bulk_srecs), len(check_results), t_silent * 1000))
+    #
+    # File-level validation (run as 'python -m srec_utils.verify_srec'):
+    import tempfile
+    fw1_srec = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FW1.srec")
+    print("Validating SREC files ...")
+    print("=========================")
+    t_start = time.perf_counter()
+    num_records, srec_errors = validate_srec_file(fw1_srec, valid_addr_range, "S2")
+    t_elapsed = time.perf_counter() - t_start
+    print(format_validation_report(fw1_srec, num_records, srec_errors) + " (%.1f ms)" % (t_elapsed * 1000))
+    # Corrupted copy - checksum, address and length errors, termination record removed:
+    with open(fw1_srec, 'r') as fp:
+        fw1_lines = fp.read().splitlines()
+    fw1_lines[10] = fw1_lines[10][:-2] + "00"
+    fw1_lines[20] = SREC2_FAIL_ADDR_HI
+    fw1_lines[30] = SREC2_FAIL_LENGTH
+    bad_srec = os.path.join(tempfile.mkdtemp(), "FW1_corrupt.srec")
+    with open(bad_srec, 'w') as fp:
+        fp.write("\n".join(fw1_lines[:-1]) + "\n")
+    print(format_validation_report(bad_srec, *validate_srec_file(bad_srec, valid_addr_range, "S2")))
+    # Large file - split across worker processes:
+    with open(fw1_srec, 'r') as fp:
+        fw1_lines = fp.read().splitlines()
+    big_srec = os.path.join(os.path.dirname(bad_srec), "FW1_x50.srec")
+    with open(big_srec, 'w') as fp:
+        fp.write("\n".join(fw1_lines[:1] + fw1_lines[1:-1] * 50 + fw1_lines[-1:]) + "\n")
+    for num_workers in (1, None):
+        t_start = time.perf_counter()
+        num_records, srec_errors = validate_srec_file(big_srec, valid_addr_range, "S2", workers=num_workers)
+        t_elapsed = time.perf_counter() - t_start
+        print("%s records, %s error(s), workers=%s: %.1f ms" % (num_records, len(srec_errors), num_workers,
+                                                             t_elapsed * 1000))
+    os.remove(bad_srec)
+    os.remove(big_srec)